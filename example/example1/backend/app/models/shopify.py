@@ -21,8 +21,8 @@ def set_extra(self, data: dict) -> None:
 Store.get_extra = lambda self: loads(self.extra) if self.extra else {}
 Store.set_extra = set_extra
 """
+from flask_shopify_utils import serializer
 from flask_shopify_utils.model import BasicMethod, current_time
-from simplejson import loads, dumps
 # custom models
 from app import db
 
@@ -72,12 +72,12 @@ class DiscountCode(db.Model, BasicMethod):
         return 0 if val == 'fixed' else 1
 
     def get_extra(self) -> dict:
-        return {} if self.extra is None else loads(self.extra)
+        return {} if self.extra is None else serializer.loads(self.extra)
 
     def set_extra(self, data: dict) -> dict:
         extra_data = self.get_extra()
         extra_data.update(data)
-        self.extra = dumps(extra_data)
+        self.extra = serializer.dumps(extra_data)
         return extra_data
 
     def to_dict(self) -> dict:
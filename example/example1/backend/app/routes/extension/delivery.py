@@ -12,13 +12,15 @@ from app import app_utils
 from app.utils.delivery_customization import DeliveryCustomizationHelper
 
 delivery_bp = Blueprint('delivery_custom', __name__, url_prefix='/admin/delivery-customization')
+# compile the schema once
+app_utils.register_schema('delivery_customization', DeliveryCustomizationHelper.get_schema())
 
 
 @delivery_bp.route('/create', methods=['POST'], endpoint='delivery_custom_create')
 @app_utils.check_session_jwt
 def delivery_custom_create():
     data = request.get_json(silent=True)
-    rs, resp = app_utils.form_validate(data, DeliveryCustomizationHelper.get_schema(), True)
+    rs, resp = app_utils.form_validate(data, 'delivery_customization', True)
     if not rs:
         return resp
     obj = DeliveryCustomizationHelper(g.store_id)
@@ -39,7 +41,7 @@ def delivery_custom_edit(record_id):
         return app_utils.admin_response(data=data)
     elif request.method == 'POST':
         data = request.get_json(silent=True)
-        rs, resp = app_utils.form_validate(data, DeliveryCustomizationHelper.get_schema(), False)
+        rs, resp = app_utils.form_validate(data, 'delivery_customization', False)
         if not rs:
             return resp
         rs, msg, data = obj.update(record_id, data)
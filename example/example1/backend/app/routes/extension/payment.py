@@ -12,13 +12,15 @@ from app import app_utils
 from app.utils.payment_customization import PaymentCustomizationHelper
 
 payment_bp = Blueprint('payment_custom', __name__, url_prefix='/admin/payment-customization')
+# compile the schema once
+app_utils.register_schema('payment_customization', PaymentCustomizationHelper.get_schema())
 
 
 @payment_bp.route('/create', methods=['POST'], endpoint='payment_custom_create')
 @app_utils.check_session_jwt
 def payment_custom_create():
     data = request.get_json(silent=True)
-    rs, res = app_utils.form_validate(data, PaymentCustomizationHelper.get_schema(), True)
+    rs, res = app_utils.form_validate(data, 'payment_customization', True)
     if not rs:
         return res
     obj = PaymentCustomizationHelper(g.store_id)
@@ -39,7 +41,7 @@ def payment_custom_edit(record_id):
         return app_utils.admin_response(data=data)
     elif request.method == 'POST':
         data = request.get_json(silent=True)
-        rs, res = app_utils.form_validate(data, PaymentCustomizationHelper.get_schema(), False)
+        rs, res = app_utils.form_validate(data, 'payment_customization', False)
         if not rs:
             return res
         rs, msg, data = obj.update(record_id, data)
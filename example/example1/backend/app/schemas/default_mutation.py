@@ -8,6 +8,7 @@
 """
 from uuid import uuid4
 from sgqlc.operation import Operation
+from flask_shopify_utils.operation import PreparedOperation, prepared_operation
 from app.schemas.shopify import shopify as shopify_schema, MetafieldsSetInput, \
     DiscountCodeAppInput, DiscountAutomaticAppInput, \
     WebhookSubscriptionInput, DeliveryCustomizationInput, PaymentCustomizationInput
@@ -50,20 +51,17 @@ def _inject_directive(query: str, field: str, idempotency_key: str = None, alias
     raise ValueError('Unbalanced parentheses in rendered "{}" field'.format(field))
 
 
-def update_meta(owner_id: str, value, namespace: str, key: str, value_type: str = 'json') -> Operation:
-    op = Operation(shopify_schema.mutation_type, 'UpdateCodeMeta')
-    mutation = op.metafields_set(metafields=[MetafieldsSetInput(
+def update_meta(owner_id: str, value, namespace: str, key: str, value_type: str = 'json') -> PreparedOperation:
+    return update_multiple_meta([MetafieldsSetInput(
         owner_id=owner_id,
         namespace=namespace,
         key=key,
         type=value_type,
         value=value
     )])
-    mutation.user_errors()
-    mutation.metafields.id()
-    return op
 
 
+@prepared_operation('data')
 def update_multiple_meta(data: list[MetafieldsSetInput]) -> Operation:
     op = Operation(shopify_schema.mutation_type, 'UpdateMultipleMeta')
     mutation = op.metafields_set(metafields=data)
@@ -72,6 +70,7 @@ def update_multiple_meta(data: list[MetafieldsSetInput]) -> Operation:
     return op
 
 
+@prepared_operation('data')
 def create_discount_code(data: DiscountCodeAppInput) -> Operation:
     op = Operation(shopify_schema.mutation_type, 'CreateDiscountCode')
     mutation = op.discount_code_app_create(code_app_discount=data)
@@ -80,6 +79,7 @@ def create_discount_code(data: DiscountCodeAppInput) -> Operation:
     return op
 
 
+@prepared_operation('owner_id', 'data')
 def update_discount_code(owner_id: str, data: DiscountCodeAppInput) -> Operation:
     op = Operation(shopify_schema.mutation_type, 'UpdateCode')
     mutation = op.discount_code_app_update(
@@ -90,13 +90,19 @@ def update_discount_code(owner_id: str, data: DiscountCodeAppInput) -> Operation
     return op
 
 
-def delete_discount_code(code_id: str) -> Operation:
+def delete_discount_code(code_id: str) -> PreparedOperation:
+    return _delete_discount_code('gid://shopify/DiscountCodeNode/{}'.format(code_id))
+
+
+@prepared_operation('gid')
+def _delete_discount_code(gid: str) -> Operation:
     op = Operation(shopify_schema.mutation_type, 'DeleteDiscountCode')
-    mutation = op.discount_code_delete(id='gid://shopify/DiscountCodeNode/{}'.format(code_id))
+    mutation = op.discount_code_delete(id=gid)
     mutation.user_errors()
     return op
 
 
+@prepared_operation('data')
 def create_auto_discount(data: DiscountAutomaticAppInput) -> Operation:
     op = Operation(shopify_schema.mutation_type, 'CreateAutoDiscount')
     mutation = op.discount_automatic_app_create(automatic_app_discount=data)
@@ -105,6 +111,7 @@ def create_auto_discount(data: DiscountAutomaticAppInput) -> Operation:
     return op
 
 
+@prepared_operation('owner_id', 'data')
 def update_auto_discount(owner_id: str, data: DiscountAutomaticAppInput) -> Operation:
     op = Operation(shopify_schema.mutation_type, 'UpdateAutoDiscount')
     mutation = op.discount_automatic_app_update(
@@ -115,9 +122,14 @@ def update_auto_discount(owner_id: str, data: DiscountAutomaticAppInput) -> Oper
     return op
 
 
-def delete_auto_discount(code_id: str) -> Operation:
+def delete_auto_discount(code_id: str) -> PreparedOperation:
+    return _delete_auto_discount('gid://shopify/DiscountAutomaticNode/{}'.format(code_id))
+
+
+@prepared_operation('gid')
+def _delete_auto_discount(gid: str) -> Operation:
     op = Operation(shopify_schema.mutation_type, 'DeleteAutoDiscount')
-    mutation = op.discount_automatic_delete(id='gid://shopify/DiscountAutomaticNode/{}'.format(code_id))
+    mutation = op.discount_automatic_delete(id=gid)
     mutation.user_errors()
     return op
 
@@ -138,6 +150,7 @@ def create_webhooks(data: dict[str, WebhookSubscriptionInput]) -> Operation:
     return op
 
 
+@prepared_operation('input_data')
 def create_delivery_customization(input_data: DeliveryCustomizationInput) -> Operation:
     op = Operation(shopify_schema.mutation_type, 'CreateDeliveryCustomization')
     mutation = op.delivery_customization_create(
@@ -148,6 +161,7 @@ def create_delivery_customization(input_data: DeliveryCustomizationInput) -> Ope
     return op
 
 
+@prepared_operation('gid', 'input_data')
 def update_delivery_customization(gid: str, input_data: DeliveryCustomizationInput) -> Operation:
     op = Operation(shopify_schema.mutation_type, 'UpdateDeliveryCustomization')
     mutation = op.delivery_customization_update(
@@ -158,6 +172,7 @@ def update_delivery_customization(gid: str, input_data: DeliveryCustomizationInp
     return op
 
 
+@prepared_operation('gid')
 def delete_delivery_customization(gid: str) -> Operation:
     op = Operation(shopify_schema.mutation_type, 'DeleteDeliveryCustomization')
     mutation = op.delivery_customization_delete(id=gid)
@@ -165,6 +180,7 @@ def delete_delivery_customization(gid: str) -> Operation:
     return op
 
 
+@prepared_operation('input_data')
 def create_payment_customization(input_data: PaymentCustomizationInput) -> Operation:
     op = Operation(shopify_schema.mutation_type, 'CreatePaymentCustomization')
     mutation = op.payment_customization_create(
@@ -175,6 +191,7 @@ def create_payment_customization(input_data: PaymentCustomizationInput) -> Opera
     return op
 
 
+@prepared_operation('gid', 'input_data')
 def update_payment_customization(gid: str, input_data: PaymentCustomizationInput) -> Operation:
     op = Operation(shopify_schema.mutation_type, 'UpdatePaymentCustomization')
     mutation = op.payment_customization_update(
@@ -185,6 +202,7 @@ def update_payment_customization(gid: str, input_data: PaymentCustomizationInput
     return op
 
 
+@prepared_operation('gid')
 def delete_payment_customization(gid: str) -> Operation:
     op = Operation(shopify_schema.mutation_type, 'DeletePaymentCustomization')
     mutation = op.payment_customization_delete(id=gid)
@@ -9,6 +9,7 @@
 from sgqlc.operation import Operation
 from typing import TypedDict
 from typing_extensions import NotRequired
+from flask_shopify_utils.operation import prepared_operation
 from .shopify import shopify as shopify_schema
 
 
@@ -29,9 +30,10 @@ def format_meta_list(query, meta_list: list[QueryMeta] = None) -> None:
         v.value() if is_json is None or not is_json else v.json_value()
 
 
-def query_webhooks(cursor: str = None) -> Operation:
+@prepared_operation('cursor', 'first')
+def query_webhooks(cursor: str = None, first: int = 20) -> Operation:
     op = Operation(shopify_schema.query_type, 'QueryWebhooks')
-    query = op.webhook_subscriptions(first=20, after=cursor)
+    query = op.webhook_subscriptions(first=first, after=cursor)
     query.page_info.has_next_page()
     query.page_info.end_cursor()
     query.nodes.id()
@@ -40,6 +42,7 @@ def query_webhooks(cursor: str = None) -> Operation:
     return op
 
 
+@prepared_operation('gid', 'namespace', 'key')
 def query_delivery_customization(gid: str, namespace: str, key: str) -> Operation:
     op = Operation(shopify_schema.query_type, 'QueryDeliveryCustomization')
     query = op.delivery_customization(id=gid)
@@ -49,6 +52,7 @@ def query_delivery_customization(gid: str, namespace: str, key: str) -> Operatio
     return op
 
 
+@prepared_operation('gid', 'namespace', 'key')
 def query_payment_customization(gid: str, namespace: str, key: str) -> Operation:
     op = Operation(shopify_schema.query_type, 'QueryPaymentCustomization')
     query = op.payment_customization(id=gid)
@@ -37,16 +37,8 @@ def check_store_id(func):
 def webhook_list(helper):
     """ List all registered webhooks """
     table = PrettyTable(field_names=['WebhookID', 'Topic', 'CallbackUrl'])
-    cursor = None
-    while True:
-        op = default_query.query_webhooks(cursor)
-        res = helper.gql.fetch_data(op)['webhookSubscriptions']
-        for node in res['nodes']:
-            table.add_row([node['id'], node['topic'], node['callbackUrl']])
-        if res['pageInfo']['hasNextPage']:
-            cursor = res['edges'][-1]['cursor']
-        else:
-            break
+    for node in helper.gql.iter_connection(default_query.query_webhooks, 'webhookSubscriptions'):
+        table.add_row([node['id'], node['topic'], node['callbackUrl']])
     print('Store: {}'.format(helper.store.key))
     print(table)
 
@@ -58,17 +50,9 @@ def webhook_revoke(helper):
     """ Revoke registered webhooks """
     table = PrettyTable(field_names=['WebhookID', 'Topic', 'Revoke', 'Message'])
     webhooks = {}
-    cursor = None
-    while True:
-        op = default_query.query_webhooks(cursor)
-        res = helper.gql.fetch_data(op)['webhookSubscriptions']
-        for node in res['nodes']:
-            alias = 'ID{}'.format(node['id'].split('/')[-1])
-            webhooks[alias] = dict(id=node['id'], topic=node['topic'])
-        if res['pageInfo']['hasNextPage']:
-            cursor = res['edges'][-1]['cursor']
-        else:
-            break
+    for node in helper.gql.iter_connection(default_query.query_webhooks, 'webhookSubscriptions'):
+        alias = 'ID{}'.format(node['id'].split('/')[-1])
+        webhooks[alias] = dict(id=node['id'], topic=node['topic'])
     if len(webhooks.keys()) == 0:
         return print(f'StoreID[{helper.store.id}] does not registered any webhooks')
 
@@ -95,7 +79,7 @@ def webhook_register(helper):
     topics = dict()
     common = dict(_scheme='https', _external=True)
     topics['APP_UNINSTALLED'] = dict(
-        uri=url_for('shopify_gdpr.shop_redact', **common),
+        uri=url_for('shopify_gdpr.app_uninstalled', **common),
     )
     table = PrettyTable(field_names=['Topic', 'CallbackUrl', 'Message'])
 
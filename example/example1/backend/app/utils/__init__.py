@@ -115,23 +115,47 @@ class BasicHelper:
         res = self.restful('customers', 'GET')
         ```
         """
-        # Using requests
-        from requests import Session
-        from flask_shopify_utils.utils import initial_restful_adapter, get_version
+        # requests, or the shared HTTP/2 connections with SHOPIFY_RESTFUL_TRANSPORT=http2
+        from flask_shopify_utils.utils import create_restful_session, get_version
         if not self._restful:
-            self._restful = Session()
-            self._restful.headers.update({'X-Shopify-Access-Token': self.store.token})
-            self._restful.mount('https://', initial_restful_adapter())
+            self._restful = create_restful_session(self.store.token)
 
         # build the full URL
         url = f'https://{self.store.key}/admin/api/{get_version()}/{url_path}.json'
         # this might have some issue
         return self._restful.request(method.upper(), url, params=params, json=json_data)
 
+    def send_together(self, *ops) -> list:
+        """
+        Send the mutations as aliased fields of one request, in order
+
+        ```python
+        update, metas = self.send_together(update_delivery_customization(gid, data), update_multiple_meta(metas))
+        errors = update.user_errors + metas.user_errors
+        ```
+        """
+        with self.gql.batch(max_size=len(ops)) as batcher:
+            futures = [batcher.submit(op) for op in ops]
+        return [future.result() for future in futures]
+
     def update_meta(self, owner_id: str, value, namespace: str, key: str, value_type: str = 'json') \
             -> Tuple[bool, Union[str, dict, None]]:
         op = update_meta(owner_id, value, namespace, key, value_type)
-        res = self.gql.fetch_data(op)['metafieldsSet']
+        return self._meta_result(self.gql.fetch_data(op)['metafieldsSet'])
+
+    def batch_update_meta(self, metas: list) -> list:
+        """
+        `update_meta` of many owners, the mutations are sent in batches of 25
+
+        ```python
+        rs = self.batch_update_meta([dict(owner_id=gid, value=value, namespace='$app', key='config') for ...])
+        ```
+        """
+        with self.gql.batch() as batcher:
+            futures = [batcher.submit(update_meta(**meta)) for meta in metas]
+        return [self._meta_result(future.result()['metafieldsSet']) for future in futures]
+
+    def _meta_result(self, res: dict) -> Tuple[bool, Union[str, dict, None]]:
         if len(res['userErrors']) > 0:
             msg = 'UpdateMeta Error: {}'.format(dumps(res['userErrors']))
             self.logger.warning('UpdateMetaError: %s', msg)
@@ -389,17 +413,16 @@ class DiscountHelper(ABC, BasicHelper):
     def _update_code(self, record: DiscountCode, data: dict) -> Tuple[bool, Optional[str], Union[dict, list, None]]:
         owner_id = 'gid://shopify/DiscountCodeNode/{}'.format(record.code_id)
         input_data = self.format_discount_code_input_data(record)
-        op = update_discount_code(owner_id, input_data)
-        res = self.gql.fetch_data(op)['discountCodeAppUpdate']
-        if len(res['userErrors']) > 0:
-            msg = dumps(res['userErrors'])
+        # the code and the metas in one request
+        res, metas = self.send_together(
+            update_discount_code(owner_id, input_data),
+            update_multiple_meta(self.format_meta_data(data, owner_id)),
+        )
+        errors = res.user_errors + metas.user_errors
+        if len(errors) > 0:
+            msg = dumps(errors)
             self.logger.error('CodeUpdateError: %s', msg)
-            return False, 'Update discount code failed!', res['userErrors']
-
-        # meta update
-        rs, msg, err = self.update_metas(data, owner_id)
-        if not rs:
-            return False, msg, err
+            return False, 'Update discount code failed!', errors
         db.session.commit()
         return True, None, self.record_to_dict(record)
 
@@ -433,17 +456,15 @@ class DiscountHelper(ABC, BasicHelper):
             -> Tuple[bool, Optional[str], Union[dict, list, None]]:
         owner_id = 'gid://shopify/DiscountAutomaticNode/{}'.format(record.code_id)
         input_data = self.format_auto_discount_code_input_data(record)
-        op = update_auto_discount(owner_id, input_data)
-        res = self.gql.fetch_data(op)['discountAutomaticAppUpdate']
-        if len(res['userErrors']) > 0:
-            msg = dumps(res['userErrors'])
+        res, metas = self.send_together(
+            update_auto_discount(owner_id, input_data),
+            update_multiple_meta(self.format_meta_data(data, owner_id)),
+        )
+        errors = res.user_errors + metas.user_errors
+        if len(errors) > 0:
+            msg = dumps(errors)
             self.logger.error('AutomaticCodeUpdateError: %s', msg)
-            return False, 'Update automatic discount code failed!', res['userErrors']
-
-        # meta update
-        rs, msg, err = self.update_metas(data, owner_id)
-        if not rs:
-            return False, msg, err
+            return False, 'Update automatic discount code failed!', errors
         db.session.commit()
         return True, None, self.record_to_dict(record)
 
@@ -569,24 +590,20 @@ class CustomizationHelper(ABC, BasicHelper):
 
     def delivery_update(self, record_id: int, data: dict) -> Tuple[bool, Optional[str], Union[dict, str, None]]:
         gid = f'gid://shopify/DeliveryCustomization/{record_id}'
-        op = update_delivery_customization(gid, DeliveryCustomizationInput(
-            enabled=data['enabled'],
-            title=data['title'],
-        ))
-        res = self.gql.fetch_data(op)['deliveryCustomizationUpdate']
-        if len(res['userErrors']) > 0:
-            msg = dumps(res['userErrors'])
+        # the customization and the metas in one request
+        res, metas = self.send_together(
+            update_delivery_customization(gid, DeliveryCustomizationInput(
+                enabled=data['enabled'],
+                title=data['title'],
+            )),
+            update_multiple_meta(self.format_metas(data, gid)),
+        )
+        errors = res.user_errors + metas.user_errors
+        if len(errors) > 0:
+            msg = dumps(errors)
             self.logger.error('UpdateDeliveryCustomizationError: %s', msg)
-            return False, msg, res['userErrors']
+            return False, msg, errors
         self.logger.info('UpdateDeliveryCustomizationSuccess: %s', dumps(res))
-        # Update Meta
-        metas = self.format_metas(data, gid)
-        op = update_multiple_meta(metas)
-        res = self.gql.fetch_data(op)['metafieldsSet']
-        if len(res['userErrors']) > 0:
-            msg = dumps(res['userErrors'])
-            self.logger.error('UpdateDeliveryCustomizationMetaError: %s', msg)
-            return False, msg, res['userErrors']
         return True, None, dict(
             id=record_id,
             enabled=data['enabled'],
@@ -641,24 +658,19 @@ class CustomizationHelper(ABC, BasicHelper):
 
     def payment_update(self, record_id: int, data: dict) -> Tuple[bool, Optional[str], Union[dict, list, None]]:
         gid = f'gid://shopify/PaymentCustomization/{record_id}'
-        op = update_payment_customization(gid, PaymentCustomizationInput(
-            enabled=data['enabled'],
-            title=data['title'],
-        ))
-        res = self.gql.fetch_data(op)['paymentCustomizationUpdate']
-        if len(res['userErrors']) > 0:
-            msg = dumps(res['userErrors'])
+        res, metas = self.send_together(
+            update_payment_customization(gid, PaymentCustomizationInput(
+                enabled=data['enabled'],
+                title=data['title'],
+            )),
+            update_multiple_meta(self.format_metas(data, gid)),
+        )
+        errors = res.user_errors + metas.user_errors
+        if len(errors) > 0:
+            msg = dumps(errors)
             self.logger.error('UpdatePaymentCustomizationError: %s', msg)
-            return False, msg, res['userErrors']
+            return False, msg, errors
         self.logger.info('UpdatePaymentCustomizationSuccess: %s', dumps(res))
-        # Update meta
-        metas = self.format_metas(data, gid)
-        op = update_multiple_meta(metas)
-        res = self.gql.fetch_data(op)['metafieldsSet']
-        if len(res['userErrors']) > 0:
-            msg = dumps(res['userErrors'])
-            self.logger.error('UpdateMetaError: %s', msg)
-            return False, msg, res['userErrors']
         return True, None, dict(
             id=record_id,
             enabled=data['enabled'],
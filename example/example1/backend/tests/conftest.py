@@ -7,11 +7,13 @@
 # @Date    : 20/12/23 2:15 pm
 """
 from os import getenv
+from json import dumps
 from sys import path as sys_path
 from pathlib import Path
 from pytest import fixture
 from warnings import warn
 from unittest import TestCase
+from flask_shopify_utils.operation import PreparedOperation
 
 # reset the system path
 sys_path.append(str(Path(__file__).resolve().parents[1]))
@@ -74,6 +76,8 @@ def assert_gql():
         else:
             path = SNAPSHOT_DIR / '{}.graphql'.format(name)
         actual = str(op).strip() + '\n'
+        if isinstance(op, PreparedOperation):
+            actual += '# variables: {}\n'.format(dumps(op.variables, sort_keys=True))
 
         if getenv('UPDATE_SNAPSHOTS') == '1':
             path.write_text(actual, encoding='utf-8', newline='\n')
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : test_customization.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 23:55:00
+"""
+from re import findall
+
+
+def test_delivery_update(test_instance, monkeypatch) -> None:
+    """ The customization and its metafields are updated in one request """
+    client, test = test_instance
+    from app.utils.delivery_customization import DeliveryCustomizationHelper
+
+    helper = DeliveryCustomizationHelper()
+    requests = []
+
+    def fetch_data(op, **kwargs):
+        requests.append(op)
+        aliases = findall(r'(m\d+): (\w+)', str(op))
+        test.assertEqual(['deliveryCustomizationUpdate', 'metafieldsSet'], [field for _, field in aliases])
+        user_errors = [dict(field=['value'], message='invalid')] if fail else []
+        return {aliases[0][0]: dict(userErrors=[]), aliases[1][0]: dict(metafields=[], userErrors=user_errors)}
+
+    monkeypatch.setattr(helper.gql, 'fetch_data', fetch_data)
+    fail = False
+    data = dict(enabled=True, title='Hide express', attr_key='express')
+    rs, msg, res = helper.update(1, data)
+    test.assertTrue(rs)
+    test.assertEqual(dict(id=1, enabled=True, title='Hide express'), res)
+    test.assertEqual(1, len(requests))
+    variables = requests[0].variables
+    test.assertEqual('gid://shopify/DeliveryCustomization/1', variables['m1_data'][0]['ownerId'])
+    # the userErrors of both mutations
+    fail = True
+    rs, msg, res = helper.update(1, data)
+    test.assertFalse(rs)
+    test.assertEqual([dict(field=['value'], message='invalid')], res)
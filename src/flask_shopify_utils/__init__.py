@@ -18,16 +18,26 @@ from requests import post as post_request
 from urllib.parse import urlencode
 from base64 import b64encode
 from contextlib import contextmanager
-from sys import platform
+from threading import Thread
+from json import dumps as json_dumps
 # Third-party Library
 from flask import Flask, request, g, jsonify, Response, current_app, Blueprint, redirect, render_template, \
-    make_response, url_for
+    make_response, url_for, has_request_context
+from flask.json.provider import DefaultJSONProvider
 from jinja2 import TemplateNotFound
+from werkzeug.exceptions import RequestEntityTooLarge
 from jwt import encode as jwt_encode, decode as jwt_decode, \
     ExpiredSignatureError, InvalidAudienceError, InvalidSignatureError, InvalidTokenError
 from cerberus.validator import Validator
+from cerberus.schema import DefinitionSchema
 from pytz import timezone
 from flask_shopify_utils.utils import get_version, GraphQLClient
+from flask_shopify_utils.cache import BaseCache, MemoryCache, FileSystemCache, create_cache
+from flask_shopify_utils.dedup import WebhookDeduplicator
+from flask_shopify_utils import serializer
+from flask_shopify_utils.pagination import CursorPagination, cursor_paginate
+from flask_shopify_utils.lock import BaseLock, create_lock
+from flask_shopify_utils.breaker import CircuitBreaker
 
 __version__ = '0.2.14'
 
@@ -36,6 +46,18 @@ sqlalchemy_instance = None
 # deprecated from 0.2.6
 JWT_DATA = TypeVar('JWT_DATA', dict, Response)
 
+# the rules applied by the Cerberus normalization
+NORMALIZATION_RULES = frozenset(['coerce', 'default', 'default_setter', 'purge_unknown', 'rename', 'rename_handler'])
+
+
+def needs_normalization(schema) -> bool:
+    """ True if a rule of the schema (or of a sub-schema) changes the document """
+    if isinstance(schema, dict):
+        return any(key in NORMALIZATION_RULES or needs_normalization(value) for key, value in schema.items())
+    if isinstance(schema, (list, tuple)):
+        return any(needs_normalization(value) for value in schema)
+    return False
+
 
 class ShopifyUtil:
     """ Shopify Utils """
@@ -46,6 +68,16 @@ class ShopifyUtil:
         self._config = config
         self._app = None
         self._db = None
+        self._store_cache = None
+        self._cache = None
+        self._jwt_cache = None
+        self._webhook_handlers = {}
+        self._webhook_dedup = None
+        self._schemas = {}
+        self._schema_cache = None
+        self._lock = None
+        self._circuit_breaker = None
+        self._json_backend = None
         if app is not None:
             self.init_app(app, config)
 
@@ -63,6 +95,33 @@ class ShopifyUtil:
     def db(self):
         return self._db.session
 
+    @property
+    def store_cache(self) -> BaseCache:
+        """ The cache of `get_store`, `cache` itself if it is shared by the workers """
+        return self._store_cache
+
+    @property
+    def lock(self) -> BaseLock:
+        """ The lock backend of `prevent_concurrency`, created on the first use """
+        if self._lock is None:
+            self._lock = create_lock(self)
+        return self._lock
+
+    @property
+    def cache(self) -> BaseCache:
+        """ The cache backend configured by `SHOPIFY_CACHE_TYPE` """
+        return self._cache
+
+    @property
+    def json_backend(self) -> Optional[serializer.JSONBackend]:
+        """ The JSON backend of the JSON columns, `SHOPIFY_JSON_BACKEND` """
+        return self._json_backend
+
+    @property
+    def circuit_breaker(self) -> Optional[CircuitBreaker]:
+        """ The per-shop circuit breaker of `GraphQLClient` and the RestfulAPI sessions, None if it is disabled """
+        return self._circuit_breaker
+
     def init_app(self, app: Flask, config: dict = None) -> None:
         """ This is used to initialize your app object """
         if not (config is None or isinstance(config, dict)):
@@ -79,6 +138,35 @@ class ShopifyUtil:
         app.config.setdefault('BYPASS_VALIDATE', 0)
         app.config.setdefault('DEBUG', False)
         app.config.setdefault('SCOPES', environ.get('SCOPES', 'read_products'))
+        app.config.setdefault('SHOPIFY_GRAPHQL_TRANSPORT', 'requests')
+        app.config.setdefault('SHOPIFY_GRAPHQL_PERSISTED_QUERIES', 'off')
+        app.config.setdefault('SHOPIFY_RESTFUL_TRANSPORT', 'requests')
+        app.config.setdefault('SHOPIFY_POOL_CONNECTIONS', 100)
+        app.config.setdefault('SHOPIFY_POOL_MAXSIZE', 10)
+        app.config.setdefault('SHOPIFY_STORE_CACHE_TIMEOUT', 60)
+        app.config.setdefault('SHOPIFY_STORE_CACHE_THRESHOLD', 1000)
+        app.config.setdefault('SHOPIFY_CACHE_TYPE', 'memory')
+        app.config.setdefault('SHOPIFY_CACHE_DEFAULT_TIMEOUT', 300)
+        app.config.setdefault('SHOPIFY_CACHE_THRESHOLD', 500)
+        app.config.setdefault('SHOPIFY_CACHE_DIR', path.join(app.config.get('TEMPORARY_PATH'), 'cache'))
+        app.config.setdefault('SHOPIFY_CACHE_REDIS_URL', 'redis://127.0.0.1:6379/0')
+        app.config.setdefault('SHOPIFY_CACHE_KEY_PREFIX', 'shopify_utils:')
+        app.config.setdefault('SHOPIFY_TOKEN_CHECK_TTL', 3600)
+        app.config.setdefault('SHOPIFY_TOKEN_CHECK_REFRESH', 0)
+        app.config.setdefault('SHOPIFY_JWT_CACHE_THRESHOLD', 1000)
+        app.config.setdefault('SHOPIFY_WEBHOOK_DEDUP_WINDOW', 86400)
+        app.config.setdefault('SHOPIFY_WEBHOOK_DEDUP_CAPACITY', 100000)
+        app.config.setdefault('SHOPIFY_WEBHOOK_STREAM_VERIFY', False)
+        app.config.setdefault('SHOPIFY_WEBHOOK_CHUNK_SIZE', 65536)
+        app.config.setdefault('SHOPIFY_WEBHOOK_MAX_LENGTH', 16 * 1024 * 1024)
+        app.config.setdefault('SHOPIFY_JSON_BACKEND', 'auto')
+        app.config.setdefault('SHOPIFY_SCHEMA_CACHE_THRESHOLD', 256)
+        app.config.setdefault('SHOPIFY_LOCK_TYPE', 'file')
+        app.config.setdefault('SHOPIFY_LOCK_DIR', app.config.get('TEMPORARY_PATH'))
+        app.config.setdefault('SHOPIFY_LOCK_TTL', 30)
+        app.config.setdefault('SHOPIFY_CIRCUIT_BREAKER_THRESHOLD', 0)
+        app.config.setdefault('SHOPIFY_CIRCUIT_BREAKER_WINDOW', 60)
+        app.config.setdefault('SHOPIFY_CIRCUIT_BREAKER_COOLDOWN', 60)
 
         if not hasattr(app, 'extensions'):
             app.extensions = {}
@@ -96,6 +184,64 @@ class ShopifyUtil:
         # Set internal variables
         self._config = app.config
         self._app = app
+        self._cache = create_cache(app.config)
+        self._store_cache = self._create_store_cache(app.config)
+        self._webhook_dedup = WebhookDeduplicator(
+            self._create_webhook_cache(app.config),
+            window=app.config.get('SHOPIFY_WEBHOOK_DEDUP_WINDOW') or 86400,
+            capacity=app.config.get('SHOPIFY_WEBHOOK_DEDUP_CAPACITY'),
+        )
+        # the circuits are kept in the cache, shared by the workers with a `redis` or `filesystem` cache
+        if app.config.get('SHOPIFY_CIRCUIT_BREAKER_THRESHOLD'):
+            self._circuit_breaker = CircuitBreaker(
+                self._cache,
+                threshold=app.config.get('SHOPIFY_CIRCUIT_BREAKER_THRESHOLD'),
+                window=app.config.get('SHOPIFY_CIRCUIT_BREAKER_WINDOW'),
+                cooldown=app.config.get('SHOPIFY_CIRCUIT_BREAKER_COOLDOWN'),
+            )
+        self._jwt_cache = MemoryCache(threshold=app.config.get('SHOPIFY_JWT_CACHE_THRESHOLD') or 1, default_timeout=0)
+        self._schema_cache = MemoryCache(
+            threshold=app.config.get('SHOPIFY_SCHEMA_CACHE_THRESHOLD') or 1, default_timeout=0,
+        )
+        # the JSON columns of the models and the responses, a custom app JSON provider is kept
+        name = app.config.get('SHOPIFY_JSON_BACKEND')
+        self._json_backend = serializer.get_json_backend(name)
+        # msgspec writes RFC 3339 datetimes, only an explicit `msgspec` changes the format of the responses
+        auto_msgspec = self._json_backend.name == 'msgspec' and name in (None, 'auto')
+        if self._json_backend.name not in ('json', 'simplejson') and not auto_msgspec \
+                and type(app.json) is DefaultJSONProvider:
+            app.json = serializer.ShopifyJSONProvider(app, self._json_backend)
+
+    def _create_store_cache(self, config) -> BaseCache:
+        """
+        The cache of the Store records, `self.cache` if the workers share it
+
+        With a `filesystem` or `redis` cache, `forget_store` drops a revoked token in all the workers. The memory
+        cache gets its own instance bounded by `SHOPIFY_STORE_CACHE_THRESHOLD`, each process keeps its copy until
+        it expires.
+        """
+        if isinstance(self._cache, MemoryCache):
+            return MemoryCache(
+                threshold=config.get('SHOPIFY_STORE_CACHE_THRESHOLD'),
+                default_timeout=config.get('SHOPIFY_STORE_CACHE_TIMEOUT'),
+            )
+        return self._cache
+
+    def _create_webhook_cache(self, config) -> BaseCache:
+        """
+        The cache of the handled webhook ids, apart from `self.cache`
+
+        The evictions of a bounded `self.cache` would forget the ids long before the window is over, the memory and
+        filesystem caches get their own instance sized for `SHOPIFY_WEBHOOK_DEDUP_CAPACITY` webhooks (2 ids each).
+        """
+        threshold = (config.get('SHOPIFY_WEBHOOK_DEDUP_CAPACITY') or 1) * 2
+        timeout = config.get('SHOPIFY_WEBHOOK_DEDUP_WINDOW') or 86400
+        if isinstance(self._cache, MemoryCache):
+            return MemoryCache(threshold=threshold, default_timeout=timeout)
+        if isinstance(self._cache, FileSystemCache):
+            return FileSystemCache(path.join(self._cache.cache_dir, 'webhooks'), threshold=threshold,
+                                   default_timeout=timeout)
+        return self._cache
 
     def current_time(self):
         return datetime.now(self.config.get('TIMEZONE'))
@@ -126,10 +272,66 @@ class ShopifyUtil:
 
     def validate_webhook(self) -> bool:
         signature = request.headers.get('X-Shopify-Hmac-Sha256', '')
-        data = request.get_data()
         secret = self.config.get('SHOPIFY_API_SECRET', 'SHOPIFY_API_SECRET')
-        value = b64encode(hmac_new(secret.encode('utf-8'), data, sha256).digest())
-        return compare_digest(signature.encode('utf-8'), value)
+        if self.config.get('SHOPIFY_WEBHOOK_STREAM_VERIFY', False):
+            digest = self.read_webhook_body(secret)
+        else:
+            digest = hmac_new(secret.encode('utf-8'), request.get_data(), sha256).digest()
+        return compare_digest(signature.encode('utf-8'), b64encode(digest))
+
+    def read_webhook_body(self, secret: str) -> bytes:
+        """
+        Read the body chunk by chunk into a single buffer and hash every chunk as it is read
+
+        A `Content-Length` over `SHOPIFY_WEBHOOK_MAX_LENGTH` is rejected with 413 before the buffer is allocated,
+        a chunked body is rejected once it grows past it. The buffer is kept as `g.webhook_body`, the request
+        stream is consumed, read it with `get_webhook_data()` or `get_webhook_json()`.
+
+        :return: HMAC-SHA256 digest of the body
+        """
+        mac = hmac_new(secret.encode('utf-8'), digestmod=sha256)
+        if 'webhook_body' in g:
+            mac.update(g.webhook_body)
+            return mac.digest()
+        limit = self.config.get('SHOPIFY_WEBHOOK_MAX_LENGTH', 16 * 1024 * 1024)
+        chunk_size = self.config.get('SHOPIFY_WEBHOOK_CHUNK_SIZE', 65536)
+        stream, length = request.stream, request.content_length
+        if length is not None and length > limit:
+            raise RequestEntityTooLarge()
+        if length is None:
+            buffer = bytearray()
+            while chunk := stream.read(chunk_size):
+                if len(buffer) + len(chunk) > limit:
+                    raise RequestEntityTooLarge()
+                mac.update(chunk)
+                buffer += chunk
+        else:
+            buffer = bytearray(length)
+            pos = 0
+            with memoryview(buffer) as view:
+                while pos < length:
+                    size = stream.readinto(view[pos:pos + chunk_size])
+                    if not size:
+                        break
+                    mac.update(view[pos:pos + size])
+                    pos += size
+            # the client disconnected
+            del buffer[pos:]
+        g.webhook_body = buffer
+        return mac.digest()
+
+    @staticmethod
+    def get_webhook_data() -> bytes:
+        """ The webhook body, the buffer read by `read_webhook_body` if the stream is verified """
+        return g.webhook_body if 'webhook_body' in g else request.get_data()
+
+    @classmethod
+    def get_webhook_json(cls) -> Optional[dict]:
+        """ Decode the JSON body from the request buffer, orjson and msgspec read it without a copy """
+        try:
+            return serializer.current_backend().loads(cls.get_webhook_data())
+        except ValueError:
+            return None
 
     # deprecated from 0.2.6
     def validate_jwt(self) -> Tuple[bool, JWT_DATA]:
@@ -294,6 +496,30 @@ class ShopifyUtil:
 
         return decorator
 
+    def is_duplicate_webhook(self) -> bool:
+        """
+        Check `X-Shopify-Webhook-Id` / `X-Shopify-Event-Id` of the current webhook, it doesn't read the body
+
+        The ids are kept in `g.webhook_dedup_keys` for `remember_webhook`.
+        """
+        g.webhook_dedup_keys = []
+        if not self.config.get('SHOPIFY_WEBHOOK_DEDUP_WINDOW') or self._webhook_dedup is None:
+            return False
+        g.webhook_dedup_keys = self._webhook_dedup.get_keys(request.headers)
+        return self._webhook_dedup.is_duplicate(g.webhook_dedup_keys)
+
+    def remember_webhook(self) -> None:
+        """ Remember the current webhook once it has been handled, so the retries are dropped """
+        if keys := g.get('webhook_dedup_keys'):
+            self._webhook_dedup.remember(keys)
+
+    def handle_webhook(self, func, args, kwargs) -> Response:
+        """ Call the view, remember the webhook if the response is successful """
+        resp = make_response(func(*args, **kwargs))
+        if resp.status_code < 400:
+            self.remember_webhook()
+        return resp
+
     def check_webhook(self, func):
         """
         :param func:
@@ -321,20 +547,246 @@ class ShopifyUtil:
             bypass, resp = self.bypass_validate(func, args, kwargs)
             if bypass:
                 return resp
+            # Shopify retries the webhook until it gets a 200
+            if self.is_duplicate_webhook():
+                return self.proxy_response(0, 'Duplicate webhook')
             if not self.validate_webhook():
                 resp = jsonify(dict(message='Hmac validation failed!', status=401))
                 resp.status_code = 401
                 return resp
             # grab `shop` from header
             g.store_key = request.headers.get('X-Shopify-Shop-Domain', None)
-            return func(*args, **kwargs)
+            return self.handle_webhook(func, args, kwargs)
 
         return decorator
 
-    def check_store_record(self, store_domain: str) -> Tuple[bool, Optional[int or Response]]:
+    def get_store(self, store_key: str) -> Optional[dict]:
+        """
+        Get the Store record by the shop domain, e.g. `test.myshopify.com`
+
+        The record is memoized on `g` for the current request, and kept in `store_cache` across
+        requests (`SHOPIFY_STORE_CACHE_TIMEOUT`, 0 to disable it).
+
+        :param store_key: shop domain
+        :return: dict(id, key, domain, scopes, token) or None, please don't modify it
+        """
         from flask_shopify_utils.model import Store
-        if store := Store.query.filter_by(key=store_domain).first():
-            return True, store.id
+        memo = g.setdefault('_shopify_stores', {})
+        if store_key in memo:
+            return memo[store_key]
+        cache_key = 'store:{}'.format(store_key)
+        timeout = self.config.get('SHOPIFY_STORE_CACHE_TIMEOUT', 0)
+        enabled = timeout and self.store_cache is not None
+        store = self.store_cache.get(cache_key) if enabled else None
+        if store is None:
+            if record := Store.query.filter_by(key=store_key).first():
+                store = dict(id=record.id, key=record.key, domain=record.domain, scopes=record.scopes,
+                             token=record.token)
+                if enabled:
+                    self.store_cache.set(cache_key, store, timeout)
+        memo[store_key] = store
+        return store
+
+    def forget_store(self, store_key: str) -> None:
+        """
+        Drop the cached Store record and token check, call it after the record is updated or deleted
+
+        The circuit of the shop is closed, e.g. the app was installed again with a new token.
+        """
+        g.get('_shopify_stores', {}).pop(store_key, None)
+        if self.store_cache is not None:
+            self.store_cache.delete('store:{}'.format(store_key))
+        if self.cache is not None:
+            self.cache.delete('token_check:{}'.format(store_key))
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.reset(store_key)
+
+    def check_store_token(self, store: dict) -> bool:
+        """
+        Check the offline access token of the store with a live GraphQL query
+
+        A valid token is cached for `SHOPIFY_TOKEN_CHECK_TTL` seconds in `self.cache`. When the cached
+        result is older than `SHOPIFY_TOKEN_CHECK_REFRESH` seconds, it is still used and the token is
+        checked again in a background thread. An invalid token (e.g. 401) drops the cached result.
+
+        :param store: the record from `get_store`
+        """
+        ttl = self.config.get('SHOPIFY_TOKEN_CHECK_TTL', 0)
+        key = 'token_check:{}'.format(store['key'])
+        digest = sha256(store['token'].encode('utf-8')).hexdigest()
+        if ttl:
+            cached = self.cache.get(key)
+            # the token is changed after the app is installed again
+            if cached is not None and cached[0] == digest:
+                refresh = self.config.get('SHOPIFY_TOKEN_CHECK_REFRESH', 0)
+                if refresh and time() - cached[1] >= refresh and self.cache.add(key + ':refresh', 1, timeout=60):
+                    Thread(target=self._refresh_store_token, args=(store, key, digest, ttl), daemon=True).start()
+                return True
+        return self._probe_store_token(store, key, digest, ttl)
+
+    def _probe_store_token(self, store: dict, key: str, digest: str, ttl: int) -> bool:
+        client = GraphQLClient(store['key'], store['token'])
+        raw_query = '{ shop { name, url } appInstallation { accessScopes { handle }} }'
+        res = client.client(raw_query)
+        # check 401
+        if isinstance(res, dict) and not res.get('errors'):
+            if ttl:
+                self.cache.set(key, (digest, time()), ttl)
+            return True
+        self.cache.delete(key)
+        return False
+
+    def _refresh_store_token(self, store: dict, key: str, digest: str, ttl: int) -> None:
+        # the thread has no app context, `GraphQLClient` reads the config and the circuit breaker from it
+        with self.app.app_context():
+            try:
+                self._probe_store_token(store, key, digest, ttl)
+            except Exception as e:
+                self.app.logger.warning('Failed to refresh the token check of %s: %s', store['key'], e)
+            finally:
+                self.cache.delete(key + ':refresh')
+
+    def ingest_webhook(self, func):
+        """
+        Verify the webhook and save it as a `wait` Webhook record, the worker processes it later
+
+        `g.webhook` is the saved record, the view should return quickly, Shopify only waits for 5 seconds.
+        Process the records with the handlers registered by `webhook_handler` and `flask webhook_worker`.
+
+        ```python
+            @webhook_bp.route('/orders', methods=['POST'])
+            @utils.ingest_webhook
+            def orders_webhook():
+                return 'success'
+        ```
+        """
+
+        @wraps(func)
+        def decorator(*args, **kwargs):
+            from flask_shopify_utils.model import Webhook
+
+            # bypass validation
+            bypass, resp = self.bypass_validate(func, args, kwargs)
+            if bypass:
+                return resp
+            if self.is_duplicate_webhook():
+                return self.proxy_response(0, 'Duplicate webhook')
+            if not self.validate_webhook():
+                resp = jsonify(dict(message='Hmac validation failed!', status=401))
+                resp.status_code = 401
+                return resp
+            g.store_key = request.headers.get('X-Shopify-Shop-Domain', None)
+            store = self.get_store(g.store_key) if g.store_key else None
+            g.store_id = store['id'] if store else None
+            target, _, action = request.headers.get('X-Shopify-Topic', '').partition('/')
+            data = self.get_webhook_data().decode('utf-8', 'replace')
+            resource_id = self.get_webhook_json()
+            resource_id = resource_id.get('id') if isinstance(resource_id, dict) else None
+            g.webhook = Webhook.create(
+                store_id=g.store_id,
+                webhook_id=resource_id if isinstance(resource_id, int) else None,
+                target=target[:24],
+                action=action[:24],
+                data=data,
+                status=Webhook.get_status('wait'),
+            )
+            self.db.commit()
+            return self.handle_webhook(func, args, kwargs)
+
+        return decorator
+
+    def webhook_handler(self, topic: str):
+        """
+        Register the handler of a webhook topic for the worker, it is called with the Webhook record and the payload
+
+        ```python
+            @utils.webhook_handler('orders/create')
+            def order_created(webhook: Webhook, data: dict):
+                ...
+        ```
+
+        Raise an exception to mark the record as `error`, return False to mark it as `ignore`.
+        """
+
+        def decorator(func):
+            self._webhook_handlers[topic] = func
+            return func
+
+        return decorator
+
+    def requeue_webhooks(self, stale: int = 600) -> int:
+        """ Put the `processing` records back to `wait` if they are not updated for `stale` seconds """
+        from flask_shopify_utils.model import Webhook
+
+        res = self.db.execute(self._db.update(Webhook).where(
+            Webhook.status == Webhook.get_status('processing'),
+            Webhook.updated_at < self.current_time() - timedelta(seconds=stale),
+        ).values(status=Webhook.get_status('wait')))
+        self.db.commit()
+        return res.rowcount
+
+    def claim_webhooks(self, batch_size: int = 20) -> list:
+        """
+        Claim the `wait` records and mark them as `processing`
+
+        The workers never claim the same record: it uses `SELECT ... FOR UPDATE SKIP LOCKED` on PostgreSQL and
+        MySQL/MariaDB, and a conditional update per record on the other databases (e.g. SQLite).
+        """
+        from flask_shopify_utils.model import Webhook
+
+        wait, processing = Webhook.get_status('wait'), Webhook.get_status('processing')
+        select = self._db.select(Webhook).filter_by(status=wait).order_by(Webhook.id).limit(batch_size)
+        if self.db.get_bind().dialect.name in ['postgresql', 'mysql', 'mariadb']:
+            records = self.db.execute(select.with_for_update(skip_locked=True)).scalars().all()
+            for record in records:
+                record.status = processing
+            self.db.commit()
+            return records
+        ids = self.db.execute(select.with_only_columns(Webhook.id)).scalars().all()
+        claimed = []
+        for record_id in ids:
+            res = self.db.execute(self._db.update(Webhook).where(
+                Webhook.id == record_id,
+                Webhook.status == wait,
+            ).values(status=processing, updated_at=self.current_time()))
+            if res.rowcount:
+                claimed.append(record_id)
+        self.db.commit()
+        if not claimed:
+            return []
+        return self.db.execute(self._db.select(Webhook).where(Webhook.id.in_(claimed)).order_by(Webhook.id)) \
+            .scalars().all()
+
+    def process_webhooks(self, batch_size: int = 20) -> int:
+        """
+        Claim a batch of records and dispatch them to the registered handlers
+
+        :return: the number of the claimed records
+        """
+        from flask_shopify_utils.model import Webhook
+
+        records = self.claim_webhooks(batch_size)
+        for record in records:
+            topic = '{}/{}'.format(record.target, record.action)
+            handler = self._webhook_handlers.get(topic)
+            if handler is None:
+                record.status = Webhook.get_status('ignore')
+                record.remark = 'No handler for {}'.format(topic)
+                self.db.commit()
+                continue
+            try:
+                res = handler(record, record.get_data())
+                record.status = Webhook.get_status('ignore' if res is False else 'done')
+            except Exception as e:
+                self.db.rollback()
+                record.status = Webhook.get_status('error')
+                record.remark = '{}: {}'.format(type(e).__name__, e)
+            self.db.commit()
+        return len(records)
+
+    def check_store_record(self, store_domain: str) -> Tuple[bool, Optional[int or Response]]:
+        if store := self.get_store(store_domain):
+            return True, store['id']
         resp = self.proxy_response(401, 'Store[{}] does not exists!'.format(g.store_key))
         resp.status_code = 401
         return False, resp
@@ -368,18 +820,7 @@ class ShopifyUtil:
                 return resp
             token = request.headers.get('Authorization', '')
             try:
-                decoded = jwt_decode(
-                    jwt=token[7:],
-                    key=self.config.get('SHOPIFY_API_SECRET'),
-                    algorithms=['HS256'],
-                    audience=self.config.get('SHOPIFY_API_KEY'),
-                    options=dict(
-                        require=['exp', 'iat', 'aud'],
-                        verify_exp=True,
-                        verify_iat=True,
-                        verify_aud=True,
-                    )
-                )
+                decoded = self.decode_session_jwt(token[7:])
             except ExpiredSignatureError:
                 return jsonify(dict(status=500, message='Session JWT expired!'))
             except InvalidAudienceError:
@@ -399,6 +840,39 @@ class ShopifyUtil:
 
         return decorator
 
+    def decode_session_jwt(self, token: str) -> dict:
+        """
+        Verify and decode the Shopify session token
+
+        The claims of a verified token are cached until `exp`, keyed by the digest of the token, so the
+        frontend sending the same token again skips the signature check (`SHOPIFY_JWT_CACHE_THRESHOLD`,
+        0 to disable the cache).
+
+        :param token: the token without `Bearer `
+        :return: the claims, PyJWT exceptions are raised if the token is invalid
+        """
+        enabled = self.config.get('SHOPIFY_JWT_CACHE_THRESHOLD', 0) and self._jwt_cache is not None
+        if enabled:
+            key = sha256(token.encode('utf-8')).hexdigest()
+            decoded = self._jwt_cache.get(key)
+            if decoded is not None and decoded['exp'] > time():
+                return decoded
+        decoded = jwt_decode(
+            jwt=token,
+            key=self.config.get('SHOPIFY_API_SECRET'),
+            algorithms=['HS256'],
+            audience=self.config.get('SHOPIFY_API_KEY'),
+            options=dict(
+                require=['exp', 'iat', 'aud'],
+                verify_exp=True,
+                verify_iat=True,
+                verify_aud=True,
+            )
+        )
+        if enabled:
+            self._jwt_cache.set(key, decoded, timeout=max(decoded['exp'] - time(), 0.001))
+        return decoded
+
     # deprecated from 0.2.6
     def check_jwt(self, func):
         """
@@ -465,7 +939,26 @@ class ShopifyUtil:
         data = [] if data is None else data
         return jsonify(status=status, message=message, data=data)
 
+    def cursor_paginate(self, select, column, per_page: int = None, cursor: str = None, desc: bool = True,
+                        with_total: bool = False, max_per_page: int = 100) -> CursorPagination:
+        """
+        Keyset pagination of a select, see `flask_shopify_utils.pagination.cursor_paginate`
+
+        `per_page` and `cursor` are read from the query string when they are not given.
+
+        :raise ValueError: the cursor is invalid
+        """
+        if per_page is None:
+            per_page = request.args.get('per_page', 20, type=int) if has_request_context() else 20
+        if cursor is None and has_request_context():
+            cursor = request.args.get('cursor')
+        per_page = max(1, min(per_page, max_per_page))
+        return cursor_paginate(self.db, select, column, per_page=per_page, cursor=cursor, desc=desc,
+                               with_total=with_total)
+
     def paginate_response(self, paginate, is_admin: bool = True):
+        if isinstance(paginate, CursorPagination):
+            return self.cursor_paginate_response(paginate, is_admin)
         from_num = 1 if paginate.page == 1 else (paginate.page - 1) * paginate.per_page + 1
         to_num = paginate.per_page if paginate.page == 1 else paginate.page * paginate.per_page
         data = {
@@ -482,12 +975,77 @@ class ShopifyUtil:
         func = self.admin_response if is_admin else self.proxy_response
         return func(data=data)
 
-    def form_validate(self, data: dict = None, schema: dict = None, is_admin: bool = False):
+    def cursor_paginate_response(self, paginate: CursorPagination, is_admin: bool = True):
+        """ The `paginate_response` envelope of a keyset page, the page numbers are unknown """
+
+        def page_url(cursor: Optional[str]) -> str:
+            if cursor is None:
+                return ''
+            return '{}?{}'.format(request.base_url, urlencode(dict(request.args.to_dict(), cursor=cursor)))
+
+        data = {
+            'total': paginate.total,
+            'per_page': paginate.per_page,
+            'current_page': None,
+            'last_page': None,
+            'next_page_url': page_url(paginate.next_cursor),
+            'prev_page_url': page_url(paginate.prev_cursor),
+            'from': None,
+            'to': None,
+            'next_cursor': paginate.next_cursor,
+            'prev_cursor': paginate.prev_cursor,
+            'data': list(map(lambda x: x.to_dict(), paginate.items))
+        }
+        func = self.admin_response if is_admin else self.proxy_response
+        return func(data=data)
+
+    def register_schema(self, name: str, schema: dict) -> DefinitionSchema:
+        """
+        Compile a Cerberus schema once, `form_validate(data, name)` validates against it
+
+        It can be called at import time, before `init_app`.
+
+        :raise SchemaError: the schema is invalid
+        """
+        self._schemas[name] = (Validator(schema).schema, needs_normalization(schema))
+        return self._schemas[name][0]
+
+    def compile_schema(self, schema) -> Tuple[DefinitionSchema, bool]:
+        """
+        The compiled schema and whether the documents need the normalization
+
+        Cerberus normalizes and validates a schema definition in `Validator(schema)`, and the normalization of
+        every document copies and re-validates the schema again. A compiled schema is cached by a stable hash of
+        the definition, so a schema built per request is compiled once, and the normalization is skipped unless
+        the schema has a normalization rule (`coerce`, `default`, `rename`...).
+
+        :param schema: a registered name or a schema dict
+        """
+        if isinstance(schema, str):
+            if schema not in self._schemas:
+                raise ValueError('Unknown schema: {}'.format(schema))
+            return self._schemas[schema]
+        if not self.config.get('SHOPIFY_SCHEMA_CACHE_THRESHOLD'):
+            return Validator(schema).schema, True
+        try:
+            key = sha256(json_dumps(schema, sort_keys=True, default=repr).encode('utf-8')).hexdigest()
+        except (TypeError, ValueError):
+            # e.g. keys of mixed types, not worth a cache entry
+            return Validator(schema).schema, True
+        compiled = self._schema_cache.get(key)
+        if compiled is None:
+            compiled = (Validator(schema).schema, needs_normalization(schema))
+            self._schema_cache.set(key, compiled)
+        return compiled
+
+    def form_validate(self, data: dict = None, schema=None, is_admin: bool = False):
         func = getattr(self, 'proxy_response' if not is_admin else 'admin_response')
         if not data or not schema:
             return False, func(400, 'Invalid JSON data')
+        schema, normalize = self.compile_schema(schema)
+        # a new validator per call, it keeps the state of the validation
         validator = Validator(schema)
-        if not validator.validate(data):
+        if not validator.validate(data, normalize=normalize):
             keys = []
             key = list(validator.errors.keys())[0]
             first_error = validator.errors[key][0]
@@ -503,36 +1061,22 @@ class ShopifyUtil:
         return True, None
 
     @contextmanager
-    def prevent_concurrency(self, key: str = 'main'):
+    def prevent_concurrency(self, key: str = 'main', blocking: bool = False, timeout: float = None):
         """
         Prevent concurrency request.
 
-        Note: This relies on POSIX ``fcntl.flock`` and is not supported on
-        Windows. Calling it on Windows will raise ``RuntimeError``.
+        The lock backend is `SHOPIFY_LOCK_TYPE`: `file` (`fcntl.flock`, one host, not supported on Windows),
+        `database` (advisory locks of PostgreSQL / MySQL, `file` on SQLite) or `redis` (a lease with a
+        fencing token, renewed while it is held).
 
         :param key:
-        :return:
+        :param blocking: wait for the lock instead of raising right away
+        :param timeout: seconds to wait in the blocking mode, None waits forever
+        :return: the `Lease`, `lease.token` is the fencing token of the `redis` backend
+        :raise LockError: a `RuntimeError`, the key is already running
         """
-        if platform.startswith('win'):
-            raise RuntimeError(
-                'prevent_concurrency is not supported on Windows '
-                '(requires POSIX fcntl.flock).'
-            )
-        # Delay the import so this module remains importable on Windows.
-        from fcntl import flock, LOCK_EX, LOCK_NB, LOCK_UN
-
-        dir_path = self.config.get('TEMPORARY_PATH', '/tmp')
-        file_path = path.join(dir_path, 'worker-{}.lock'.format(key))
-        f = open(file_path, 'w')
-        try:
-            try:
-                flock(f, LOCK_EX | LOCK_NB)
-            except BlockingIOError:
-                raise RuntimeError(f'{key} is already running')
-            yield
-        finally:
-            flock(f, LOCK_UN)
-            f.close()
+        with self.lock.hold(key, blocking=blocking, timeout=timeout) as lease:
+            yield lease
 
     @classmethod
     def get_hash_time_format(cls, val: str):
@@ -666,10 +1210,10 @@ class ShopifyUtil:
                 if not compare_digest(self.validate_hmac(params), request.args.get('hmac', '')):
                     return error_redirect
                 g.store_key = params.get('shop', '')
-                store = self.db.query(Store).filter_by(key=g.store_key).first()
+                store = self.get_store(g.store_key)
                 if not store:
                     return error_redirect
-                g.store_id = store.id
+                g.store_id = store['id']
                 return make_response(render_template(
                     'admin/index.html',
                     jwtToken=self.create_admin_jwt_token()
@@ -685,8 +1229,8 @@ class ShopifyUtil:
             if bypass != 0:
                 g.store_id = bypass
             else:
-                store = self.db.query(Store).filter_by(key=g.store_key).first()
-                g.store_id = store.id if store else 0
+                store = self.get_store(g.store_key)
+                g.store_id = store['id'] if store else 0
             # Render the Embedded App Index Page
             try:
                 code = render_template(
@@ -701,19 +1245,13 @@ class ShopifyUtil:
         @default_routes.route('/', methods=['GET'], endpoint='index')
         def index() -> Response:
             """ Show Embedded App or Docs page """
-            from flask_shopify_utils.model import Store
-
             params = request.args
             if len([x for x in params.keys() if x in ['shop', 'hmac', 'host', 'timestamp', 'session']]) < 4:
                 # Redirect to the Docs page
                 return redirect(url_for('docs_default.doc_index'))
             # check store record from database
-            if record := Store.query.filter_by(key=params.get('shop')).first():
-                client = GraphQLClient(record.key, record.token)
-                raw_query = '{ shop { name, url } appInstallation { accessScopes { handle }} }'
-                res = client.client(raw_query)
-                # check 401
-                if isinstance(res, dict) and not res.get('errors'):
+            if record := self.get_store(params.get('shop')):
+                if self.check_store_token(record):
                     return redirect(url_for('shopify_default.admin', **params))
 
             # redirect to install path
@@ -753,6 +1291,7 @@ class ShopifyUtil:
                 return resp
             record.scopes = self.format_api_scopes(list(map(lambda x: x['handle'], scopes['accessScopes'])))
             self.db.commit()
+            self.forget_store(g.store_key)
             # Register GDPR mandatory webhook @todo
             # https://shopify.dev/docs/apps/auth/get-access-tokens/authorization-code-grant/getting-started
             return redirect('https://{}/admin/apps/{}'.format(
@@ -793,11 +1332,20 @@ class ShopifyUtil:
             Check the webhook is valid or not
             :return None or Response
             """
+            if self.is_duplicate_webhook():
+                return self.proxy_response(0, 'Duplicate webhook')
             if not self.validate_webhook():
                 resp = jsonify(dict(message='Hmac validation failed!', status=401))
                 resp.status_code = 401
                 return resp
             g.store_key = request.headers.get('X-Shopify-Shop-Domain', None)
+            g.webhook_verified = True
+
+        @gdpr_routes.after_request
+        def webhook_handled(resp: Response) -> Response:
+            if g.get('webhook_verified') and resp.status_code < 400:
+                self.remember_webhook()
+            return resp
 
         @gdpr_routes.route('/webhook/shop/redact', methods=['POST'], endpoint='shop_redact')
         def shop_redact():
@@ -805,8 +1353,18 @@ class ShopifyUtil:
             You should erase the store information from your database
             get the store key from g.store_key
             """
-            data = request.get_json(silent=True)
+            data = self.get_webhook_json()
             print('shop_redact', data, g.store_key)
+            self.forget_store(g.store_key)
+            return 'success'
+
+        @gdpr_routes.route('/webhook/app/uninstalled', methods=['POST'], endpoint='app_uninstalled')
+        def app_uninstalled():
+            """
+            The APP_UNINSTALLED webhook, the token of the store is revoked
+            get the store key from g.store_key
+            """
+            self.forget_store(g.store_key)
             return 'success'
 
         @gdpr_routes.route('/webhook/customers/redact', methods=['POST'], endpoint='customer_redact')
@@ -815,7 +1373,7 @@ class ShopifyUtil:
             You should erase the customer information from your database
             get the store key from g.store_key
             """
-            data = request.get_json(silent=True)
+            data = self.get_webhook_json()
             print('customer_redact', data, g.store_key)
             return 'success'
 
@@ -828,15 +1386,13 @@ class ShopifyUtil:
             In some cases, a customer record contains only the customer's email address.
             get the store key from g.store_key
             """
-            data = request.get_json(silent=True)
+            data = self.get_webhook_json()
             print('customer_data_request', data, g.store_key)
             return 'success'
 
         self.app.register_blueprint(gdpr_routes)
 
     def enroll_admin_route(self):
-        from flask_shopify_utils.model import Store
-
         admin_routes = Blueprint('admin_default', 'default_admin_routes', url_prefix='/admin')
 
         @admin_routes.route('/test_jwt', methods=['POST', 'GET'], endpoint='test_jwt')
@@ -859,8 +1415,8 @@ class ShopifyUtil:
             if bypass != 0:
                 g.store_id = bypass
             else:
-                store = self.db.query(Store).filter_by(key=g.store_key).first()
-                g.store_id = store.id if store else 0
+                store = self.get_store(g.store_key)
+                g.store_id = store['id'] if store else 0
             return self.admin_response(data=dict(
                 apiKey=self.config.get('SHOPIFY_API_KEY'),
                 jwtToken=self.create_admin_jwt_token()
@@ -871,7 +1427,7 @@ class ShopifyUtil:
         def reinstall_app():
             """ Check or Get the offline access_token """
             # check record
-            record = Store.query.filter_by(key=g.store_key).first()
+            record = self.get_store(g.store_key)
             data = dict(
                 url=url_for('shopify_default.install', shop=g.store_key, _external=True, _scheme='https')
             )
@@ -883,7 +1439,7 @@ class ShopifyUtil:
             else:
                 # check offline access_token
                 try:
-                    obj = GraphQLClient(record.key, record.token)
+                    obj = GraphQLClient(record['key'], record['token'])
                     _ = obj.fetch_data('{ app { availableAccessScopes { handle } } }')
                 except Exception as e:
                     return self.admin_response(
@@ -894,6 +1450,47 @@ class ShopifyUtil:
 
         self.app.register_blueprint(admin_routes)
 
+    def enroll_webhook_route(self, url: str = '/webhook/queue'):
+        """ Register a route that saves any webhook topic for the worker """
+        webhook_routes = Blueprint('shopify_webhook', 'shopify_webhook_routes')
+
+        @webhook_routes.route(url, methods=['POST'], endpoint='queue')
+        @self.ingest_webhook
+        def queue():
+            return 'success'
+
+        self.app.register_blueprint(webhook_routes)
+
+    def enroll_webhook_worker_cli(self):
+        from click import option, echo
+        from time import sleep
+
+        cli_bp = Blueprint('webhook_worker_cli', 'webhook_worker_cli', cli_group=None)
+
+        @cli_bp.cli.command('webhook_worker')
+        @option('-b', '--batch', default=20, help='Records claimed per batch')
+        @option('-i', '--interval', default=1.0, help='Seconds to wait when the queue is empty')
+        @option('-s', '--stale', default=600, help='Requeue the `processing` records older than it (seconds)')
+        @option('--once', is_flag=True, default=False, help='Process the queue once and exit')
+        def webhook_worker(batch, interval, stale, once):
+            """ Process the queued webhooks """
+            total = 0
+            try:
+                self.requeue_webhooks(stale)
+                while True:
+                    count = self.process_webhooks(batch)
+                    total += count
+                    if count == 0:
+                        if once:
+                            break
+                        sleep(interval)
+                        self.requeue_webhooks(stale)
+            except KeyboardInterrupt:
+                pass
+            echo('{} webhook(s) processed.'.format(total))
+
+        self.app.register_blueprint(cli_bp)
+
     def enroll_graphql_schema_cli(self):
         from os import remove, getcwd, path
         from json import dump
@@ -901,6 +1498,7 @@ class ShopifyUtil:
         from sgqlc.endpoint.http import HTTPEndpoint
         from sgqlc.introspection import query, variables
         from sgqlc.codegen import get_arg_parse
+        from flask_shopify_utils.codegen import split_schema, scan_operations, prune_introspection
         from flask_shopify_utils.utils import get_version
         from flask_shopify_utils.model import Store
 
@@ -910,7 +1508,11 @@ class ShopifyUtil:
         @option('-s', '--store_id', default=1, help='Store ID')
         @option('-v', '--version', default=None, help='Schema version: 20xx-01 or 20xx-04 ...')
         @option('-d', '--with-deprecated', default=True, help='Include deprecated fields, default is True')
-        def generate_schema(store_id, version, with_deprecated):
+        @option('-p', '--package', is_flag=True, default=False,
+                help='Write a package of lazily loaded modules instead of a single module')
+        @option('--prune', multiple=True,
+                help='Only generate the types used by the operation modules or .graphql documents, repeatable')
+        def generate_schema(store_id, version, with_deprecated, package, prune):
             """ Generate Shopify GraphQL schema """
             version = get_version(version)
             try:
@@ -920,22 +1522,29 @@ class ShopifyUtil:
             except Exception as e:
                 print(e)
                 raise ClickException('Can`t fetch Store data from database!')
+            # check file path
+            target_path = path.join(getcwd(), 'app', 'schemas')
+            filename = 'shopify.py'
+            if not path.exists(target_path):
+                target_path = filename
+            else:
+                target_path = path.join(target_path, filename)
+            if not package and path.isdir(target_path[:-3]):
+                # the package shadows the module
+                raise ClickException('{} is a package, remove it or use --package'.format(target_path[:-3]))
             url = 'https://{}/admin/api/{}/graphql'.format(store.key, version)
             endpoint = HTTPEndpoint(url, {'X-Shopify-Access-Token': store.token})
             data = endpoint(query, variables(
                 include_description=False,
                 include_deprecated=with_deprecated,
             ))
+            if prune:
+                total = len(data['data']['__schema']['types'])
+                data = prune_introspection(data, scan_operations(prune))
+                echo('Pruned the schema to {} of {} types'.format(len(data['data']['__schema']['types']), total))
             json_file = 'schema.json'
             with open(json_file, 'w') as f:
                 dump(data, f, indent=4, sort_keys=True, default=str)
-            # check file path
-            target_path = path.join(getcwd(), 'app', 'schemas')
-            filename = 'shopify.py'
-            if not path.exists(target_path):
-                target_path = filename
-            else:
-                target_path = path.join(target_path, filename)
             ap = get_arg_parse()
             args = ap.parse_args(['schema', json_file, target_path])
             args.func(args)
@@ -944,11 +1553,16 @@ class ShopifyUtil:
             # append version to the header of the file
             with open(target_path, 'r') as f:
                 text = f.read()
-            with open(target_path, 'w') as f:
-                f.write('# API Version: {}\n'.format(version))
-                f.write('# With deprecated: {}\n'.format(with_deprecated))
-                f.write('# Generated At: {}\n'.format(datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S')))
-                f.write(text)
+            text = '# API Version: {}\n# With deprecated: {}\n# Generated At: {}\n{}'.format(
+                version, with_deprecated, datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S'), text)
+            if package:
+                # the types are loaded on first access, see `flask_shopify_utils.codegen`
+                remove(target_path)
+                target_path = target_path[:-3]
+                split_schema(text, target_path)
+            else:
+                with open(target_path, 'w') as f:
+                    f.write(text)
             msg = 'GraphQL Schema for "{}" has been generated! \n'.format(version)
             msg += 'Please check the file: {}'.format(target_path)
             echo(msg)
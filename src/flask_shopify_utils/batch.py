@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : batch.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 23:20:00
+
+Several mutations sent as one aliased document
+"""
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Lock
+from typing import Iterator, List, Optional, Tuple, Union
+from graphql import parse, print_ast
+from graphql.language import DocumentNode, FragmentDefinitionNode, NameNode, OperationDefinitionNode, \
+    SelectionSetNode
+from sgqlc.operation import Operation
+from flask_shopify_utils.operation import CompiledOperation, PreparedOperation
+
+# The cost of a mutation before the first batch of the shop is answered: Shopify charges 10 points per mutation
+# field, see https://shopify.dev/docs/api/usage/rate-limits#cost-calculation. The batchers then use the
+# `extensions.cost.requestedQueryCost` of their previous response divided by its mutations.
+MUTATION_COST = 10
+
+
+class BatchResult(dict):
+    """ The data of one mutation of the batch, keyed like `fetch_data(op)` """
+
+    @property
+    def user_errors(self) -> list:
+        """ The `userErrors` of all the mutation payloads """
+        errors = []
+        for payload in self.values():
+            if isinstance(payload, dict):
+                errors.extend(payload.get('userErrors') or [])
+        return errors
+
+
+class BatchError(Exception):
+    """ The GraphQL errors of one mutation of the batch """
+
+    def __init__(self, errors: list, data: Optional[dict] = None):
+        super().__init__(errors)
+        self.errors = errors
+        self.data = data
+
+
+class BatchDocument:
+    """
+    The aliased selections of a batch
+
+    The operations are rendered by sgqlc and parsed by graphql-core, their root fields are merged into one
+    operation under the batch aliases.
+    """
+
+    def __init__(self):
+        self.operation = None
+        self.fragments = OrderedDict()
+
+    def add(self, op: Operation, prefix: str) -> List[Tuple[str, str]]:
+        """
+        Add the root fields of the operation, aliased `<prefix>` (`<prefix>_<index>` if there are more than one)
+
+        :return: the (alias, response key of the operation) pairs
+        """
+        names = []
+        for definition in parse(bytes(op).decode('utf-8'), no_location=True).definitions:
+            if isinstance(definition, FragmentDefinitionNode):
+                self.fragments.setdefault(definition.name.value, definition)
+                continue
+            if self.operation is None:
+                self.operation = OperationDefinitionNode(
+                    operation=definition.operation, name=NameNode(value='BatchMutations'), variable_definitions=(),
+                    directives=(), selection_set=SelectionSetNode(selections=()))
+            fields = definition.selection_set.selections
+            for i, field in enumerate(fields):
+                alias = prefix if len(fields) == 1 else '{}_{}'.format(prefix, i)
+                names.append((alias, (field.alias or field.name).value))
+                field.alias = NameNode(value=alias)
+            self.operation.selection_set.selections += tuple(fields)
+        return names
+
+    def __str__(self):
+        return print_ast(DocumentNode(definitions=(self.operation,) + tuple(self.fragments.values())))
+
+    def __bytes__(self):
+        # the strings are printed on a single line, only the indent is dropped
+        return '\n'.join(line.lstrip(' ') for line in str(self).split('\n')).encode('utf-8')
+
+
+class MutationBatcher:
+    """
+    Pack the queued mutations into aliased documents, one request per batch
+
+    A batch holds up to `max_size` mutations and `max_cost` points, the cost of a mutation is learnt from the
+    previous response (`MUTATION_COST` before the first one). Each mutation gets a `Future`, resolved
+    with a `BatchResult` (the same data as `fetch_data(op)`) or a `BatchError` with the GraphQL errors of its
+    aliases. The `PreparedOperation` variables are renamed per alias and the document of a batch is compiled
+    once per sequence of shapes.
+
+    ```python
+    with client.batch() as batcher:
+        futures = [batcher.submit(update_meta(owner_id, value, ns, key)) for owner_id, value in rows]
+    for future in futures:
+        res = future.result()['metafieldsSet']
+    ```
+    """
+
+    def __init__(self, client, max_size: int = 25, max_cost: float = 1000, max_documents: int = 64, **kwargs):
+        """
+        :param client: a `GraphQLClient`
+        :param max_size: the maximum number of mutations per request
+        :param max_cost: the maximum cost per request, a single query can not cost more than 1000 points
+        :param max_documents: the maximum number of compiled batch documents
+        :param kwargs: passed to `fetch_data`
+        """
+        self.client = client
+        self.max_size = max_size
+        self.max_cost = max_cost
+        self.max_documents = max_documents
+        self.kwargs = kwargs
+        self.requests = 0
+        self.mutation_cost = MUTATION_COST
+        self._queue = []
+        self._cost = 0
+        self._documents = {}
+        self._lock = Lock()
+
+    def __enter__(self) -> 'MutationBatcher':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+
+    def submit(self, op: Union[Operation, PreparedOperation], cost: float = None) -> Future:
+        """
+        Queue a mutation, the batch is sent when it is full or on `flush()`
+
+        :param op: a mutation `Operation` (the arguments inlined) or a `PreparedOperation`
+        :param cost: the expected cost of the mutation, default is the cost learnt from the previous response
+        """
+        future = Future()
+        batch = self._queue_op(op, cost, future)
+        if batch:
+            self._send_all(batch)
+        return future
+
+    def flush(self) -> None:
+        """ Send the queued mutations """
+        with self._lock:
+            batch = self._take()
+        self._send_all(batch)
+
+    def _queue_op(self, op: Union[Operation, PreparedOperation], cost: Optional[float], future) -> Optional[list]:
+        """ Queue the mutation, return the mutations to send """
+        if not isinstance(op, (Operation, PreparedOperation)):
+            raise TypeError('Only the sgqlc operations can be batched, got {}'.format(type(op).__name__))
+        cost = self.mutation_cost if cost is None else cost
+        with self._lock:
+            batch = self._take() if self._queue and self._cost + cost > self.max_cost else None
+            self._queue.append((op, cost, future))
+            self._cost += cost
+            if len(self._queue) >= self.max_size:
+                batch = (batch or []) + self._take()
+        return batch
+
+    def _take(self) -> list:
+        batch, self._queue, self._cost = self._queue, [], 0
+        return batch
+
+    def _split(self, items: list) -> Iterator[list]:
+        # a flush may take more than one batch, e.g. the queue of a full batch and the next mutation
+        start, cost = 0, 0
+        for i, (op, item_cost, future) in enumerate(items):
+            if i > start and (i - start >= self.max_size or cost + item_cost > self.max_cost):
+                yield items[start:i]
+                start, cost = i, 0
+            cost += item_cost
+        if start < len(items):
+            yield items[start:]
+
+    def _send_all(self, items: list) -> None:
+        for batch in self._split(items):
+            self._send(batch)
+
+    def _compile(self, ops: list) -> Tuple[PreparedOperation, List[list]]:
+        """ The document of the batch and the (alias, key) pairs of each mutation """
+        compiled = [op.compiled if isinstance(op, PreparedOperation) else None for op in ops]
+        # the operations with inlined arguments are compiled every time
+        cache_key = tuple(compiled) if all(compiled) else None
+        document = self._documents.get(cache_key) if cache_key else None
+        if document is None:
+            document = self._build(ops, compiled)
+            if cache_key:
+                if len(self._documents) >= self.max_documents:
+                    self._documents.clear()
+                self._documents[cache_key] = document
+        batch, aliases = document
+        variables = {}
+        for i, op in enumerate(ops):
+            if isinstance(op, PreparedOperation):
+                variables.update(('m{}_{}'.format(i, name), value) for name, value in op.variables.items())
+        return PreparedOperation(batch, variables), aliases
+
+    @staticmethod
+    def _build(ops: list, compiled: list) -> Tuple[CompiledOperation, List[list]]:
+        document, types, aliases = BatchDocument(), {}, []
+        for i, (op, item) in enumerate(zip(ops, compiled)):
+            prefix = 'm{}_'.format(i)
+            if item is not None:
+                if item.build is None:
+                    raise ValueError('The operation can not be batched, compile it with prepared_operation')
+                op = item.build(prefix)
+                types.update((prefix + name, typ) for name, typ in item.variables.items())
+            aliases.append(document.add(op, 'm{}'.format(i)))
+        return CompiledOperation(document, types), aliases
+
+    def _prepare(self, items: list) -> Optional[Tuple[PreparedOperation, List[list], Optional[float]]]:
+        """ The operation, the aliases and the bucket time before the request, None if it can not be compiled """
+        try:
+            op, aliases = self._compile([op for op, cost, future in items])
+        except Exception as e:
+            for _, _, future in items:
+                future.set_exception(e)
+            return None
+        self.requests += 1
+        bucket = self.client.throttle.get_bucket(self.client.shop)
+        return op, aliases, bucket['updated_at'] if bucket else None
+
+    def _send(self, items: list) -> None:
+        request = self._prepare(items)
+        if request is None:
+            return
+        op, aliases, updated_at = request
+        try:
+            data = self.client.fetch_data(op, cost=sum(cost for _, cost, _ in items), **self.kwargs)
+        except Exception as e:
+            self._resolve(items, aliases, updated_at, error=e)
+        else:
+            self._resolve(items, aliases, updated_at, data)
+
+    def _resolve(self, items: list, aliases: List[list], updated_at: Optional[float], data: dict = None,
+                 error: Exception = None) -> None:
+        """ Set the futures from the response, learn the cost of a mutation """
+        bucket = self.client.throttle.get_bucket(self.client.shop)
+        if bucket and bucket['requested'] and bucket['updated_at'] != updated_at:
+            self.mutation_cost = bucket['requested'] / len(items)
+        errors = []
+        if error is not None:
+            result = error.args[0] if error.args else None
+            if not isinstance(result, dict) or not result.get('data'):
+                for _, _, future in items:
+                    future.set_exception(error)
+                return
+            # a partial result, the errors belong to some aliases
+            data, errors = result['data'], result.get('errors') or []
+        for (_, _, future), names in zip(items, aliases):
+            result = BatchResult((key, data.get(alias)) for alias, key in names)
+            # the errors without a path belong to every mutation
+            own = [error for error in errors if not error.get('path') or error['path'][0] in dict(names)]
+            if own:
+                future.set_exception(BatchError(own, result))
+            else:
+                future.set_result(result)
+
+
+class AsyncMutationBatcher(MutationBatcher):
+    """
+    `MutationBatcher` of `AsyncGraphQLClient`, the mutations get asyncio futures
+
+    ```python
+    async with client.batch() as batcher:
+        futures = [await batcher.submit(update_meta(owner_id, value, ns, key)) for owner_id, value in rows]
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    ```
+    """
+
+    async def __aenter__(self) -> 'AsyncMutationBatcher':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.flush()
+
+    async def submit(self, op: Union[Operation, PreparedOperation], cost: float = None) -> asyncio.Future:
+        """ Queue a mutation, a full batch is sent before it returns """
+        future = asyncio.get_running_loop().create_future()
+        batch = self._queue_op(op, cost, future)
+        if batch:
+            await self._send_all(batch)
+        return future
+
+    async def flush(self) -> None:
+        """ Send the queued mutations """
+        with self._lock:
+            batch = self._take()
+        await self._send_all(batch)
+
+    async def _send_all(self, items: list) -> None:
+        for batch in self._split(items):
+            await self._send(batch)
+
+    async def _send(self, items: list) -> None:
+        request = self._prepare(items)
+        if request is None:
+            return
+        op, aliases, updated_at = request
+        try:
+            data = await self.client.fetch_data(op, cost=sum(cost for _, cost, _ in items), **self.kwargs)
+        except Exception as e:
+            self._resolve(items, aliases, updated_at, error=e)
+        else:
+            self._resolve(items, aliases, updated_at, data)
+
+
+__all__ = ('MUTATION_COST', 'BatchResult', 'BatchError', 'BatchDocument', 'MutationBatcher', 'AsyncMutationBatcher')
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : breaker.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 19/10/2026 00:40:00
+
+Stop calling a shop which keeps failing, e.g. the app was uninstalled or the token revoked
+"""
+from time import time
+from typing import Optional
+from flask_shopify_utils.cache import BaseCache
+
+
+class CircuitOpenError(Exception):
+    """ The circuit of the shop is open, the request was not sent """
+
+    def __init__(self, shop: str, retry_in: float):
+        super().__init__('The circuit of {} is open, retry in {:.0f} seconds'.format(shop, retry_in))
+        self.shop = shop
+        self.retry_in = retry_in
+
+
+def is_failure(status: Optional[int]) -> bool:
+    """
+    The HTTP statuses counted by the circuit breaker: the token is invalid or Shopify is down
+
+    The other client errors, 403 (a missing scope) included, are the fault of the request, not of the shop.
+    """
+    return status is not None and (status == 401 or status >= 500)
+
+
+class CircuitBreaker:
+    """
+    Per-shop circuit breaker, the state is kept in the cache so all the workers share it
+
+    `threshold` failures (401, 5xx, timeouts) of a shop within `window` seconds open its circuit, the
+    requests fail fast with `CircuitOpenError`. After `cooldown` seconds one worker sends a probe request
+    (half-open): a success closes the circuit, a failure opens it for another cooldown. `reset(shop)` closes
+    it right away, `ShopifyUtil.forget_store` calls it when the store is installed again.
+
+    ```python
+    probe = breaker.before_request(shop)
+    response = session.get(url)
+    breaker.record(shop, response.status_code, probe)
+    ```
+    """
+
+    def __init__(self, cache: BaseCache, threshold: int = 5, window: float = 60, cooldown: float = 60):
+        """
+        :param cache: the state of the circuits, `ShopifyUtil.cache`
+        :param threshold: the failures which open the circuit
+        :param window: the seconds the failures are counted
+        :param cooldown: the seconds before a probe request is sent to an open circuit
+        """
+        self.cache = cache
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+
+    @staticmethod
+    def _key(shop: str, name: str) -> str:
+        return 'circuit:{}:{}'.format(shop, name)
+
+    def get_state(self, shop: str) -> str:
+        """ `closed`, `open` or `half_open` (the cooldown is over) """
+        opened_at = self.cache.get(self._key(shop, 'open'))
+        if opened_at is None:
+            return 'closed'
+        return 'open' if time() - opened_at < self.cooldown else 'half_open'
+
+    def before_request(self, shop: str) -> bool:
+        """
+        Raise `CircuitOpenError` if the circuit is open
+
+        :return: True if the request is the probe of a half-open circuit
+        """
+        opened_at = self.cache.get(self._key(shop, 'open'))
+        if opened_at is None:
+            return False
+        retry_in = opened_at + self.cooldown - time()
+        # a single probe at a time, it expires if the worker dies
+        if retry_in > 0 or not self.cache.add(self._key(shop, 'probe'), 1, timeout=self.cooldown):
+            raise CircuitOpenError(shop, max(retry_in, 0))
+        return True
+
+    def record(self, shop: str, status: Optional[int], probe: bool = False) -> None:
+        """ Record the HTTP status of a response """
+        if is_failure(status):
+            self.failure(shop, probe)
+        else:
+            self.success(shop, probe)
+
+    def success(self, shop: str, probe: bool = False) -> None:
+        # the failures of a closed circuit expire with the window, a success costs no cache request
+        if probe:
+            self.reset(shop)
+
+    def failure(self, shop: str, probe: bool = False) -> None:
+        if probe or self.cache.incr(self._key(shop, 'failures'), timeout=self.window) >= self.threshold:
+            self.cache.set(self._key(shop, 'open'), time(), timeout=0)
+            self.cache.delete(self._key(shop, 'failures'))
+            self.cache.delete(self._key(shop, 'probe'))
+
+    def reset(self, shop: str) -> None:
+        """ Close the circuit """
+        for name in ('open', 'failures', 'probe'):
+            self.cache.delete(self._key(shop, name))
+
+
+__all__ = ('CircuitOpenError', 'is_failure', 'CircuitBreaker')
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : bulk.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 14:05:00
+
+Shopify Bulk Operations
+https://shopify.dev/docs/api/usage/bulk-operations/queries
+"""
+from json import loads, dumps
+from threading import Event, Lock
+from time import monotonic
+from typing import Iterable, Iterator
+from tempfile import TemporaryFile
+from flask_shopify_utils.utils import GraphQLClient, get_shared_session
+
+RUN_QUERY = '''mutation RunBulkQuery($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}'''
+
+RUN_MUTATION = '''mutation RunBulkMutation($mutation: String!, $stagedUploadPath: String!) {
+  bulkOperationRunMutation(mutation: $mutation, stagedUploadPath: $stagedUploadPath) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}'''
+
+STAGED_UPLOAD = '''mutation StagedUpload($input: [StagedUploadInput!]!) {
+  stagedUploadsCreate(input: $input) {
+    stagedTargets { url resourceUrl parameters { name value } }
+    userErrors { field message }
+  }
+}'''
+
+QUERY_OPERATION = '''query QueryBulkOperation($id: ID!) {
+  node(id: $id) {
+    ... on BulkOperation { id status errorCode objectCount fileSize url partialDataUrl }
+  }
+}'''
+
+CANCEL_OPERATION = '''mutation CancelBulkOperation($id: ID!) {
+  bulkOperationCancel(id: $id) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}'''
+
+RUNNING_STATUS = ('CREATED', 'RUNNING', 'CANCELING')
+
+# BulkOperation ID -> Event of the waiting runner, set by the `BULK_OPERATIONS_FINISH` webhook
+_finished_events = {}
+_finished_lock = Lock()
+
+
+class BulkOperationError(Exception):
+    pass
+
+
+def _get_event(operation_id: str) -> Event:
+    with _finished_lock:
+        return _finished_events.setdefault(operation_id, Event())
+
+
+def notify_finished(payload: dict) -> None:
+    """
+    Wake up the runner waiting for the operation, call it from the `BULK_OPERATIONS_FINISH` webhook
+
+    Only the runners in the same process can be woken up, the others keep polling. The webhooks of
+    the operations nobody waits for are ignored.
+
+    ```python
+    @webhook_bp.route('/bulk_operations/finish', methods=['POST'])
+    @utils.check_webhook
+    def bulk_operations_finish():
+        notify_finished(request.get_json())
+        return 'success'
+    ```
+    """
+    operation_id = payload.get('admin_graphql_api_id')
+    if not operation_id:
+        return
+    with _finished_lock:
+        event = _finished_events.get(operation_id)
+    if event is not None:
+        event.set()
+
+
+def iter_jsonl(url: str, chunk_size: int = 65536, session=None, timeout: float = 60) -> Iterator[dict]:
+    """
+    Download the JSONL file as a stream and parse it line by line
+
+    :param timeout: seconds to wait for the connection and between two chunks
+    """
+    session = session if session else get_shared_session()
+    with session.get(url, stream=True, timeout=timeout) as resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines(chunk_size=chunk_size):
+            if line:
+                yield loads(line)
+
+
+def iter_objects(lines: Iterable[dict], children_key: str = '__children') -> Iterator[dict]:
+    """
+    Rebuild the parent/child relationships of the JSONL rows through `__parentId`
+
+    Shopify writes the children right after their parent, so only the current top
+    level object is kept in memory. The children are grouped by their type:
+
+    `{"id": "gid://shopify/Product/1", "__children": {"ProductVariant": [{...}, {...}]}}`
+
+    :param lines: parsed rows, e.g. `iter_jsonl(url)`
+    :param children_key: the key to put the children into
+    """
+    root, index = None, {}
+    for row in lines:
+        parent_id = row.pop('__parentId', None)
+        if parent_id is None:
+            if root is not None:
+                yield root
+            root = row
+            index = {row['id']: row} if 'id' in row else {}
+            continue
+        parent = index.get(parent_id)
+        if parent is None:
+            raise BulkOperationError('Parent[{}] is not found, the rows are out of order.'.format(parent_id))
+        if '__typename' in row:
+            name = row['__typename']
+        elif isinstance(row.get('id'), str) and row['id'].startswith('gid://'):
+            name = row['id'].split('/')[3]
+        else:
+            name = 'children'
+        parent.setdefault(children_key, {}).setdefault(name, []).append(row)
+        if 'id' in row:
+            index[row['id']] = row
+    if root is not None:
+        yield root
+
+
+class BulkOperationRunner:
+    """
+    Run the bulk query / mutation, wait for it and stream the result
+
+    ```python
+    runner = BulkOperationRunner(GraphQLClient(store.key, store.token))
+    for product in runner.run_query('{ products { edges { node { id variants { edges { node { id } } } } } } }'):
+        print(product['id'], len(product.get('__children', {}).get('ProductVariant', [])))
+    ```
+    """
+
+    def __init__(self, client: GraphQLClient, poll_interval: float = 5, timeout: float = None,
+                 http_timeout: float = 60):
+        """
+        :param client: GraphQL client of the shop
+        :param poll_interval: seconds between two status checks
+        :param timeout: the maximum seconds to wait, None to wait forever
+        :param http_timeout: seconds to wait for the connection and between two chunks of the upload / download
+        """
+        self.client = client
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.http_timeout = http_timeout
+
+    @staticmethod
+    def _check(res: dict, name: str) -> dict:
+        if res[name]['userErrors']:
+            raise BulkOperationError(dumps(res[name]['userErrors']))
+        return res[name]
+
+    def submit_query(self, query: str) -> dict:
+        """ Submit the bulk query, return the BulkOperation """
+        res = self.client.fetch_data(RUN_QUERY, variables=dict(query=query))
+        return self._check(res, 'bulkOperationRunQuery')['bulkOperation']
+
+    def submit_mutation(self, mutation: str, staged_upload_path: str) -> dict:
+        """ Submit the bulk mutation with the uploaded variables, return the BulkOperation """
+        res = self.client.fetch_data(RUN_MUTATION, variables=dict(
+            mutation=mutation, stagedUploadPath=staged_upload_path))
+        return self._check(res, 'bulkOperationRunMutation')['bulkOperation']
+
+    def upload_variables(self, rows: Iterable[dict], filename: str = 'bulk_variables.jsonl') -> str:
+        """
+        Upload the variables (one dict per mutation) of a bulk mutation
+
+        :return: the `stagedUploadPath` for `submit_mutation`
+        """
+        res = self.client.fetch_data(STAGED_UPLOAD, variables=dict(input=[dict(
+            resource='BULK_MUTATION_VARIABLES',
+            filename=filename,
+            mimeType='text/jsonl',
+            httpMethod='POST',
+        )]))
+        target = self._check(res, 'stagedUploadsCreate')['stagedTargets'][0]
+        params = dict((val['name'], val['value']) for val in target['parameters'])
+        # spool to disk, the file could be larger than the memory
+        with TemporaryFile() as f:
+            for row in rows:
+                f.write(dumps(row).encode('utf-8'))
+                f.write(b'\n')
+            f.seek(0)
+            resp = get_shared_session().post(
+                target['url'], data=params, files=dict(file=(filename, f)), timeout=self.http_timeout)
+        resp.raise_for_status()
+        return params['key']
+
+    def get_operation(self, operation_id: str) -> dict:
+        return self.client.fetch_data(QUERY_OPERATION, variables=dict(id=operation_id))['node']
+
+    def cancel(self, operation_id: str) -> dict:
+        res = self.client.fetch_data(CANCEL_OPERATION, variables=dict(id=operation_id))
+        return self._check(res, 'bulkOperationCancel')['bulkOperation']
+
+    def wait(self, operation_id: str) -> dict:
+        """
+        Poll the operation until it is finished, `notify_finished` wakes it up early
+
+        :return: the finished BulkOperation
+        """
+        event = _get_event(operation_id)
+        deadline = None if self.timeout is None else monotonic() + self.timeout
+        try:
+            while True:
+                operation = self.get_operation(operation_id)
+                if operation['status'] not in RUNNING_STATUS:
+                    break
+                if deadline is not None and monotonic() >= deadline:
+                    raise BulkOperationError('BulkOperation[{}] is still {}'.format(operation_id, operation['status']))
+                event.wait(self.poll_interval)
+                event.clear()
+        finally:
+            with _finished_lock:
+                _finished_events.pop(operation_id, None)
+        if operation['status'] != 'COMPLETED':
+            raise BulkOperationError('BulkOperation[{}] is {}: {}'.format(
+                operation_id, operation['status'], operation.get('errorCode')))
+        return operation
+
+    def iter_result(self, operation: dict, nested: bool = True) -> Iterator[dict]:
+        """
+        Stream the result of a finished operation
+
+        :param operation: the finished BulkOperation
+        :param nested: rebuild the parent/child relationships, otherwise yield the raw rows
+        """
+        if not operation.get('url'):
+            # no object matched
+            return iter([])
+        rows = iter_jsonl(operation['url'], timeout=self.http_timeout)
+        return iter_objects(rows) if nested else rows
+
+    def run_query(self, query: str, nested: bool = True) -> Iterator[dict]:
+        """ Submit, wait and stream the result of a bulk query """
+        operation = self.wait(self.submit_query(query)['id'])
+        return self.iter_result(operation, nested)
+
+    def run_mutation(self, mutation: str, rows: Iterable[dict]) -> Iterator[dict]:
+        """ Upload the variables, submit, wait and stream the result of a bulk mutation """
+        operation = self.submit_mutation(mutation, self.upload_variables(rows))
+        return self.iter_result(self.wait(operation['id']), nested=False)
+
+
+__all__ = (
+    'BulkOperationRunner', 'BulkOperationError', 'notify_finished', 'iter_jsonl', 'iter_objects',
+)
@@ -0,0 +1,515 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : cache.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 15:10:00
+"""
+import os
+import socket
+from collections import OrderedDict
+from contextlib import contextmanager
+from hashlib import sha1
+from pickle import dumps, loads, HIGHEST_PROTOCOL, UnpicklingError
+from tempfile import mkstemp
+from threading import Lock
+from time import monotonic, time, sleep
+from typing import Any, Callable, Optional
+from urllib.parse import urlparse, unquote
+
+
+class BaseCache:
+    """
+    The cache interface, values are kept for `timeout` seconds (None for `default_timeout`, 0 means forever)
+
+    `None` can't be cached, `get` returns None for a missing key.
+    """
+    # True if the cache is shared with the other worker processes
+    shared = False
+
+    def __init__(self, default_timeout: float = 300):
+        self.default_timeout = default_timeout
+
+    def _get_timeout(self, timeout: Optional[float]) -> float:
+        return self.default_timeout if timeout is None else timeout
+
+    def get(self, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, timeout: float = None) -> bool:
+        raise NotImplementedError
+
+    def add(self, key: str, value: Any, timeout: float = None) -> bool:
+        """ Set the value only if the key doesn't exist, return False otherwise """
+        raise NotImplementedError
+
+    def delete(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def clear(self) -> bool:
+        raise NotImplementedError
+
+    def incr(self, key: str, delta: int = 1, timeout: float = None) -> int:
+        """ Increase the counter, the timeout is only applied when the counter is created """
+        raise NotImplementedError
+
+    def get_or_set(self, key: str, func: Callable[[], Any], timeout: float = None, lock_timeout: float = 10,
+                   wait: float = 0.05) -> Any:
+        """
+        Get the value, or compute it with `func` and cache it
+
+        Only one caller computes a missing value (stampede protection), the others wait for it up to
+        `lock_timeout` seconds and compute it themselves if it never shows up.
+
+        :param key: cache key
+        :param func: compute the value, None is not cached
+        :param timeout: seconds to keep the value
+        :param lock_timeout: seconds to hold the lock, it should be longer than `func` takes
+        :param wait: seconds between two checks while waiting
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        lock_key = '{}:lock'.format(key)
+        deadline = monotonic() + lock_timeout
+        while not self.add(lock_key, 1, timeout=lock_timeout):
+            sleep(wait)
+            value = self.get(key)
+            if value is not None:
+                return value
+            if monotonic() >= deadline:
+                return func()
+        try:
+            # the previous holder may have set it after our last check
+            value = self.get(key)
+            if value is None:
+                value = func()
+                if value is not None:
+                    self.set(key, value, timeout)
+            return value
+        finally:
+            self.delete(lock_key)
+
+
+class MemoryCache(BaseCache):
+    """
+    Process-local LRU cache with TTL
+
+    It is thread safe, but every worker process has its own copy.
+    """
+
+    def __init__(self, threshold: int = 500, default_timeout: float = 300):
+        """
+        :param threshold: the maximum number of items, the least recently used one is evicted first
+        :param default_timeout: seconds to keep an item, 0 means forever
+        """
+        super().__init__(default_timeout)
+        self.threshold = threshold
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def _expires_at(self, timeout: Optional[float]) -> float:
+        timeout = self._get_timeout(timeout)
+        return monotonic() + timeout if timeout else 0
+
+    def _get(self, key: str) -> Optional[tuple]:
+        item = self._items.get(key)
+        if item is not None and item[0] and item[0] <= monotonic():
+            del self._items[key]
+            return None
+        return item
+
+    def _set(self, key: str, value: Any, timeout: Optional[float]) -> None:
+        self._items[key] = (self._expires_at(timeout), value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.threshold:
+            self._items.popitem(last=False)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            item = self._get(key)
+            if item is None:
+                return default
+            self._items.move_to_end(key)
+            return item[1]
+
+    def set(self, key: str, value: Any, timeout: float = None) -> bool:
+        with self._lock:
+            self._set(key, value, timeout)
+        return True
+
+    def add(self, key: str, value: Any, timeout: float = None) -> bool:
+        with self._lock:
+            if self._get(key) is not None:
+                return False
+            self._set(key, value, timeout)
+        return True
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._items.pop(key, None) is not None
+
+    def clear(self) -> bool:
+        with self._lock:
+            self._items.clear()
+        return True
+
+    def incr(self, key: str, delta: int = 1, timeout: float = None) -> int:
+        with self._lock:
+            item = self._get(key)
+            if item is None:
+                value = delta
+                self._set(key, value, timeout)
+            else:
+                value = item[1] + delta
+                self._items[key] = (item[0], value)
+            return value
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class FileSystemCache(BaseCache):
+    """
+    One file per key, shared by the worker processes on the same host (e.g. uWSGI workers)
+
+    The files are replaced atomically, `add` and `incr` hold an `flock` on the directory lock file.
+    """
+    shared = True
+
+    def __init__(self, cache_dir: str, threshold: int = 500, default_timeout: float = 300, mode: int = 0o600):
+        """
+        :param cache_dir: the directory to keep the files, it is created if missing
+        :param threshold: the maximum number of files, the expired and then the oldest ones are removed first
+        :param default_timeout: seconds to keep an item, 0 means forever
+        :param mode: file mode of the cache files
+        """
+        super().__init__(default_timeout)
+        self.cache_dir = cache_dir
+        self.threshold = threshold
+        self.mode = mode
+        self._writes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _get_filename(self, key: str) -> str:
+        return os.path.join(self.cache_dir, sha1(key.encode('utf-8')).hexdigest() + '.cache')
+
+    def _read(self, filename: str) -> Optional[tuple]:
+        try:
+            with open(filename, 'rb') as f:
+                expires_at, value = loads(f.read())
+        except OSError:
+            return None
+        except (UnpicklingError, EOFError, ValueError, TypeError):
+            # a truncated or corrupted file is a miss
+            self._remove(filename)
+            return None
+        if expires_at and expires_at <= time():
+            return None
+        return expires_at, value
+
+    def _write(self, filename: str, value: Any, expires_at: float) -> None:
+        fd, tmp = mkstemp(suffix='.tmp', dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(dumps((expires_at, value), HIGHEST_PROTOCOL))
+            os.chmod(tmp, self.mode)
+            os.replace(tmp, filename)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._prune()
+
+    def _expires_at(self, timeout: Optional[float]) -> float:
+        timeout = self._get_timeout(timeout)
+        return time() + timeout if timeout else 0
+
+    @contextmanager
+    def _locked(self):
+        # Delay the import so this module remains importable on Windows.
+        from fcntl import flock, LOCK_EX, LOCK_UN
+
+        with open(os.path.join(self.cache_dir, '.lock'), 'w') as f:
+            flock(f, LOCK_EX)
+            try:
+                yield
+            finally:
+                flock(f, LOCK_UN)
+
+    def _list(self) -> list:
+        return [val for val in os.scandir(self.cache_dir) if val.name.endswith('.cache')]
+
+    def _prune(self) -> None:
+        entries = self._list()
+        if len(entries) <= self.threshold:
+            return
+        alive = []
+        for entry in entries:
+            if self._read(entry.path) is None:
+                self._remove(entry.path)
+            else:
+                alive.append(entry)
+        alive.sort(key=lambda val: val.stat().st_mtime)
+        for entry in alive[:max(0, len(alive) - self.threshold)]:
+            self._remove(entry.path)
+
+    @staticmethod
+    def _remove(filename: str) -> bool:
+        try:
+            os.remove(filename)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def get(self, key: str, default: Any = None) -> Any:
+        item = self._read(self._get_filename(key))
+        return default if item is None else item[1]
+
+    def set(self, key: str, value: Any, timeout: float = None) -> bool:
+        self._write(self._get_filename(key), value, self._expires_at(timeout))
+        return True
+
+    def add(self, key: str, value: Any, timeout: float = None) -> bool:
+        filename = self._get_filename(key)
+        with self._locked():
+            if self._read(filename) is not None:
+                return False
+            self._write(filename, value, self._expires_at(timeout))
+        return True
+
+    def delete(self, key: str) -> bool:
+        return self._remove(self._get_filename(key))
+
+    def clear(self) -> bool:
+        for entry in self._list():
+            self._remove(entry.path)
+        return True
+
+    def incr(self, key: str, delta: int = 1, timeout: float = None) -> int:
+        filename = self._get_filename(key)
+        with self._locked():
+            item = self._read(filename)
+            if item is None:
+                value, expires_at = delta, self._expires_at(timeout)
+            else:
+                value, expires_at = item[1] + delta, item[0]
+            self._write(filename, value, expires_at)
+        return value
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisConnection:
+    """ A minimal RESP2 connection, enough for the cache commands """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 6379, db: int = 0, password: str = None,
+                 username: str = None, timeout: float = 5):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+        if password:
+            self.execute(*(['AUTH', username, password] if username else ['AUTH', password]))
+        if db:
+            self.execute('SELECT', db)
+
+    @staticmethod
+    def encode(*args) -> bytes:
+        out = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if isinstance(arg, bytes):
+                val = arg
+            elif isinstance(arg, str):
+                val = arg.encode('utf-8')
+            else:
+                val = str(arg).encode('utf-8')
+            out.append(b'$%d\r\n%s\r\n' % (len(val), val))
+        return b''.join(out)
+
+    def read(self) -> Any:
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError('Redis connection closed')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode('utf-8')
+        if kind == b'-':
+            raise RedisError(rest.decode('utf-8'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            size = int(rest)
+            if size < 0:
+                return None
+            data = self.reader.read(size + 2)
+            return data[:-2]
+        if kind == b'*':
+            size = int(rest)
+            return None if size < 0 else [self.read() for _ in range(size)]
+        raise RedisError('Unknown reply: {!r}'.format(line))
+
+    def execute(self, *args) -> Any:
+        self.sock.sendall(self.encode(*args))
+        return self.read()
+
+    def close(self) -> None:
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisCache(BaseCache):
+    """
+    Redis (or any server speaking the Redis protocol) backend, shared by all the workers
+
+    The values are pickled, only point it to a server you trust.
+    """
+    shared = True
+    # create the counter with its expiry, then increase it
+    INCR_SCRIPT = "redis.call('SET', KEYS[1], 0, 'PX', ARGV[2], 'NX') " \
+                  "return redis.call('INCRBY', KEYS[1], ARGV[1])"
+
+    def __init__(self, url: str = 'redis://127.0.0.1:6379/0', key_prefix: str = 'shopify_utils:',
+                 default_timeout: float = 300, timeout: float = 5, max_connections: int = 10):
+        """
+        :param url: redis://[[username]:password@]host[:port][/db]
+        :param key_prefix: prefix of all the keys, `clear` only removes the keys with it
+        :param default_timeout: seconds to keep an item, 0 means forever
+        :param timeout: socket timeout
+        :param max_connections: idle connections kept in the pool
+        """
+        super().__init__(default_timeout)
+        parsed = urlparse(url)
+        if parsed.scheme != 'redis':
+            raise ValueError('Unsupported Redis url: {}'.format(url))
+        self.options = dict(
+            host=parsed.hostname or '127.0.0.1',
+            port=parsed.port or 6379,
+            db=int(parsed.path.strip('/') or 0),
+            password=unquote(parsed.password) if parsed.password else None,
+            username=unquote(parsed.username) if parsed.username else None,
+            timeout=timeout,
+        )
+        self.key_prefix = key_prefix
+        self.max_connections = max_connections
+        self._pool = []
+        self._lock = Lock()
+
+    def _get_connection(self) -> RedisConnection:
+        with self._lock:
+            if self._pool:
+                return self._pool.pop()
+        return RedisConnection(**self.options)
+
+    def execute(self, *args) -> Any:
+        """ Run a command on a pooled connection, a broken connection is dropped """
+        conn = self._get_connection()
+        try:
+            res = conn.execute(*args)
+        except RedisError:
+            self._release(conn)
+            raise
+        except BaseException:
+            conn.close()
+            raise
+        self._release(conn)
+        return res
+
+    def _release(self, conn: RedisConnection) -> None:
+        with self._lock:
+            if len(self._pool) < self.max_connections:
+                self._pool.append(conn)
+                return
+        conn.close()
+
+    def _key(self, key: str) -> str:
+        return self.key_prefix + key
+
+    def _set_args(self, key: str, value: Any, timeout: Optional[float]) -> list:
+        args = ['SET', self._key(key), dumps(value, HIGHEST_PROTOCOL)]
+        timeout = self._get_timeout(timeout)
+        if timeout:
+            args += ['PX', int(timeout * 1000)]
+        return args
+
+    def get(self, key: str, default: Any = None) -> Any:
+        res = self.execute('GET', self._key(key))
+        if res is None:
+            return default
+        # counters are stored as plain integers
+        return int(res) if res.lstrip(b'-').isdigit() else loads(res)
+
+    def set(self, key: str, value: Any, timeout: float = None) -> bool:
+        return self.execute(*self._set_args(key, value, timeout)) == 'OK'
+
+    def add(self, key: str, value: Any, timeout: float = None) -> bool:
+        return self.execute(*self._set_args(key, value, timeout), 'NX') == 'OK'
+
+    def delete(self, key: str) -> bool:
+        return self.execute('DEL', self._key(key)) > 0
+
+    def clear(self) -> bool:
+        cursor = '0'
+        while True:
+            cursor, keys = self.execute('SCAN', cursor, 'MATCH', self.key_prefix + '*', 'COUNT', 500)
+            if keys:
+                self.execute('DEL', *keys)
+            cursor = cursor.decode('utf-8') if isinstance(cursor, bytes) else cursor
+            if cursor == '0':
+                return True
+
+    def incr(self, key: str, delta: int = 1, timeout: float = None) -> int:
+        timeout = self._get_timeout(timeout)
+        if not timeout:
+            return self.execute('INCRBY', self._key(key), delta)
+        return self.execute('EVAL', self.INCR_SCRIPT, 1, self._key(key), delta, int(timeout * 1000))
+
+
+CACHE_TYPES = dict(
+    memory=lambda config: MemoryCache(
+        threshold=config.get('SHOPIFY_CACHE_THRESHOLD', 500),
+        default_timeout=config.get('SHOPIFY_CACHE_DEFAULT_TIMEOUT', 300),
+    ),
+    filesystem=lambda config: FileSystemCache(
+        cache_dir=config.get('SHOPIFY_CACHE_DIR') or os.path.join(config.get('TEMPORARY_PATH', '/tmp'), 'cache'),
+        threshold=config.get('SHOPIFY_CACHE_THRESHOLD', 500),
+        default_timeout=config.get('SHOPIFY_CACHE_DEFAULT_TIMEOUT', 300),
+    ),
+    redis=lambda config: RedisCache(
+        url=config.get('SHOPIFY_CACHE_REDIS_URL', 'redis://127.0.0.1:6379/0'),
+        key_prefix=config.get('SHOPIFY_CACHE_KEY_PREFIX', 'shopify_utils:'),
+        default_timeout=config.get('SHOPIFY_CACHE_DEFAULT_TIMEOUT', 300),
+    ),
+)
+
+
+def register_cache(name: str, factory: Callable[[dict], BaseCache]) -> None:
+    """
+    Register a cache backend for `SHOPIFY_CACHE_TYPE`
+
+    :param name: backend name
+    :param factory: callable(config) -> BaseCache
+    """
+    CACHE_TYPES[name] = factory
+
+
+def create_cache(config: dict) -> BaseCache:
+    """ Create the cache backend from `SHOPIFY_CACHE_TYPE`, a backend name or a `BaseCache` instance """
+    name = config.get('SHOPIFY_CACHE_TYPE', 'memory')
+    if isinstance(name, BaseCache):
+        return name
+    if name not in CACHE_TYPES:
+        raise ValueError('Unknown cache type: {}, available: {}'.format(name, ', '.join(CACHE_TYPES)))
+    return CACHE_TYPES[name](config)
+
+
+__all__ = (
+    'BaseCache', 'MemoryCache', 'FileSystemCache', 'RedisCache', 'RedisError', 'register_cache', 'create_cache',
+)
@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : codegen.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 22:20:00
+
+Code generation helpers of `generate_schema`: pruning the introspection to the used types, and splitting the
+sgqlc generated schema module into a package of lazily loaded modules
+"""
+import ast
+import os
+from copy import deepcopy
+from importlib import import_module
+from importlib.util import find_spec
+from typing import Dict, Iterable, List, Optional
+from graphql import parse, visit, Visitor
+from sgqlc.types import BaseItem, Schema
+
+# the first base of a generated class -> the module kind
+KINDS = {
+    'sgqlc.types.Scalar': 'enums',
+    'sgqlc.types.Enum': 'enums',
+    'sgqlc.types.Input': 'inputs',
+    'sgqlc.types.Interface': 'interfaces',
+    'sgqlc.types.Type': 'objects',
+    'sgqlc.types.relay.Connection': 'objects',
+    'sgqlc.types.Union': 'unions',
+}
+ENTRY_POINTS = ('query_type', 'mutation_type', 'subscription_type')
+
+
+class LazySchema(Schema):
+    """
+    A `sgqlc.types.Schema` which imports the module of a type on the first lookup
+
+    `modules` maps the module names of `package` to the type names they declare. The kind views
+    (e.g. `schema.enum`) only list the loaded types, iterating the schema loads all of them.
+    """
+    __slots__ = ('package', 'index', '_entry_points')
+
+    def __init__(self, package: str, modules: Dict[str, Iterable[str]], base_schema: Optional[Schema] = None):
+        self.package = package
+        self.index = {name: module for module, names in modules.items() for name in names}
+        self._entry_points = {}
+        super().__init__(base_schema)
+
+    def _load(self, key: str) -> bool:
+        module = self.index.get(key)
+        if module is None:
+            return False
+        import_module('{}.{}'.format(self.package, module))
+        return True
+
+    def load_all(self) -> None:
+        for module in sorted(set(self.index.values())):
+            import_module('{}.{}'.format(self.package, module))
+
+    def __contains__(self, key):
+        # `schema += type` checks it while the module of the type is being imported
+        return super().__contains__(key) or (self._load(key) and super().__contains__(key))
+
+    def __getitem__(self, key):
+        try:
+            return super().__getitem__(key)
+        except KeyError:
+            if not self._load(key):
+                raise
+        return super().__getitem__(key)
+
+    def __getattr__(self, key):
+        try:
+            return super().__getattr__(key)
+        except AttributeError:
+            if key.startswith('_') or not self._load(key):
+                raise
+        return super().__getattr__(key)
+
+    def __iter__(self):
+        self.load_all()
+        return super().__iter__()
+
+    def __iadd__(self, typ):
+        # `Schema.__iadd__` reads the entry points, don't resolve them while a module is being imported
+        entry_points, self._entry_points = self._entry_points, {}
+        try:
+            return super().__iadd__(typ)
+        finally:
+            for name, value in self._entry_points.items():
+                if entry_points.get(name) is None:
+                    entry_points[name] = value
+            self._entry_points = entry_points
+
+    def _get_entry_point(self, name: str):
+        value = self._entry_points.get(name)
+        if isinstance(value, str):
+            value = self._entry_points[name] = self[value]
+        return value
+
+    def _set_entry_point(self, name: str, value) -> None:
+        # a type name is resolved on the first access
+        self._entry_points[name] = value
+
+    query_type = property(lambda self: self._get_entry_point('query_type'),
+                          lambda self, value: self._set_entry_point('query_type', value))
+    mutation_type = property(lambda self: self._get_entry_point('mutation_type'),
+                             lambda self, value: self._set_entry_point('mutation_type', value))
+    subscription_type = property(lambda self: self._get_entry_point('subscription_type'),
+                                 lambda self, value: self._set_entry_point('subscription_type', value))
+
+
+class _TypeRefs(ast.NodeTransformer):
+    """
+    Replace the type references of a class body by type names, sgqlc resolves them through the schema
+
+    The built-in scalars are kept. An argument with a default value checks it against the type on
+    declaration, its type is looked up in the schema right away.
+    """
+
+    def __init__(self, schema_name: str, names: set, aliases: set):
+        self.schema_name = schema_name
+        self.names = names
+        self.aliases = aliases
+        self.used = set()
+        self.eager = False
+
+    def visit_Call(self, node: ast.Call):
+        default = next((kw.value for kw in node.keywords if kw.arg == 'default'), None)
+        if _dotted(node.func) == 'sgqlc.types.Arg' and node.args and \
+                not (default is None or (isinstance(default, ast.Constant) and default.value is None)):
+            self.eager = True
+            node.args[0] = self.visit(node.args[0])
+            self.eager = False
+            node.keywords = [self.visit(kw) for kw in node.keywords]
+            return node
+        return self.generic_visit(node)
+
+    def visit_Name(self, node: ast.Name):
+        if not isinstance(node.ctx, ast.Load):
+            return node
+        if node.id in self.aliases:
+            self.used.add(node.id)
+        elif node.id in self.names and self.eager:
+            return ast.copy_location(ast.Subscript(ast.Name(self.schema_name, ast.Load()), ast.Constant(node.id),
+                                                   ast.Load()), node)
+        elif node.id in self.names:
+            return ast.copy_location(ast.Constant(node.id), node)
+        return node
+
+
+def _dotted(node: ast.AST) -> str:
+    if isinstance(node, ast.Attribute):
+        return '{}.{}'.format(_dotted(node.value), node.attr)
+    return node.id if isinstance(node, ast.Name) else ''
+
+
+def split_schema(source: str, package_dir: str, chunk_size: int = 100) -> Dict[str, List[str]]:
+    """
+    Write the module generated by `sgqlc-codegen schema` as a package, the types are loaded on first access
+
+    The package exposes the same names: `from app.schemas.shopify import shopify, MetafieldsSetInput` only
+    loads the module declaring `MetafieldsSetInput`. The field types are replaced by type names, which sgqlc
+    resolves through the `LazySchema` when a field is used, so a module only imports the modules of its base
+    classes (interfaces) and of its union members.
+
+    :param source: the generated module
+    :param package_dir: the package directory, the previously generated modules are removed
+    :param chunk_size: types per module
+    :return: {module name: [type names]}
+    """
+    tree = ast.parse(source)
+    header = []
+    for line in source.splitlines():
+        if not line.startswith('#'):
+            break
+        header.append(line)
+
+    imports, unexports, aliases, classes, entry_points = [], [], [], [], {}
+    schema_name = None
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports.append(ast.unparse(node))
+        elif isinstance(node, ast.ClassDef):
+            classes.append(node)
+        elif isinstance(node, ast.AugAssign):
+            unexports.append(ast.unparse(node))
+        elif isinstance(node, ast.Assign) and isinstance(node.targets[0], ast.Attribute):
+            # shopify.query_type = QueryRoot
+            value = node.value.id if isinstance(node.value, ast.Name) else None
+            entry_points[node.targets[0].attr] = value
+        elif isinstance(node, ast.Assign) and _dotted(node.value.func if isinstance(node.value, ast.Call) else
+                                                      node.value) == 'sgqlc.types.Schema':
+            schema_name = node.targets[0].id
+        elif isinstance(node, ast.Assign):
+            # Boolean = sgqlc.types.Boolean
+            aliases.append(node)
+        else:
+            raise ValueError('Unexpected statement at line {}: {}'.format(node.lineno, ast.unparse(node)[:80]))
+    if schema_name is None:
+        raise ValueError('The schema declaration is not found')
+
+    # kind -> classes, in the generated (alphabetical) order
+    kinds = {}
+    for node in classes:
+        kind = KINDS.get(_dotted(node.bases[0]), 'objects') if node.bases else 'objects'
+        kinds.setdefault(kind, []).append(node)
+    modules, owners = {}, {}
+    for kind in ['enums', 'inputs', 'interfaces', 'objects', 'unions']:
+        nodes = kinds.get(kind, [])
+        for i in range(0, len(nodes), chunk_size):
+            module = '_{}_{:02d}'.format(kind, i // chunk_size + 1)
+            modules[module] = nodes[i:i + chunk_size]
+            owners.update({node.name: module for node in modules[module]})
+
+    alias_names = {target.id for node in aliases for target in node.targets}
+    os.makedirs(package_dir, exist_ok=True)
+    for filename in os.listdir(package_dir):
+        if filename.startswith('_') and filename.endswith('.py'):
+            os.remove(os.path.join(package_dir, filename))
+
+    for module, nodes in modules.items():
+        defined, bases = set(), []
+        for node in nodes:
+            for base in node.bases:
+                if isinstance(base, ast.Name) and base.id not in defined and base.id not in bases:
+                    bases.append(base.id)
+            defined.add(node.name)
+        refs = _TypeRefs(schema_name, set(owners), alias_names)
+        body = []
+        for node in nodes:
+            node.body = [refs.visit(stmt) for stmt in node.body]
+            body.append(ast.unparse(node))
+        lines = list(imports) + ['from . import {}'.format(', '.join([schema_name] + sorted(refs.used)))]
+        for base in bases:
+            lines.append('from .{} import {}'.format(owners[base], base))
+        with open(os.path.join(package_dir, module + '.py'), 'w') as f:
+            f.write('\n'.join(lines) + '\n\n\n' + '\n\n\n'.join(body) + '\n')
+
+    lines = header + list(imports) + ['from flask_shopify_utils.codegen import LazySchema', '', '']
+    lines.append('{} = LazySchema(__name__, {{'.format(schema_name))
+    for module, nodes in modules.items():
+        lines.append('    {!r}: ({}),'.format(module, ''.join('{!r}, '.format(node.name) for node in nodes).rstrip()))
+    lines += ['})', '', '', '# Unexport Node/PageInfo, let schema re-declare them'] + unexports + ['']
+    lines += [ast.unparse(node) for node in aliases] + ['']
+    for name in ENTRY_POINTS:
+        value = entry_points.get(name)
+        lines.append('{}.{} = {!r}'.format(schema_name, name, value))
+    lines += [
+        '', '',
+        'def __getattr__(name):',
+        '    try:',
+        '        return {}[name]'.format(schema_name),
+        '    except KeyError:',
+        "        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name)) from None",
+    ]
+    with open(os.path.join(package_dir, '__init__.py'), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return {module: [node.name for node in nodes] for module, nodes in modules.items()}
+
+
+class _DocumentNames(Visitor):
+    """ The field and type names of a GraphQL document """
+
+    def __init__(self, names: set):
+        super().__init__()
+        self.names = names
+
+    def enter_field(self, node, *args):
+        self.names.add(node.name.value)
+
+    def enter_named_type(self, node, *args):
+        self.names.add(node.name.value)
+
+
+def _operation_files(path: str) -> List[str]:
+    """ A file, a directory or a dotted module name (e.g. `app.schemas.default_query`) """
+    if not os.path.exists(path):
+        spec = find_spec(path)
+        if spec is None or not spec.origin:
+            raise ValueError('Operation module not found: {}'.format(path))
+        path = spec.origin
+    if not os.path.isdir(path):
+        return [path]
+    files = []
+    for root, dirs, filenames in os.walk(path):
+        files.extend(os.path.join(root, name) for name in sorted(filenames)
+                     if name.endswith(('.py', '.graphql', '.gql')))
+    return files
+
+
+def scan_operations(paths: Iterable[str]) -> set:
+    """
+    The names which operations may use: identifiers and strings of the Python modules (`op.webhook_subscriptions`,
+    `MetafieldsSetInput`, `__fields__('id')`), and the field and type names of the `.graphql` documents
+
+    :param paths: files, directories or dotted module names
+    """
+    names = set()
+    for path in paths:
+        for file_path in _operation_files(path):
+            with open(file_path, 'r') as f:
+                source = f.read()
+            if not file_path.endswith('.py'):
+                visit(parse(source), _DocumentNames(names))
+                continue
+            for node in ast.walk(ast.parse(source)):
+                if isinstance(node, ast.Name):
+                    names.add(node.id)
+                elif isinstance(node, ast.Attribute):
+                    names.add(node.attr)
+                elif isinstance(node, ast.keyword) and node.arg:
+                    names.add(node.arg)
+                elif isinstance(node, ast.alias):
+                    names.add(node.name)
+                elif isinstance(node, ast.Constant) and isinstance(node.value, str) and node.value.isidentifier():
+                    names.add(node.value)
+    return names
+
+
+def _named(ref: dict) -> str:
+    while ref.get('ofType'):
+        ref = ref['ofType']
+    return ref['name']
+
+
+def prune_introspection(data: dict, names: set) -> dict:
+    """
+    Keep the types reachable from the names of `scan_operations`
+
+    The object types keep their scalar and enum fields, which sgqlc selects for a field called without
+    sub-fields (e.g. `mutation.user_errors()`), and the other fields named in `names` (either the GraphQL or the
+    Python name). Inputs, enums and the arguments of the kept fields are kept whole. Unions keep the members named
+    in `names`, or all of them.
+
+    :param data: the introspection result, `{"data": {"__schema": ...}}` or `{"__schema": ...}`
+    :param names: the used names
+    :return: a pruned copy of `data`
+    """
+    data = deepcopy(data)
+    schema = data['data']['__schema'] if 'data' in data else data['__schema']
+    types = {t['name']: t for t in schema['types']}
+    roots = [schema[key]['name'] for key in ('queryType', 'mutationType', 'subscriptionType') if schema.get(key)]
+
+    def used(field: dict) -> bool:
+        return field['name'] in names or BaseItem._to_python_name(field['name']) in names
+
+    kept, queue = {}, roots + sorted(name for name in names if name in types)
+    while queue:
+        name = queue.pop()
+        if name in kept:
+            continue
+        t = kept[name] = types[name]
+        if t['kind'] in ('OBJECT', 'INTERFACE'):
+            # a field selected without sub-fields selects the scalar and enum fields of its type
+            fields = [f for f in t['fields'] if used(f) or types[_named(f['type'])]['kind'] in ('SCALAR', 'ENUM')]
+            t['fields'] = fields
+            for f in fields:
+                queue.append(_named(f['type']))
+                queue.extend(_named(arg['type']) for arg in f['args'])
+        elif t['kind'] == 'INPUT_OBJECT':
+            queue.extend(_named(f['type']) for f in t['inputFields'])
+        elif t['kind'] == 'UNION':
+            t['possibleTypes'] = [p for p in t['possibleTypes'] if p['name'] in names] or t['possibleTypes']
+            queue.extend(p['name'] for p in t['possibleTypes'])
+
+    for t in kept.values():
+        if t.get('interfaces'):
+            t['interfaces'] = [i for i in t['interfaces'] if i['name'] in kept]
+            # a type declares the fields of its interfaces
+            fields = {f['name'] for f in t['fields']}
+            for i in t['interfaces']:
+                t['fields'].extend(f for f in kept[i['name']]['fields'] if f['name'] not in fields)
+                fields.update(f['name'] for f in kept[i['name']]['fields'])
+        if t['kind'] == 'INTERFACE' and t.get('possibleTypes'):
+            t['possibleTypes'] = [p for p in t['possibleTypes'] if p['name'] in kept]
+    schema['types'] = [t for t in schema['types'] if t['name'] in kept or t['name'].startswith('__')]
+    return data
+
+
+__all__ = ('LazySchema', 'split_schema', 'scan_operations', 'prune_introspection')
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : dedup.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 18:10:00
+
+Shopify delivers the webhooks at least once, drop the deliveries that have been handled
+"""
+from hashlib import blake2b
+from math import ceil, log
+from threading import Lock
+from time import monotonic
+from typing import List, Mapping
+from flask_shopify_utils.cache import BaseCache
+
+
+class BloomFilter:
+    """ Fixed size Bloom filter, no false negative and about `error_rate` false positive """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.size = max(8, ceil(-capacity * log(error_rate) / (log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _indexes(self, key: str):
+        digest = blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str) -> None:
+        for index in self._indexes(key):
+            self.bits[index >> 3] |= 1 << (index & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[index >> 3] & (1 << (index & 7)) for index in self._indexes(key))
+
+
+class WindowedBloomFilter:
+    """
+    Two Bloom filters rotated every `window` seconds
+
+    A key is remembered for `window` to `2 * window` seconds, and the memory never grows.
+    """
+
+    def __init__(self, capacity: int, window: float, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.window = window
+        self.error_rate = error_rate
+        self.current = BloomFilter(capacity, error_rate)
+        self.previous = None
+        self.rotated_at = monotonic()
+        self._lock = Lock()
+
+    def _rotate(self) -> None:
+        if monotonic() - self.rotated_at >= self.window:
+            self.previous = self.current
+            self.current = BloomFilter(self.capacity, self.error_rate)
+            self.rotated_at = monotonic()
+
+    def add(self, key: str) -> None:
+        with self._lock:
+            self._rotate()
+            self.current.add(key)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            self._rotate()
+            return key in self.current or (self.previous is not None and key in self.previous)
+
+
+class WebhookDeduplicator:
+    """
+    Remember the handled webhooks by `X-Shopify-Webhook-Id` and `X-Shopify-Event-Id`
+
+    A key in the process-local Bloom filter is confirmed by the cache, so a false positive never drops
+    a webhook. With a process-local cache the new deliveries skip the lookup, with a shared cache every
+    key is looked up so the deliveries handled by the other workers are dropped too.
+    """
+
+    def __init__(self, cache: BaseCache, window: float = 86400, capacity: int = 100000):
+        """
+        :param cache: the confirm step, it must be shared for the deduplication across workers
+        :param window: seconds to remember a webhook
+        :param capacity: expected webhooks per window, it sizes the Bloom filter
+        """
+        # a bounded cache would evict the ids before the window is over
+        if getattr(cache, 'threshold', capacity) < capacity:
+            raise ValueError('The cache keeps {} items, less than the capacity {}'.format(cache.threshold, capacity))
+        self.cache = cache
+        self.window = window
+        self.bloom = WindowedBloomFilter(capacity, window)
+
+    @staticmethod
+    def get_keys(headers: Mapping) -> List[str]:
+        keys = []
+        if webhook_id := headers.get('X-Shopify-Webhook-Id'):
+            keys.append('webhook:{}'.format(webhook_id))
+        # one event triggers the webhooks of all the subscriptions, keep the topic
+        if event_id := headers.get('X-Shopify-Event-Id'):
+            keys.append('webhook_event:{}:{}'.format(headers.get('X-Shopify-Topic', ''), event_id))
+        return keys
+
+    def is_duplicate(self, keys: List[str]) -> bool:
+        for key in keys:
+            if key in self.bloom or self.cache.shared:
+                if self.cache.get(key) is not None:
+                    return True
+        return False
+
+    def remember(self, keys: List[str]) -> None:
+        for key in keys:
+            self.bloom.add(key)
+            self.cache.set(key, 1, timeout=self.window)
+
+
+__all__ = (
+    'BloomFilter', 'WindowedBloomFilter', 'WebhookDeduplicator',
+)
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : lock.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 21:30:00
+
+Lock backends of `ShopifyUtil.prevent_concurrency`
+"""
+import os
+from contextlib import contextmanager
+from hashlib import blake2b, sha1
+from sys import platform
+from threading import Event, Thread
+from time import monotonic, sleep
+from typing import Any, Callable, Iterator, Optional
+from sqlalchemy import text
+from flask_shopify_utils.cache import RedisCache, RedisError
+
+
+class LockError(RuntimeError):
+    """ The lock is held by another process """
+
+
+class Lease:
+    """
+    A held lock
+
+    `token` is a fencing token for the backends which issue one (`redis`), it grows with every lease of the
+    key. Pass it along with the writes, so a storage can reject a holder whose lease has expired meanwhile.
+    """
+
+    def __init__(self, key: str, token: Optional[int] = None, handle: Any = None):
+        self.key = key
+        self.token = token
+        self.handle = handle
+        # set when the lease could not be renewed
+        self.lost = Event()
+
+    @property
+    def valid(self) -> bool:
+        return not self.lost.is_set()
+
+
+class BaseLock:
+    """ The lock interface, the backends implement `_try_acquire` and `release` """
+
+    def _try_acquire(self, key: str) -> Optional[Lease]:
+        raise NotImplementedError
+
+    def release(self, lease: Lease) -> None:
+        raise NotImplementedError
+
+    def acquire(self, key: str, blocking: bool = False, timeout: Optional[float] = None,
+                interval: float = 0.05) -> Lease:
+        """
+        Acquire the lock of `key`
+
+        :param key: the lock name
+        :param blocking: wait for the lock instead of failing right away
+        :param timeout: seconds to wait in the blocking mode, None waits forever
+        :param interval: the first polling interval, it doubles up to 1 second
+        :raise LockError: the lock is held by another process
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            lease = self._try_acquire(key)
+            if lease is not None:
+                return lease
+            if not blocking or (deadline is not None and monotonic() >= deadline):
+                raise LockError('{} is already running'.format(key))
+            delay = interval if deadline is None else min(interval, max(0.0, deadline - monotonic()))
+            sleep(delay)
+            interval = min(interval * 2, 1)
+
+    @contextmanager
+    def hold(self, key: str, blocking: bool = False, timeout: Optional[float] = None) -> Iterator[Lease]:
+        lease = self.acquire(key, blocking=blocking, timeout=timeout)
+        try:
+            yield lease
+        finally:
+            self.release(lease)
+
+
+class FileLock(BaseLock):
+    """
+    `fcntl.flock` on a file per key, it only works across the processes of one host
+
+    The file is removed on release. A process which opened the file before it was removed checks the inode
+    after locking and tries again, so two processes never hold the lock of a key.
+    """
+
+    def __init__(self, lock_dir: str):
+        if platform.startswith('win'):
+            raise RuntimeError('The file lock is not supported on Windows (requires POSIX fcntl.flock).')
+        self.lock_dir = lock_dir
+        os.makedirs(lock_dir, exist_ok=True)
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.lock_dir, 'worker-{}.lock'.format(key))
+
+    def _try_acquire(self, key: str) -> Optional[Lease]:
+        # Delay the import so this module remains importable on Windows.
+        from fcntl import flock, LOCK_EX, LOCK_NB
+
+        file_path = self.get_path(key)
+        while True:
+            f = open(file_path, 'a')
+            try:
+                flock(f, LOCK_EX | LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                return None
+            try:
+                if os.stat(file_path).st_ino == os.fstat(f.fileno()).st_ino:
+                    return Lease(key, handle=f)
+            except FileNotFoundError:
+                pass
+            # the file was removed by the previous holder
+            f.close()
+
+    def release(self, lease: Lease) -> None:
+        from fcntl import flock, LOCK_UN
+
+        try:
+            os.unlink(self.get_path(lease.key))
+        except FileNotFoundError:
+            pass
+        flock(lease.handle, LOCK_UN)
+        lease.handle.close()
+
+
+class DatabaseLock(BaseLock):
+    """
+    Advisory locks of the database, shared by all the app nodes
+
+    PostgreSQL uses `pg_try_advisory_lock` and MySQL/MariaDB `GET_LOCK`, on a connection held until the
+    release. The lock is dropped by the database if the process dies. SQLite can only be shared by the
+    processes of one host, it falls back to `FileLock`.
+    """
+
+    def __init__(self, engine, lock_dir: str = '/tmp', prefix: str = 'shopify_utils:'):
+        self.engine = engine
+        self.prefix = prefix
+        self._fallback = None
+        if engine.dialect.name not in ['postgresql', 'mysql', 'mariadb']:
+            self._fallback = FileLock(lock_dir)
+
+    def _lock_id(self, key: str) -> int:
+        """ A signed bigint of the key for the PostgreSQL advisory locks """
+        return int.from_bytes(blake2b((self.prefix + key).encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+    def _lock_name(self, key: str) -> str:
+        """ MySQL lock names are limited to 64 characters """
+        return self.prefix + sha1(key.encode('utf-8')).hexdigest()
+
+    def _try_acquire(self, key: str) -> Optional[Lease]:
+        if self._fallback is not None:
+            return self._fallback._try_acquire(key)
+        # the lock belongs to the session, keep the connection out of a transaction
+        conn = self.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+        try:
+            if self.engine.dialect.name == 'postgresql':
+                acquired = conn.execute(text('SELECT pg_try_advisory_lock(:id)'), dict(id=self._lock_id(key))).scalar()
+            else:
+                acquired = conn.execute(text('SELECT GET_LOCK(:name, 0)'), dict(name=self._lock_name(key))).scalar()
+        except BaseException:
+            conn.close()
+            raise
+        if not acquired:
+            conn.close()
+            return None
+        return Lease(key, handle=conn)
+
+    def release(self, lease: Lease) -> None:
+        if self._fallback is not None:
+            return self._fallback.release(lease)
+        conn = lease.handle
+        try:
+            if self.engine.dialect.name == 'postgresql':
+                conn.execute(text('SELECT pg_advisory_unlock(:id)'), dict(id=self._lock_id(lease.key)))
+            else:
+                conn.execute(text('SELECT RELEASE_LOCK(:name)'), dict(name=self._lock_name(lease.key)))
+        except BaseException:
+            # a closed session drops its locks
+            conn.invalidate()
+            raise
+        finally:
+            conn.close()
+
+
+class RedisLock(BaseLock):
+    """
+    A lease in Redis with a fencing token, renewed in the background while it is held
+
+    The lease expires after `ttl` seconds if the process dies. A renewal thread extends it every `ttl / 3`
+    seconds, and sets `Lease.lost` if the lease has been taken over (e.g. the process was paused longer than
+    `ttl`). The release only deletes the key if it still holds the lease token.
+    """
+    RELEASE_SCRIPT = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) " \
+                     "else return 0 end"
+    RENEW_SCRIPT = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('PEXPIRE', KEYS[1], ARGV[2]) " \
+                   "else return 0 end"
+
+    def __init__(self, cache: RedisCache, ttl: float = 30, renew: bool = True):
+        """
+        :param cache: the Redis connection pool and the key prefix
+        :param ttl: seconds a lease lives without a renewal
+        :param renew: renew the leases in the background
+        """
+        self.cache = cache
+        self.ttl = ttl
+        self.renew = renew
+
+    def _key(self, key: str) -> str:
+        return '{}lock:{}'.format(self.cache.key_prefix, key)
+
+    def _try_acquire(self, key: str) -> Optional[Lease]:
+        token = self.cache.execute('INCR', '{}lock_fence:{}'.format(self.cache.key_prefix, key))
+        if self.cache.execute('SET', self._key(key), token, 'NX', 'PX', int(self.ttl * 1000)) != 'OK':
+            return None
+        lease = Lease(key, token=token)
+        if self.renew:
+            lease.handle = Event()
+            Thread(target=self._renew, args=(lease,), daemon=True).start()
+        return lease
+
+    def _renew(self, lease: Lease) -> None:
+        stopped = lease.handle
+        while not stopped.wait(self.ttl / 3):
+            try:
+                renewed = self.cache.execute('EVAL', self.RENEW_SCRIPT, 1, self._key(lease.key), lease.token,
+                                             int(self.ttl * 1000))
+            except (OSError, RedisError):
+                # try again, the lease is still valid for a while
+                continue
+            if not renewed:
+                lease.lost.set()
+                return
+
+    def release(self, lease: Lease) -> None:
+        if lease.handle is not None:
+            lease.handle.set()
+        self.cache.execute('EVAL', self.RELEASE_SCRIPT, 1, self._key(lease.key), lease.token)
+
+
+LOCK_TYPES = dict(
+    file=lambda utils: FileLock(utils.config.get('SHOPIFY_LOCK_DIR') or utils.config.get('TEMPORARY_PATH', '/tmp')),
+    database=lambda utils: DatabaseLock(
+        utils.db.get_bind(),
+        lock_dir=utils.config.get('SHOPIFY_LOCK_DIR') or utils.config.get('TEMPORARY_PATH', '/tmp'),
+        prefix=utils.config.get('SHOPIFY_CACHE_KEY_PREFIX', 'shopify_utils:'),
+    ),
+    redis=lambda utils: RedisLock(
+        utils.cache if isinstance(utils.cache, RedisCache) else RedisCache(
+            url=utils.config.get('SHOPIFY_CACHE_REDIS_URL', 'redis://127.0.0.1:6379/0'),
+            key_prefix=utils.config.get('SHOPIFY_CACHE_KEY_PREFIX', 'shopify_utils:'),
+        ),
+        ttl=utils.config.get('SHOPIFY_LOCK_TTL', 30),
+    ),
+)
+
+
+def register_lock(name: str, factory: Callable[[Any], BaseLock]) -> None:
+    """
+    Register a lock backend for `SHOPIFY_LOCK_TYPE`
+
+    :param name: backend name
+    :param factory: callable(ShopifyUtil) -> BaseLock
+    """
+    LOCK_TYPES[name] = factory
+
+
+def create_lock(utils) -> BaseLock:
+    """ Create the lock backend from `SHOPIFY_LOCK_TYPE`, a backend name or a `BaseLock` instance """
+    name = utils.config.get('SHOPIFY_LOCK_TYPE', 'file')
+    if isinstance(name, BaseLock):
+        return name
+    if name not in LOCK_TYPES:
+        raise ValueError('Unknown lock type: {}, available: {}'.format(name, ', '.join(LOCK_TYPES)))
+    return LOCK_TYPES[name](utils)
+
+
+__all__ = (
+    'LockError', 'Lease', 'BaseLock', 'FileLock', 'DatabaseLock', 'RedisLock', 'register_lock', 'create_lock',
+)
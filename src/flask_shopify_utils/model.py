@@ -9,8 +9,7 @@
 from typing import ClassVar
 from flask_sqlalchemy import SQLAlchemy
 from flask_sqlalchemy.query import Query
-from simplejson import loads, dumps
-from . import current_time_func as current_time, sqlalchemy_instance as db
+from . import current_time_func as current_time, sqlalchemy_instance as db, serializer
 
 if db is None or not isinstance(db, SQLAlchemy):
     raise RuntimeError('Please initialize the SQLAlchemy instance first.')
@@ -43,7 +42,7 @@ class BasicMethod:
 
     @staticmethod
     def get_status(name: str):
-        names = dict(wait=0, done=1, error=2, ignore=3, unknown=9)
+        names = dict(wait=0, done=1, error=2, ignore=3, processing=4, unknown=9)
         return names.get(name, 9)
 
 
@@ -59,12 +58,12 @@ class Store(db.Model, BasicMethod):
     updated_at = db.Column(db.DateTime, default=current_time, onupdate=current_time)
 
     def get_extra(self) -> dict:
-        return loads(self.extra) if self.extra else {}
+        return serializer.loads(self.extra) if self.extra else {}
 
     def set_extra(self, data: dict) -> None:
         extra = self.get_extra()
         extra.update(data)
-        self.extra = dumps(extra)
+        self.extra = serializer.dumps(extra)
 
 
 class Webhook(db.Model, BasicMethod):
@@ -86,10 +85,10 @@ class Webhook(db.Model, BasicMethod):
     updated_at = db.Column(db.DateTime, default=current_time, onupdate=current_time)
 
     def get_data(self) -> dict:
-        return {} if not self.data else loads(self.data)
+        return {} if not self.data else serializer.loads(self.data)
 
     def set_data(self, data: dict) -> None:
-        self.data = dumps(data)
+        self.data = serializer.dumps(data)
 
 
 __all__ = (Store, Webhook, BasicMethod)
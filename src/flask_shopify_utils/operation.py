@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : operation.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 22:50:00
+
+Operation builders compiled once into a GraphQL document with `$variables`, and the persisted queries
+"""
+import json
+from functools import partial, wraps
+from hashlib import sha256
+from inspect import signature
+from threading import Lock
+from typing import Any, Callable, Dict, Optional
+from graphql import parse_value, value_from_ast_untyped
+from sgqlc.operation import Operation, Selection
+from sgqlc.types import Variable
+from flask_shopify_utils import serializer
+
+
+class CompiledOperation:
+    """ The operation of a builder, rendered once """
+
+    def __init__(self, operation: Operation, variables: Dict[str, Any],
+                 build: Callable[[str], Operation] = None):
+        """
+        :param operation: the operation built with `Variable` arguments
+        :param variables: {name: GraphQL type}, e.g. {'cursor': 'String'}, or the sgqlc type of the argument
+        :param build: callable(prefix) -> the operation with the variables renamed to `$<prefix><name>`
+        """
+        definitions = ', '.join('${}: {}'.format(name, typ) for name, typ in variables.items())
+        self.operation = operation
+        self.variables = {name: str(typ) for name, typ in variables.items()}
+        # the sgqlc types convert the values, e.g. the dicts of input objects
+        self.input_types = {name: typ for name, typ in variables.items() if not isinstance(typ, str)}
+        self.build = build
+        # compact for the requests, indented for the logs
+        self.document = _declare(bytes(operation).decode('utf-8'), definitions)
+        self.text = _declare(str(operation), definitions)
+        self.data = self.document.encode('utf-8')
+
+
+class PreparedOperation:
+    """
+    A compiled operation and the variables of one call
+
+    `GraphQLClient.fetch_data` sends the cached document and the variables, `str()` is the indented document and
+    `prepared + data` interprets the response like `Operation + data`.
+    """
+    __slots__ = ('compiled', 'variables')
+
+    def __init__(self, compiled: CompiledOperation, variables: dict):
+        self.compiled = compiled
+        self.variables = variables
+
+    @property
+    def document(self) -> str:
+        return self.compiled.document
+
+    def __str__(self):
+        return self.compiled.text
+
+    def __bytes__(self):
+        return self.compiled.data
+
+    def __add__(self, other):
+        return self.compiled.operation + other
+
+    def __repr__(self):
+        return '<PreparedOperation {!r} variables={!r}>'.format(self.compiled.text.split('\n', 1)[0], self.variables)
+
+
+def _declare(document: str, definitions: str) -> str:
+    """ Add the variable definitions after the operation name """
+    if not definitions:
+        return document
+    head, sep, tail = document.partition(' {')
+    return '{}({}){}{}'.format(head, definitions, sep, tail)
+
+
+def _variable_types(selections, names: set, types: dict) -> None:
+    """ The GraphQL types of the field arguments which received a `Variable` """
+    for selection in selections:
+        if not isinstance(selection, Selection):
+            continue
+        field = selection.__field__
+        for key, value in selection.__args__.items():
+            if isinstance(value, Variable) and value.name in names and value.name not in types:
+                types[value.name] = field.args[key].type
+        children = list(selection)
+        if children != [selection]:
+            _variable_types(children, names, types)
+
+
+def _has_dict(value) -> bool:
+    if isinstance(value, dict):
+        return True
+    return isinstance(value, (list, tuple)) and any(_has_dict(v) for v in value)
+
+
+def to_variable(value, typ=None):
+    """
+    The JSON value of a variable: sgqlc inputs are converted to dicts of GraphQL names
+
+    :param typ: the sgqlc type of the argument, the dicts may use the Python names like the inlined arguments
+    """
+    if typ is not None and _has_dict(value):
+        # the same conversion as an inlined argument
+        return value_from_ast_untyped(parse_value(typ.__to_graphql_input__(value, 0, '')))
+    if hasattr(value, '__to_json_value__'):
+        return value.__to_json_value__()
+    if isinstance(value, (list, tuple)):
+        return [to_variable(v) for v in value]
+    if isinstance(value, dict):
+        return {k: to_variable(v) for k, v in value.items()}
+    return value
+
+
+def prepared_operation(*names: str, max_shapes: int = 64, **types: str) -> Callable:
+    """
+    Compile an `Operation` builder once, every call returns the cached document and a variables dict
+
+    The builder is called once with a `sgqlc.types.Variable` for each variable parameter. The GraphQL types are
+    taken from the field arguments receiving them, or from `types` for the variables nested in a list or an input
+    object. The other parameters shape the document (e.g. the page size), one document is compiled per value.
+
+    ```python
+    @prepared_operation('cursor')
+    def query_webhooks(cursor: str = None, first: int = 20) -> Operation:
+        op = Operation(shopify_schema.query_type, 'QueryWebhooks')
+        query = op.webhook_subscriptions(first=first, after=cursor)
+        ...
+
+    client.fetch_data(query_webhooks(cursor))  # query QueryWebhooks($cursor: String) {...}, {"cursor": "..."}
+    ```
+
+    :param names: the variable parameters of the builder, the types are inferred
+    :param max_shapes: the maximum number of documents per builder
+    :param types: the variable parameters with an explicit GraphQL type, e.g. `data='[MetafieldsSetInput!]!'`
+    """
+    variable_names = list(names) + [name for name in types if name not in names]
+
+    def decorator(builder: Callable[..., Operation]) -> Callable[..., PreparedOperation]:
+        sig = signature(builder)
+        unknown = [name for name in variable_names if name not in sig.parameters]
+        if unknown:
+            raise ValueError('{} has no parameter: {}'.format(builder.__name__, ', '.join(unknown)))
+        compiled = {}
+
+        def build_shape(arguments: dict, prefix: str = '') -> Operation:
+            # keep the parameter names, they are the keys of the variables dict
+            return builder(**dict(arguments, **{name: Variable(name, prefix + name) for name in variable_names}))
+
+        def compile_shape(arguments: dict) -> CompiledOperation:
+            operation = build_shape(arguments)
+            found = dict(types)
+            _variable_types(operation, set(variable_names), found)
+            missing = [name for name in variable_names if name not in found]
+            if missing:
+                raise ValueError('The type of ${} is unknown, pass it to prepared_operation'.format(missing[0]))
+            return CompiledOperation(operation, {name: found[name] for name in variable_names},
+                                     build=partial(build_shape, arguments))
+
+        @wraps(builder)
+        def wrapper(*args, **kwargs) -> PreparedOperation:
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            shape = {k: v for k, v in bound.arguments.items() if k not in variable_names}
+            key = tuple(shape.items())
+            try:
+                operation = compiled[key]
+            except KeyError:
+                if len(compiled) >= max_shapes:
+                    compiled.clear()
+                operation = compiled[key] = compile_shape(shape)
+            except TypeError:
+                # an unhashable shape argument, e.g. a dict of aliases
+                operation = compile_shape(shape)
+            return PreparedOperation(operation, {
+                name: to_variable(bound.arguments[name], operation.input_types.get(name)) for name in variable_names
+            })
+
+        wrapper.build = builder
+        wrapper.compiled = compiled
+        return wrapper
+
+    return decorator
+
+
+def get_document(query, variables: dict = None) -> tuple:
+    """
+    The query and the variables to send, a `PreparedOperation` sends its cached document
+
+    :param query: an `Operation`, a `PreparedOperation` or a GraphQL string
+    :param variables: extra variables, they extend the variables of a `PreparedOperation`
+    """
+    if isinstance(query, PreparedOperation):
+        variables = dict(query.variables, **variables) if variables else query.variables
+        query = query.document
+    return query, variables
+
+
+class PersistedQuery:
+    """
+    A query text hashed and JSON encoded once
+
+    The request bodies are the cached prefix of the mode followed by the encoded variables, a body without
+    variables is cached as a whole. The modes follow the automatic persisted queries protocol (APQ):
+    `query` sends the text, `hash` only the SHA-256 and `both` registers the text under the hash.
+    """
+    __slots__ = ('query', 'sha256', '_prefixes', '_bodies')
+
+    def __init__(self, query: str):
+        self.query = query
+        self.sha256 = sha256(query.encode('utf-8')).hexdigest()
+        text = b'"query":' + json.dumps(query).encode('utf-8')
+        extensions = b'"extensions":{"persistedQuery":{"version":1,"sha256Hash":"%s"}}' % self.sha256.encode('ascii')
+        self._prefixes = dict(
+            query=b'{' + text + b',"variables":',
+            hash=b'{' + extensions + b',"variables":',
+            both=b'{' + text + b',' + extensions + b',"variables":',
+        )
+        self._bodies = {}
+
+    def encode(self, variables: dict = None, mode: str = 'query') -> 'EncodedBody':
+        """ The request body of the query """
+        if variables is None:
+            data = self._bodies.get(mode)
+            if data is None:
+                data = self._bodies[mode] = self._prefixes[mode] + b'null}'
+        else:
+            data = self._prefixes[mode] + serializer.current_backend().dumps(variables) + b'}'
+        return EncodedBody(self, data)
+
+
+class EncodedBody:
+    """ A request body ready to send, the endpoints of `flask_shopify_utils.utils` send it as is """
+    __slots__ = ('persisted', 'data')
+
+    def __init__(self, persisted: PersistedQuery, data: bytes):
+        self.persisted = persisted
+        self.data = data
+
+    def __str__(self):
+        return self.persisted.query
+
+    def __bytes__(self):
+        # the sgqlc endpoints log the errors with the query text
+        return self.persisted.query.encode('utf-8')
+
+
+class QueryRegistry:
+    """
+    The persisted queries of the process, by text and by SHA-256
+
+    A query text is hashed and encoded the first time it is sent. The hosts which don't support the APQ
+    protocol are remembered, `GraphQLClient` sends them the text right away.
+    """
+
+    def __init__(self, threshold: int = 1000):
+        """
+        :param threshold: the maximum number of queries, the registry is cleared when it is full
+        """
+        self.threshold = threshold
+        self.unsupported = set()
+        self._queries = {}
+        self._hashes = {}
+        self._lock = Lock()
+
+    def register(self, query: str) -> PersistedQuery:
+        persisted = self._queries.get(query)
+        if persisted is None:
+            persisted = PersistedQuery(query)
+            with self._lock:
+                if len(self._queries) >= self.threshold:
+                    self._queries.clear()
+                    self._hashes.clear()
+                self._queries[query] = persisted
+                self._hashes[persisted.sha256] = persisted
+        return persisted
+
+    def get(self, sha: str) -> Optional[PersistedQuery]:
+        """ The query of a SHA-256 hash """
+        return self._hashes.get(sha)
+
+    def __len__(self):
+        return len(self._queries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._queries.clear()
+            self._hashes.clear()
+            self.unsupported.clear()
+
+
+# Shared by all GraphQLClient instances of the process
+query_registry = QueryRegistry()
+
+
+__all__ = (
+    'CompiledOperation', 'PreparedOperation', 'prepared_operation', 'to_variable', 'get_document',
+    'PersistedQuery', 'EncodedBody', 'QueryRegistry', 'query_registry',
+)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : pagination.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 20:20:00
+
+Keyset (cursor) pagination, a page costs the same on page 1 and page 10000
+"""
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from binascii import Error as BinasciiError
+from datetime import datetime, date
+from json import loads, dumps
+from typing import Any, List, Optional
+from sqlalchemy import and_, or_, func, inspect, select as sa_select
+from sqlalchemy.orm import Session
+
+
+def encode_cursor(values: list, direction: str) -> str:
+    """ An opaque cursor of the sort values of a row, `direction` is `next` or `prev` """
+    payload = []
+    for value in values:
+        if isinstance(value, datetime):
+            value = {'dt': value.isoformat()}
+        elif isinstance(value, date):
+            value = {'d': value.isoformat()}
+        payload.append(value)
+    data = dumps(dict(v=payload, d=direction), separators=(',', ':')).encode('utf-8')
+    return urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    Decode a cursor of `encode_cursor`
+
+    :raise ValueError: the cursor is invalid
+    """
+    try:
+        data = loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        values = []
+        for value in data['v']:
+            if isinstance(value, dict):
+                value = datetime.fromisoformat(value['dt']) if 'dt' in value else date.fromisoformat(value['d'])
+            values.append(value)
+        if data['d'] not in ('next', 'prev'):
+            raise ValueError
+        return values, data['d']
+    except (BinasciiError, UnicodeDecodeError, KeyError, TypeError, ValueError):
+        raise ValueError('Invalid cursor') from None
+
+
+class CursorPagination:
+    """ A page of `cursor_paginate`, the counterpart of the Flask-SQLAlchemy `Pagination` """
+
+    def __init__(self, items: list, per_page: int, next_cursor: Optional[str] = None,
+                 prev_cursor: Optional[str] = None, total: Optional[int] = None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self) -> bool:
+        return self.prev_cursor is not None
+
+
+def cursor_paginate(session: Session, select, column, per_page: int = 20, cursor: Optional[str] = None,
+                    desc: bool = True, with_total: bool = False) -> CursorPagination:
+    """
+    Paginate a select on an indexed column, without `OFFSET` and without `COUNT(*)` unless `with_total`
+
+    The primary key breaks the ties of a column that isn't unique, such as `created_at`. Index the pair
+    (e.g. `(store_id, created_at, id)`) to keep every page an index range scan.
+
+    :param session: the SQLAlchemy session
+    :param select: `db.select(Model)` with the filters, without `ORDER BY`
+    :param column: the sort column, e.g. `Webhook.id` or `Webhook.created_at`
+    :param per_page: items per page
+    :param cursor: `next_cursor` or `prev_cursor` of a page, None for the first page
+    :param desc: newest first
+    :param with_total: count the rows of the select
+    :raise ValueError: the cursor is invalid
+    """
+    mapper = inspect(column.class_)
+    pk = mapper.get_property_by_column(mapper.primary_key[0]).class_attribute
+    columns = [column] if column.key == pk.key else [column, pk]
+    values, direction = decode_cursor(cursor) if cursor else ([], 'next')
+    if cursor and len(values) != len(columns):
+        raise ValueError('Invalid cursor')
+    # walking back reverses the order, the rows are reversed again below
+    forward = direction == 'next'
+    descending = desc if forward else not desc
+
+    stmt = select
+    if values:
+        stmt = stmt.where(_after(columns, values, descending))
+    order = [col.desc() if descending else col.asc() for col in columns]
+    rows = session.execute(stmt.order_by(*order).limit(per_page + 1)).scalars().all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if more or not forward:
+            next_cursor = encode_cursor(_values(rows[-1], columns), 'next')
+        if (more and not forward) or (forward and values):
+            prev_cursor = encode_cursor(_values(rows[0], columns), 'prev')
+    total = None
+    if with_total:
+        total = session.execute(sa_select(func.count()).select_from(select.order_by(None).subquery())).scalar()
+    return CursorPagination(rows, per_page, next_cursor, prev_cursor, total)
+
+
+def _values(row: Any, columns: list) -> List[Any]:
+    return [getattr(row, col.key) for col in columns]
+
+
+def _after(columns: list, values: list, descending: bool):
+    """ (a, b) < (x, y) as `a < x OR (a = x AND b < y)`, it works on every database """
+    conditions = []
+    for i, col in enumerate(columns):
+        compare = col < values[i] if descending else col > values[i]
+        conditions.append(and_(*[columns[j] == values[j] for j in range(i)], compare))
+    return or_(*conditions)
+
+
+__all__ = ('CursorPagination', 'cursor_paginate', 'encode_cursor', 'decode_cursor')
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : retry.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 19/10/2026 00:10:00
+
+Retry policy of the GraphQL clients: exponential backoff with full jitter, `Retry-After`, budgets and a deadline
+"""
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from time import monotonic
+from typing import Callable, Dict, Optional
+
+# The maximum retries of each error class, the total is limited by `attempts`
+DEFAULT_BUDGETS = dict(throttled=5, http=3, transport=3)
+
+# The HTTP statuses worth to retry
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """ The seconds of a `Retry-After` header, a number of seconds or an HTTP date """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """
+    When and how long to wait before retrying a request
+
+    The delay of the retry `n` (from 0) is drawn between 0 and `min(cap, base * 2 ** n)` (full jitter), so the
+    workers failing together don't retry together. A server hint (`Retry-After`, the throttle fallback) is the
+    minimum, the jitter is added on top of it. A call gives up after `attempts` retries, after the budget of the
+    error class or when the next attempt would start after the deadline.
+
+    ```python
+    metrics = RetryMetrics()
+    client = GraphQLClient(store.key, store.token, retry_policy=RetryPolicy(deadline=60, on_retry=metrics))
+    ```
+    """
+
+    def __init__(self, attempts: int = 5, base: float = 0.5, cap: float = 30, deadline: float = None,
+                 budgets: Dict[str, int] = None, jitter: bool = True,
+                 on_retry: Callable[[str, int, Optional[float]], None] = None):
+        """
+        :param attempts: the maximum number of retries of a call
+        :param base: the delay of the first retry, in seconds
+        :param cap: the maximum delay, in seconds
+        :param deadline: the maximum duration of a call including the retries, in seconds
+        :param budgets: {error class: maximum retries}, the classes are `throttled`, `http` and `transport`
+        :param jitter: draw the delay between 0 and the backoff, otherwise wait the whole backoff
+        :param on_retry: callable(error class, retries, delay), the delay is None when the call gives up
+        """
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.deadline = deadline
+        self.budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+        self.jitter = jitter
+        self.on_retry = on_retry
+
+    def backoff(self, retry: int) -> float:
+        """ The delay of the retry number `retry`, from 0 """
+        delay = min(self.cap, self.base * 2 ** retry)
+        return random.uniform(0, delay) if self.jitter else delay
+
+    def start(self, attempts: int = None) -> 'RetryState':
+        """ The retries of a new call, `attempts` overrides the policy """
+        return RetryState(self, self.attempts if attempts is None else attempts)
+
+
+class RetryState:
+    """ The retries of one call """
+    __slots__ = ('policy', 'attempts', 'retries', 'counts', 'deadline')
+
+    def __init__(self, policy: RetryPolicy, attempts: int):
+        self.policy = policy
+        self.attempts = attempts
+        self.retries = 0
+        self.counts = {}
+        self.deadline = monotonic() + policy.deadline if policy.deadline else None
+
+    def next_delay(self, kind: str, retry_after: float = None) -> Optional[float]:
+        """
+        The seconds to wait before the next attempt, None to give up
+
+        :param kind: the error class, `throttled`, `http` or `transport`
+        :param retry_after: the minimum delay asked by the server
+        """
+        count = self.counts.get(kind, 0)
+        delay = None
+        if self.retries < self.attempts and count < self.policy.budgets.get(kind, self.attempts):
+            delay = self.policy.backoff(self.retries)
+            if retry_after:
+                delay += retry_after
+            if self.deadline is not None and monotonic() + delay > self.deadline:
+                delay = None
+        if delay is not None:
+            self.retries += 1
+            self.counts[kind] = count + 1
+        if self.policy.on_retry:
+            self.policy.on_retry(kind, self.retries, delay)
+        return delay
+
+
+class RetryMetrics:
+    """ An `on_retry` hook counting the retries, the give-ups and the delays of each error class """
+
+    def __init__(self):
+        self.retries = {}
+        self.give_ups = {}
+        self.delay = 0.0
+        self._lock = Lock()
+
+    def __call__(self, kind: str, retries: int, delay: Optional[float]) -> None:
+        with self._lock:
+            if delay is None:
+                self.give_ups[kind] = self.give_ups.get(kind, 0) + 1
+            else:
+                self.retries[kind] = self.retries.get(kind, 0) + 1
+                self.delay += delay
+
+    def clear(self) -> None:
+        with self._lock:
+            self.retries.clear()
+            self.give_ups.clear()
+            self.delay = 0.0
+
+
+# Used by the GraphQLClient instances without a policy
+retry_policy = RetryPolicy()
+
+
+__all__ = (
+    'DEFAULT_BUDGETS', 'RETRY_STATUS', 'parse_retry_after', 'RetryPolicy', 'RetryState', 'RetryMetrics',
+    'retry_policy',
+)
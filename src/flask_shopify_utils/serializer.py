@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : serializer.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 19:40:00
+
+JSON backends for the responses and the JSON columns, orjson or msgspec are used when installed
+"""
+import json
+from dataclasses import is_dataclass, asdict
+from datetime import date
+from typing import Any, Callable, Optional, Union
+from uuid import UUID
+import simplejson
+from flask import current_app, has_app_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def column_default(o: Any) -> Any:
+    """
+    Fallback of the JSON columns
+
+    A `Decimal` is left to simplejson (`use_decimal`), it is written as an exact number as the columns always did.
+    """
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, UUID):
+        return str(o)
+    if isinstance(o, (set, frozenset, tuple)):
+        return list(o)
+    if is_dataclass(o) and not isinstance(o, type):
+        return asdict(o)
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(o).__name__))
+
+
+class JSONBackend:
+    """ The stdlib `json` module, the base of the backends """
+    name = 'json'
+
+    def dumps(self, obj: Any, default: Callable = column_default, sort_keys: bool = False,
+              indent: bool = False) -> bytes:
+        kwargs = dict(indent=2) if indent else dict(separators=(',', ':'))
+        try:
+            return json.dumps(obj, default=default, sort_keys=sort_keys, **kwargs).encode('utf-8')
+        except TypeError:
+            if default is not column_default:
+                raise
+            # a `Decimal` of a JSON column, simplejson raises the other objects again
+            return get_json_backend('simplejson').dumps(obj, default, sort_keys, indent)
+
+    def loads(self, data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+
+class SimpleJSONBackend(JSONBackend):
+    """ simplejson, the dependency the JSON columns always used """
+    name = 'simplejson'
+
+    def dumps(self, obj: Any, default: Callable = column_default, sort_keys: bool = False,
+              indent: bool = False) -> bytes:
+        kwargs = dict(indent=2) if indent else dict(separators=(',', ':'))
+        return simplejson.dumps(
+            obj, default=default, sort_keys=sort_keys, use_decimal=default is column_default, **kwargs
+        ).encode('utf-8')
+
+    def loads(self, data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        if not isinstance(data, str):
+            data = bytes(data).decode('utf-8')
+        return simplejson.loads(data)
+
+
+class OrjsonBackend(JSONBackend):
+    """
+    orjson, the datetime objects go through `default` so the responses keep the Flask format
+
+    Keys which are not strings are converted like the stdlib does. orjson has no exact number for a `Decimal`, the
+    JSON columns with one are written by simplejson.
+    """
+    name = 'orjson'
+
+    def dumps(self, obj: Any, default: Callable = column_default, sort_keys: bool = False,
+              indent: bool = False) -> bytes:
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=default, option=option)
+        except orjson.JSONEncodeError:
+            if default is not column_default:
+                raise
+            # a `Decimal` of a JSON column, simplejson raises the other objects again
+            return get_json_backend('simplejson').dumps(obj, default, sort_keys, indent)
+
+    def loads(self, data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        return orjson.loads(data)
+
+
+class MsgspecBackend(JSONBackend):
+    """
+    msgspec (>= 0.18.5), the datetime objects are always encoded as RFC 3339 strings
+
+    A `Decimal` is an exact number in the JSON columns and a string elsewhere, as the Flask provider writes it.
+    """
+    name = 'msgspec'
+
+    def __init__(self):
+        self._encoders = {}
+        self._decoder = msgspec.json.Decoder()
+
+    def dumps(self, obj: Any, default: Callable = column_default, sort_keys: bool = False,
+              indent: bool = False) -> bytes:
+        key = (default, sort_keys)
+        if key not in self._encoders:
+            self._encoders[key] = msgspec.json.Encoder(
+                enc_hook=default, order='sorted' if sort_keys else None,
+                decimal_format='number' if default is column_default else 'string',
+            )
+        data = self._encoders[key].encode(obj)
+        return msgspec.json.format(data, indent=2) if indent else data
+
+    def loads(self, data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        try:
+            return self._decoder.decode(data)
+        except msgspec.DecodeError as e:
+            # Flask and the callers expect a ValueError like the other backends
+            raise ValueError(str(e)) from e
+
+
+JSON_BACKENDS = dict(
+    json=JSONBackend,
+    simplejson=SimpleJSONBackend,
+    orjson=OrjsonBackend if orjson is not None else None,
+    msgspec=MsgspecBackend if msgspec is not None else None,
+)
+_instances = {}
+
+
+def register_json_backend(name: str, backend: Callable[[], JSONBackend]) -> None:
+    """
+    Register a JSON backend for `SHOPIFY_JSON_BACKEND`
+
+    :param name: backend name
+    :param backend: callable() -> JSONBackend
+    """
+    JSON_BACKENDS[name] = backend
+    _instances.pop(name, None)
+
+
+def get_json_backend(name: Optional[str] = 'auto') -> JSONBackend:
+    """ Get a JSON backend by name, `auto` picks orjson, msgspec and simplejson in order """
+    if name in (None, 'auto'):
+        name = next(key for key in ('orjson', 'msgspec', 'simplejson') if JSON_BACKENDS.get(key))
+    if name not in JSON_BACKENDS:
+        raise ValueError('Unknown JSON backend: {}, available: {}'.format(name, ', '.join(JSON_BACKENDS)))
+    if JSON_BACKENDS[name] is None:
+        raise ValueError('JSON backend {} is not installed'.format(name))
+    if name not in _instances:
+        _instances[name] = JSON_BACKENDS[name]()
+    return _instances[name]
+
+
+# the backend of the JSON columns without an app context
+backend = get_json_backend()
+
+
+def use_json_backend(name: Optional[str] = 'auto') -> JSONBackend:
+    """ Switch the backend of the `dumps` and `loads` functions outside of an app context """
+    global backend
+    backend = get_json_backend(name)
+    return backend
+
+
+def current_backend() -> JSONBackend:
+    """ The `SHOPIFY_JSON_BACKEND` of the `ShopifyUtil` of the app, the module backend without an app context """
+    if has_app_context():
+        return getattr(current_app.extensions.get('shopify_utils'), 'json_backend', None) or backend
+    return backend
+
+
+def dumps(obj: Any) -> str:
+    """ Serialize a JSON column value """
+    return current_backend().dumps(obj).decode('utf-8')
+
+
+def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+    """ Deserialize a JSON column value """
+    return current_backend().loads(data)
+
+
+class ShopifyJSONProvider(DefaultJSONProvider):
+    """
+    A Flask JSON provider backed by `SHOPIFY_JSON_BACKEND`
+
+    The output follows `DefaultJSONProvider`: `sort_keys`, the pretty print in debug mode and the
+    conversion of the dates, decimals, UUIDs and dataclasses. Non-ASCII characters are written as UTF-8.
+    """
+
+    def __init__(self, app, backend: Union[str, JSONBackend] = 'auto'):
+        super().__init__(app)
+        self.backend = backend if isinstance(backend, JSONBackend) else get_json_backend(backend)
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs.keys() - {'default', 'sort_keys', 'indent'}:
+            return super().dumps(obj, **kwargs)
+        return self.backend.dumps(
+            obj, default=kwargs.get('default', self.default), sort_keys=kwargs.get('sort_keys', self.sort_keys),
+            indent=bool(kwargs.get('indent')),
+        ).decode('utf-8')
+
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return self.backend.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        data = self.backend.dumps(obj, default=self.default, sort_keys=self.sort_keys, indent=indent)
+        return self._app.response_class(data + b'\n', mimetype=self.mimetype)
+
+
+__all__ = (
+    'JSONBackend', 'SimpleJSONBackend', 'OrjsonBackend', 'MsgspecBackend', 'ShopifyJSONProvider',
+    'register_json_backend', 'get_json_backend', 'use_json_backend', 'current_backend', 'dumps', 'loads',
+)
@@ -6,14 +6,43 @@
 # @Author  : Leo Chen<leo.cxy88@gmail.com>
 # @Date    : 27/05/23 3:16 pm
 """
+import os
+import json
+import asyncio
 from os import environ
 from datetime import datetime
-from time import sleep
+from time import sleep, monotonic
+from threading import Lock
+from functools import partial
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Iterable, Iterator, Awaitable, Tuple, Union
+from flask import current_app, has_app_context
 from sgqlc.operation import Operation
+from sgqlc.endpoint.base import BaseEndpoint, JSONEncoder
 from sgqlc.endpoint.http import HTTPEndpoint
+from sgqlc.endpoint.requests import RequestsEndpoint
 from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+from urllib.request import Request as UrllibRequest
 from urllib3.util.retry import Retry
+from requests import Request, Session
 from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout as RequestsTimeout
+from flask_shopify_utils.operation import PreparedOperation, EncodedBody, get_document, query_registry
+from flask_shopify_utils.breaker import CircuitBreaker
+from flask_shopify_utils.retry import RetryPolicy, RETRY_STATUS, parse_retry_after, \
+    retry_policy as default_retry_policy
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# Errors raised by the transports which are worth to retry
+TRANSPORT_ERRORS = (HTTPError, URLError, RequestsConnectionError, RequestsTimeout)
+if httpx is not None:
+    TRANSPORT_ERRORS += (httpx.TransportError,)
 
 
 def get_version(version: str = None) -> str:
@@ -45,50 +74,776 @@ def get_version(version: str = None) -> str:
     return version
 
 
+def get_config(key: str, default=None):
+    """
+    Get the setting from the Flask config (if there is an app context),
+    otherwise fall back to the environment variables
+    """
+    if has_app_context():
+        value = current_app.config.get(key, None)
+        if value is not None:
+            return value
+    return environ.get(key, default)
+
+
+def get_circuit_breaker() -> Optional[CircuitBreaker]:
+    """ The circuit breaker of the `ShopifyUtil` of the app, None without an app context or if it is disabled """
+    if has_app_context():
+        return getattr(current_app.extensions.get('shopify_utils'), 'circuit_breaker', None)
+    return None
+
+
+_shared_session = None
+_shared_session_lock = Lock()
+
+
+def get_shared_session() -> Session:
+    """
+    Get the process-wide `requests.Session` for the Shopify APIs
+
+    The urllib3 pool manager keeps a keep-alive pool per host (per shop), so the
+    TCP + TLS handshake only happen once per connection instead of once per request.
+    `SHOPIFY_POOL_CONNECTIONS` is the number of shop pools to keep (LRU) and
+    `SHOPIFY_POOL_MAXSIZE` is the number of connections to keep in each pool.
+    """
+    global _shared_session
+    if _shared_session is None:
+        with _shared_session_lock:
+            if _shared_session is None:
+                session = Session()
+                session.mount('https://', HTTPAdapter(
+                    pool_connections=int(get_config('SHOPIFY_POOL_CONNECTIONS', 100)),
+                    pool_maxsize=int(get_config('SHOPIFY_POOL_MAXSIZE', 10)),
+                    pool_block=str(get_config('SHOPIFY_POOL_BLOCK', 0)) in ('1', 'True', 'true'),
+                ))
+                _shared_session = session
+    return _shared_session
+
+
+def reset_shared_session() -> None:
+    """ Close the shared session, a new one will be created on the next request """
+    global _shared_session
+    with _shared_session_lock:
+        session, _shared_session = _shared_session, None
+    if session is not None:
+        session.close()
+
+
+_http2_client = None
+
+
+def get_http2_client() -> 'httpx.Client':
+    """
+    Get the process-wide HTTP/2 `httpx.Client` for the Shopify APIs
+
+    httpx keeps one connection per host (per shop), and the concurrent requests to a shop are multiplexed
+    over it as HTTP/2 streams. `SHOPIFY_POOL_CONNECTIONS` is the number of shop connections to keep alive.
+    Requires `httpx[http2]` (`pip install flask-shopify-utils[http2]`).
+    """
+    global _http2_client
+    if httpx is None:
+        raise RuntimeError('The http2 transport requires httpx[http2]: pip install flask-shopify-utils[http2]')
+    if _http2_client is None:
+        with _shared_session_lock:
+            if _http2_client is None:
+                _http2_client = httpx.Client(http2=True, limits=httpx.Limits(
+                    max_connections=None,
+                    max_keepalive_connections=int(get_config('SHOPIFY_POOL_CONNECTIONS', 100)),
+                ))
+    return _http2_client
+
+
+def reset_http2_client() -> None:
+    """ Close the shared HTTP/2 client, a new one will be created on the next request """
+    global _http2_client
+    with _shared_session_lock:
+        client, _http2_client = _http2_client, None
+    if client is not None:
+        client.close()
+
+
+def _reset_after_fork() -> None:
+    """ The sockets must not be shared with the forked workers (uWSGI / Gunicorn pre-fork) """
+    global _shared_session, _shared_session_lock, _http2_client
+    _shared_session = None
+    _http2_client = None
+    _shared_session_lock = Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class EncodedBodyMixin:
+    """ Send an `EncodedBody` as is, the other queries are encoded by the sgqlc endpoint """
+
+    def build_request(self, data: bytes, headers: dict):
+        raise NotImplementedError
+
+    def _prepare(self, query, variables, operation_name, extra_headers):
+        if not isinstance(query, EncodedBody):
+            return super()._prepare(query, variables, operation_name, extra_headers)
+        headers = self.base_headers.copy()
+        if extra_headers:
+            headers.update(extra_headers)
+        headers.setdefault('Accept', 'application/json; charset=utf-8')
+        headers['Content-Type'] = 'application/json; charset=utf-8'
+        headers['Content-Length'] = str(len(query.data))
+        return query, self.build_request(query.data, headers)
+
+
+class ShopifyHTTPEndpoint(EncodedBodyMixin, HTTPEndpoint):
+
+    def build_request(self, data: bytes, headers: dict) -> UrllibRequest:
+        return UrllibRequest(url=self.url, data=data, headers=headers, method='POST')
+
+
+class ShopifyRequestsEndpoint(EncodedBodyMixin, RequestsEndpoint):
+
+    def build_request(self, data: bytes, headers: dict) -> Request:
+        return Request(url=self.url, auth=self.auth, data=data, headers=headers, method='POST')
+
+
+class HTTP2Endpoint(BaseEndpoint):
+    """ sgqlc endpoint on the shared HTTP/2 client, with the error handling of the other endpoints """
+
+    def __init__(self, url: str, base_headers: dict = None, timeout: int = None, client: 'httpx.Client' = None):
+        self.url = url
+        self.base_headers = base_headers or {}
+        self.timeout = timeout
+        self.client = client if client else get_http2_client()
+
+    def __str__(self):
+        return '{}(url={}, base_headers={!r}, timeout={!r})'.format(
+            self.__class__.__name__, self.url, self.base_headers, self.timeout)
+
+    def __call__(self, query, variables=None, operation_name=None, extra_headers=None, timeout=None):
+        if isinstance(query, EncodedBody):
+            data = query.data
+        else:
+            if not isinstance(query, str):
+                query = bytes(query).decode('utf-8')
+            data = json.dumps(dict(query=query, variables=variables, operationName=operation_name),
+                              cls=JSONEncoder).encode('utf-8')
+        headers = dict(self.base_headers, **(extra_headers or {}))
+        headers.setdefault('Accept', 'application/json; charset=utf-8')
+        headers['Content-Type'] = 'application/json; charset=utf-8'
+        self.logger.debug('Query:\n%s', query)
+        response = self.client.post(self.url, content=data, headers=headers, timeout=timeout or self.timeout)
+        try:
+            result = response.json()
+        except ValueError as exc:
+            return self._log_json_error(response.text, exc)
+        if response.is_error and not (isinstance(result, dict) and result.get('errors')):
+            result = dict(data=None, errors=[dict(
+                message='HTTP Error {}: {}'.format(response.status_code, response.reason_phrase),
+                status=response.status_code,
+                body=response.text,
+            )])
+        if isinstance(result, dict):
+            result['headers'] = dict(response.headers)
+            if response.is_error:
+                result['status'] = response.status_code
+            if result.get('errors'):
+                return self._log_graphql_error(query, result)
+        return result
+
+
+class HTTP2Session:
+    """
+    The `requests.Session` interface of `BasicHelper.restful` on the shared HTTP/2 client
+
+    Like `initial_restful_adapter`, a `429` response is retried after its `Retry-After` seconds and the requests
+    go through the circuit breaker of the shop. The responses are `httpx.Response` objects: `json()`,
+    `status_code`, `headers` and `text` work as with requests.
+    """
+
+    def __init__(self, headers: dict = None, retries: int = 5, client: 'httpx.Client' = None,
+                 breaker: CircuitBreaker = None):
+        self.headers = dict(headers or {})
+        self.retries = retries
+        self.client = client if client else get_http2_client()
+        self.breaker = breaker
+
+    def request(self, method: str, url: str, params: dict = None, json: dict = None, **kwargs) -> 'httpx.Response':
+        shop = urlparse(url).netloc
+        probe = self.breaker.before_request(shop) if self.breaker else False
+        attempts = self.retries
+        while True:
+            try:
+                response = self.client.request(method, url, params=params, json=json, headers=self.headers, **kwargs)
+            except httpx.TransportError:
+                if self.breaker:
+                    self.breaker.failure(shop, probe)
+                raise
+            if response.status_code != 429 or attempts <= 0:
+                if self.breaker:
+                    self.breaker.record(shop, response.status_code, probe)
+                return response
+            attempts -= 1
+            sleep(float(response.headers.get('Retry-After') or 1))
+
+
+def _urllib_transport(url: str, headers: dict, timeout: int) -> BaseEndpoint:
+    """ One connection per request, the original behaviour """
+    return ShopifyHTTPEndpoint(url, headers, timeout)
+
+
+def _requests_transport(url: str, headers: dict, timeout: int) -> BaseEndpoint:
+    """ Keep-alive connections from the shared pool """
+    return ShopifyRequestsEndpoint(url, headers, timeout, session=get_shared_session())
+
+
+def _http2_transport(url: str, headers: dict, timeout: int) -> BaseEndpoint:
+    """ One multiplexed HTTP/2 connection per shop """
+    return HTTP2Endpoint(url, headers, timeout)
+
+
+TRANSPORTS = dict(
+    urllib=_urllib_transport,
+    requests=_requests_transport,
+    http2=_http2_transport,
+)
+
+
+def register_transport(name: str, factory: Callable[[str, dict, int], BaseEndpoint]) -> None:
+    """
+    Register a custom transport for `GraphQLClient`
+
+    :param name: the value of `transport` / `SHOPIFY_GRAPHQL_TRANSPORT`
+    :param factory: callable(url, headers, timeout) -> sgqlc endpoint
+    """
+    TRANSPORTS[name] = factory
+
+
+class ThrottleController:
+    """
+    Per-shop leaky bucket model of the GraphQL Admin API rate limit
+
+    Shopify returns `extensions.cost.throttleStatus` on every response, the bucket is
+    refilled by `restoreRate` points per second up to `maximumAvailable`. Before each
+    query we estimate the points available now and wait just long enough to afford
+    the cost of the previous query of the same shop.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = Lock()
+
+    def update(self, shop: str, result: dict) -> None:
+        """ Save the bucket status from the GraphQL response """
+        cost = (result.get('extensions') or {}).get('cost') if isinstance(result, dict) else None
+        if not cost or not cost.get('throttleStatus'):
+            return
+        status = cost['throttleStatus']
+        with self._lock:
+            self._buckets[shop] = dict(
+                available=float(status['currentlyAvailable']),
+                maximum=float(status['maximumAvailable']),
+                restore_rate=float(status['restoreRate']),
+                requested=float(cost.get('requestedQueryCost') or 0),
+                updated_at=monotonic(),
+            )
+
+    def get_bucket(self, shop: str) -> Optional[dict]:
+        with self._lock:
+            bucket = self._buckets.get(shop)
+            return dict(bucket) if bucket else None
+
+    def get_available(self, shop: str) -> Optional[float]:
+        """ Estimate the points available now, None if the shop has not been seen """
+        bucket = self.get_bucket(shop)
+        if not bucket:
+            return None
+        restored = (monotonic() - bucket['updated_at']) * bucket['restore_rate']
+        return min(bucket['maximum'], bucket['available'] + restored)
+
+    def get_delay(self, shop: str, cost: float = None) -> float:
+        """
+        Seconds to wait before sending a query
+
+        :param shop: shop domain
+        :param cost: expected cost of the query, default is the requested cost of the last query
+        """
+        bucket = self.get_bucket(shop)
+        if not bucket or bucket['restore_rate'] <= 0:
+            return 0
+        cost = min(bucket['requested'] if cost is None else cost, bucket['maximum'])
+        available = self.get_available(shop)
+        if available >= cost:
+            return 0
+        return (cost - available) / bucket['restore_rate']
+
+    def clear(self, shop: str = None) -> None:
+        with self._lock:
+            if shop is None:
+                self._buckets.clear()
+            else:
+                self._buckets.pop(shop, None)
+
+
+# Shared by all GraphQLClient instances of the process
+throttle_controller = ThrottleController()
+
+
+def is_throttled(result: dict) -> bool:
+    for error in result.get('errors') or []:
+        if not isinstance(error, dict):
+            continue
+        if error.get('message') == 'Throttled' or (error.get('extensions') or {}).get('code') == 'THROTTLED':
+            return True
+    return False
+
+
+def read_connection(data: dict, path: str) -> Tuple[list, Optional[str], bool]:
+    """
+    Read a page of a connection from the response data
+
+    :param data: response data
+    :param path: dotted path of the connection, e.g. `product.variants`
+    :return: (nodes, end cursor, has next page)
+    """
+    connection = data
+    for key in path.split('.'):
+        connection = connection.get(key) if connection else None
+    if not connection:
+        return [], None, False
+    nodes = connection['nodes'] if 'nodes' in connection else \
+        [edge['node'] for edge in connection.get('edges') or []]
+    page_info = connection.get('pageInfo') or {}
+    cursor = page_info.get('endCursor')
+    if cursor is None and connection.get('edges'):
+        cursor = connection['edges'][-1].get('cursor')
+    return nodes, cursor, bool(page_info.get('hasNextPage')) and cursor is not None
+
+
+def get_http_error(result: dict) -> Tuple[Optional[int], Optional[float]]:
+    """
+    The HTTP status and the `Retry-After` seconds of an error result
+
+    The endpoints put the status and the headers in the result if the body has GraphQL errors, in the error otherwise.
+    """
+    source = result if result.get('status') else None
+    for error in result.get('errors') or []:
+        if source is None and isinstance(error, dict) and error.get('status'):
+            source = error
+    if source is None:
+        return None, None
+    retry_after = None
+    for key, value in (source.get('headers') or {}).items():
+        if key.lower() == 'retry-after':
+            retry_after = parse_retry_after(value)
+    return source['status'], retry_after
+
+
+# Values of `persisted_queries` / `SHOPIFY_GRAPHQL_PERSISTED_QUERIES`
+PERSISTED_QUERIES = ('off', 'registry', 'apq')
+
+
+def get_apq_error(result: dict) -> Optional[str]:
+    """ `PERSISTED_QUERY_NOT_FOUND` or `PERSISTED_QUERY_NOT_SUPPORTED` from the errors of an APQ request """
+    for error in result.get('errors') or []:
+        code = (error.get('extensions') or {}).get('code') or ''
+        message = error.get('message') or ''
+        if code == 'PERSISTED_QUERY_NOT_FOUND' or message == 'PersistedQueryNotFound':
+            return 'PERSISTED_QUERY_NOT_FOUND'
+        if code == 'PERSISTED_QUERY_NOT_SUPPORTED' or message == 'PersistedQueryNotSupported':
+            return 'PERSISTED_QUERY_NOT_SUPPORTED'
+    return None
+
+
 class GraphQLClient:
-    def __init__(self, app_url: str, token: str, timeout: int = 15, cost_debug: bool = False):
+    def __init__(self, app_url: str, token: str, timeout: int = 15, cost_debug: bool = False,
+                 transport: Optional[str] = None, throttle: ThrottleController = None,
+                 persisted_queries: Optional[str] = None, retry_policy: RetryPolicy = None,
+                 breaker: CircuitBreaker = None):
+        """
+        :param persisted_queries: `off`, `registry` (hash and encode each query text once, send the text) or
+            `apq` (send the hash first, the text only if the server asks for it)
+        :param retry_policy: the backoff, budgets and deadline of the retries, shared by default
+        :param breaker: the circuit breaker of the shops, default is the one of `ShopifyUtil`
+        """
         self.version = get_version()
+        self.shop = app_url
+        self.throttle = throttle if throttle else throttle_controller
+        self.retry_policy = retry_policy if retry_policy else default_retry_policy
+        self.breaker = breaker if breaker else get_circuit_breaker()
         self.timeout = timeout
         self.url = f'https://{app_url}/admin/api/{self.version}/graphql.json'
         self.headers = {'X-Shopify-Access-Token': token}
         if cost_debug:
-            self.headers['Shopify-GraphQL-Cost-Debug'] = 1
-        self._client = HTTPEndpoint(self.url, self.headers, timeout)
+            self.headers['Shopify-GraphQL-Cost-Debug'] = '1'
+        self.transport = transport if transport else get_config('SHOPIFY_GRAPHQL_TRANSPORT', 'requests')
+        if self.transport not in TRANSPORTS:
+            raise ValueError('Unknown GraphQL transport: {}'.format(self.transport))
+        self._client = TRANSPORTS[self.transport](self.url, self.headers, timeout)
+        self.persisted_queries = persisted_queries if persisted_queries else \
+            get_config('SHOPIFY_GRAPHQL_PERSISTED_QUERIES', 'off')
+        if self.persisted_queries not in PERSISTED_QUERIES:
+            raise ValueError('Unknown persisted queries mode: {}'.format(self.persisted_queries))
+        if self.persisted_queries != 'off' and not isinstance(self._client, (EncodedBodyMixin, HTTP2Endpoint)):
+            # a custom transport encodes the query itself
+            self.persisted_queries = 'off'
 
     @property
-    def client(self) -> HTTPEndpoint:
+    def client(self) -> BaseEndpoint:
         return self._client
 
-    def fetch_data(self, query: Operation, headers: dict = None, timeout: int = None, attempts: int = 5):
+    @contextmanager
+    def circuit(self):
+        """
+        Send a call through the circuit breaker of the shop, `CircuitOpenError` is raised while it is open
+
+        The outcome is recorded once per call, after its retries: a timeout, or the 401 / 5xx response the call
+        gave up on, counts as a single failure.
+        """
+        if self.breaker is None:
+            yield
+            return
+        probe = self.breaker.before_request(self.shop)
         try:
-            result = self.client(query, extra_headers=headers, timeout=timeout if timeout else self.timeout)
-            if 'errors' in result.keys():
-                if result['errors'][0]['message'] == 'Throttled':
-                    if attempts <= 0:
-                        raise Exception(result)
-                    sleep(2)
-                    attempts -= 1
-                    return self.fetch_data(query, timeout, attempts)
+            yield
+        except TRANSPORT_ERRORS:
+            self.breaker.failure(self.shop, probe)
+            raise
+        except Exception as e:
+            result = e.args[0] if e.args and isinstance(e.args[0], dict) else {}
+            self.breaker.record(self.shop, get_http_error(result)[0], probe)
+            raise
+        self.breaker.record(self.shop, None, probe)
+
+    def send(self, query: Union[Operation, str], variables: dict = None, headers: dict = None,
+             timeout: int = None) -> dict:
+        """
+        Send a request, with the persisted query of the text and the APQ fallback
+
+        A `hash` request answered with `PERSISTED_QUERY_NOT_FOUND` is sent again with the text to register it.
+        If another error is gone with the text, the host doesn't support APQ and is sent the text from now on.
+        """
+        timeout = timeout if timeout else self.timeout
+        if self.persisted_queries == 'off':
+            return self.client(query, variables, extra_headers=headers, timeout=timeout)
+        if not isinstance(query, str):
+            query = bytes(query).decode('utf-8')
+        persisted = query_registry.register(query)
+        if self.persisted_queries == 'apq' and self.shop not in query_registry.unsupported:
+            result = self.client(persisted.encode(variables, 'hash'), extra_headers=headers, timeout=timeout)
+            if not result.get('errors') or result.get('data') or is_throttled(result):
+                return result
+            code = get_apq_error(result)
+            if code == 'PERSISTED_QUERY_NOT_FOUND':
+                return self.client(persisted.encode(variables, 'both'), extra_headers=headers, timeout=timeout)
+            result = self.client(persisted.encode(variables), extra_headers=headers, timeout=timeout)
+            # the text fails as well, it was an error of the query
+            if code or not result.get('errors'):
+                query_registry.unsupported.add(self.shop)
+            return result
+        return self.client(persisted.encode(variables), extra_headers=headers, timeout=timeout)
+
+    def parse_result(self, result: dict) -> Tuple[Optional[dict], Optional[float]]:
+        """
+        Check the GraphQL response, shared by the sync and async clients
+
+        :return: (data, None) on success, (None, (error class, minimum delay)) if the query should be retried
+        """
+        self.throttle.update(self.shop, result)
+        if 'errors' in result.keys():
+            if is_throttled(result):
+                # the bucket paces the retry, without cost data fall back to 2 seconds
+                return None, ('throttled', 0 if self.throttle.get_bucket(self.shop) else 2)
+            status, retry_after = get_http_error(result)
+            if status in RETRY_STATUS:
+                return None, ('http', retry_after)
+            raise Exception(result)
+        return result['data'], None
+
+    def fetch_data(self, query: Union[Operation, PreparedOperation, str], headers: dict = None, timeout: int = None,
+                   attempts: int = None, cost: float = None, variables: dict = None):
+        """
+        :param attempts: the maximum number of retries, default is the one of the retry policy
+        :param cost: expected cost of the query, default is the cost of the last query of the shop
+        :param variables: variables of the query, if it declares `$variables`, they extend the variables of a
+            `PreparedOperation`
+        """
+        query, variables = get_document(query, variables)
+        with self.circuit():
+            return self._fetch_data(query, variables, headers, timeout, attempts, cost)
+
+    def _fetch_data(self, query: Union[Operation, str], variables: Optional[dict], headers: Optional[dict],
+                    timeout: Optional[int], attempts: Optional[int], cost: Optional[float]):
+        retry = self.retry_policy.start(attempts)
+        delay = 0
+        while True:
+            # wait until the bucket can afford the query instead of getting throttled
+            delay = max(delay, self.throttle.get_delay(self.shop, cost))
+            if delay > 0:
+                sleep(delay)
+            try:
+                result = self.send(query, variables, headers, timeout)
+            except TRANSPORT_ERRORS as e:
+                delay = retry.next_delay('transport')
+                if delay is None:
+                    raise e
+                continue
+            data, error = self.parse_result(result)
+            if error is None:
+                return data
+            delay = retry.next_delay(*error)
+            if delay is None:
                 raise Exception(result)
-            else:
-                return result['data']
-        except (HTTPError, URLError) as e:
-            if attempts <= 0:
-                raise e
-            sleep(1)
-            attempts -= 1
-            return self.fetch_data(query, timeout, attempts)
 
+    def batch(self, max_size: int = 25, max_cost: float = 1000, **kwargs):
+        """
+        A `MutationBatcher` which sends the queued mutations as aliased documents
+
+        ```python
+        with client.batch() as batcher:
+            futures = [batcher.submit(update_meta(owner_id, value, ns, key)) for owner_id, value in rows]
+        errors = [future.result().user_errors for future in futures]
+        ```
+
+        :param max_size: the maximum number of mutations per request
+        :param max_cost: the maximum cost per request
+        :param kwargs: passed to `fetch_data`
+        """
+        from flask_shopify_utils.batch import MutationBatcher
+
+        return MutationBatcher(self, max_size=max_size, max_cost=max_cost, **kwargs)
+
+    def get_node_cost(self, first: int) -> Optional[float]:
+        """ Cost per node of the last page """
+        bucket = self.throttle.get_bucket(self.shop)
+        return bucket['requested'] / first if bucket and bucket['requested'] and first else None
+
+    def get_page_size(self, node_cost: Optional[float], default: int = 50, maximum: int = 250) -> int:
+        """
+        The largest page the bucket can afford right now
+
+        :param node_cost: cost per node of the previous page
+        :param default: page size when there is no cost data yet
+        :param maximum: the maximum page size of the connection
+        """
+        available = self.throttle.get_available(self.shop)
+        if not node_cost or available is None:
+            return default
+        # a single query can not cost more than 1000 points
+        return max(1, min(maximum, int(min(available, 1000) // node_cost)))
+
+    def iter_connection(self, op_factory: Callable[[Optional[str], int], Union[Operation, str]], path: str,
+                        page_size: int = None, max_page_size: int = 250, prefetch: bool = False,
+                        **kwargs) -> Iterator[dict]:
+        """
+        Yield the nodes of a connection lazily, page by page
+
+        Only the current page (and the prefetched page) are kept in memory.
 
-def initial_restful_adapter() -> HTTPAdapter:
+        ```python
+        def query_products(cursor: str = None, first: int = 50) -> Operation:
+            op = Operation(shopify_schema.query_type, 'QueryProducts')
+            query = op.products(first=first, after=cursor)
+            query.page_info.has_next_page()
+            query.page_info.end_cursor()
+            query.nodes.id()
+            return op
+
+        for node in client.iter_connection(query_products, 'products', prefetch=True):
+            ...
+        ```
+
+        :param op_factory: callable(cursor, first) -> Operation, the query must select
+            `pageInfo { hasNextPage endCursor }` and `nodes` (or `edges { node }`)
+        :param path: dotted path of the connection in the response data, e.g. `product.variants`
+        :param page_size: fixed page size, default is the largest page the cost budget can afford
+        :param max_page_size: the maximum page size of the connection
+        :param prefetch: fetch the next page in the background while the current page is processed
+        :param kwargs: passed to `fetch_data`
+        """
+
+        def fetch(cursor: Optional[str], first: int, cost: Optional[float]) -> Tuple[dict, int]:
+            return self.fetch_data(op_factory(cursor, first), cost=cost, **kwargs), first
+
+        def next_args(cursor: Optional[str], node_cost: Optional[float]) -> tuple:
+            first = page_size if page_size else self.get_page_size(node_cost, maximum=max_page_size)
+            return cursor, first, first * node_cost if node_cost else None
+
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            pending = None
+            data, first = fetch(*next_args(None, None))
+            while True:
+                nodes, cursor, has_next = read_connection(data, path)
+                node_cost = self.get_node_cost(first)
+                # drop the reference, keep the memory flat
+                data = None
+                if has_next and executor:
+                    pending = executor.submit(fetch, *next_args(cursor, node_cost))
+                yield from nodes
+                nodes = None
+                if not has_next:
+                    return
+                if pending:
+                    (data, first), pending = pending.result(), None
+                else:
+                    data, first = fetch(*next_args(cursor, node_cost))
+        finally:
+            if executor:
+                executor.shutdown(wait=True)
+
+
+class AsyncGraphQLClient(GraphQLClient):
+    """
+    Asyncio version of `GraphQLClient`, with the same retry and throttle semantics
+
+    The HTTP call runs in the default executor of the event loop (the transport
+    is blocking), everything else is awaited, so sleeping for the throttle or a
+    retry never holds a thread. For a `concurrency` higher than the size of the
+    default executor, set a bigger one with `loop.set_default_executor()`.
+
+    ```python
+    clients = [AsyncGraphQLClient(store.key, store.token) for store in stores]
+    results = asyncio.run(AsyncGraphQLClient.gather(
+        [client.fetch_data(op) for client in clients], concurrency=20
+    ))
+    ```
+    """
+
+    async def fetch_data(self, query: Union[Operation, PreparedOperation, str], headers: dict = None,
+                         timeout: int = None, attempts: int = None, cost: float = None, variables: dict = None):
+        query, variables = get_document(query, variables)
+        with self.circuit():
+            return await self._fetch_data(query, variables, headers, timeout, attempts, cost)
+
+    async def _fetch_data(self, query: Union[Operation, str], variables: Optional[dict], headers: Optional[dict],
+                          timeout: Optional[int], attempts: Optional[int], cost: Optional[float]):
+        loop = asyncio.get_running_loop()
+        send = partial(self.send, query, variables, headers, timeout)
+        retry = self.retry_policy.start(attempts)
+        delay = 0
+        while True:
+            delay = max(delay, self.throttle.get_delay(self.shop, cost))
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                result = await loop.run_in_executor(None, send)
+            except TRANSPORT_ERRORS as e:
+                delay = retry.next_delay('transport')
+                if delay is None:
+                    raise e
+                continue
+            data, error = self.parse_result(result)
+            if error is None:
+                return data
+            delay = retry.next_delay(*error)
+            if delay is None:
+                raise Exception(result)
+
+    def batch(self, max_size: int = 25, max_cost: float = 1000, **kwargs):
+        """ An `AsyncMutationBatcher`, see `GraphQLClient.batch` """
+        from flask_shopify_utils.batch import AsyncMutationBatcher
+
+        return AsyncMutationBatcher(self, max_size=max_size, max_cost=max_cost, **kwargs)
+
+    async def iter_connection(self, op_factory: Callable[[Optional[str], int], Union[Operation, str]], path: str,
+                              page_size: int = None, max_page_size: int = 250, prefetch: bool = False,
+                              **kwargs):
+        """ Async generator version of `GraphQLClient.iter_connection` """
+        first = page_size if page_size else self.get_page_size(None, maximum=max_page_size)
+        pending = asyncio.ensure_future(self.fetch_data(op_factory(None, first), **kwargs))
+        try:
+            while pending:
+                data = await pending
+                pending = None
+                nodes, cursor, has_next = read_connection(data, path)
+                node_cost = self.get_node_cost(first)
+                data = None
+                if has_next:
+                    first = page_size if page_size else self.get_page_size(node_cost, maximum=max_page_size)
+                    pending = self.fetch_data(
+                        op_factory(cursor, first), cost=first * node_cost if node_cost else None, **kwargs)
+                    if prefetch:
+                        pending = asyncio.ensure_future(pending)
+                for node in nodes:
+                    yield node
+        finally:
+            if isinstance(pending, asyncio.Future):
+                pending.cancel()
+            elif pending is not None:
+                pending.close()
+
+    @staticmethod
+    async def gather(jobs: Iterable[Awaitable], concurrency: int = 10, return_exceptions: bool = True) -> list:
+        """
+        Run the awaitables with at most `concurrency` of them in flight
+
+        :param jobs: e.g. `[client.fetch_data(op) for client in clients]`
+        :param concurrency: the maximum number of running jobs
+        :param return_exceptions: return the exception as the result instead of raising it
+        :return: the results in the same order as `jobs`
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(job):
+            async with semaphore:
+                return await job
+
+        return await asyncio.gather(*[run(job) for job in jobs], return_exceptions=return_exceptions)
+
+
+class CircuitBreakerAdapter(HTTPAdapter):
+    """ `HTTPAdapter` sending the requests through the circuit breaker of the shop, the host of the URL """
+
+    def __init__(self, breaker: CircuitBreaker, **kwargs):
+        self.breaker = breaker
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        shop = urlparse(request.url).netloc
+        probe = self.breaker.before_request(shop)
+        try:
+            response = super().send(request, **kwargs)
+        except (RequestsConnectionError, RequestsTimeout):
+            self.breaker.failure(shop, probe)
+            raise
+        self.breaker.record(shop, response.status_code, probe)
+        return response
+
+
+def initial_restful_adapter(breaker: CircuitBreaker = None) -> HTTPAdapter:
     """
     Initial RestfulAPI Adapter
     Usually used for Shopify RestfulAPI
     Have a better retry for concurrency requests
+
+    :param breaker: send the requests through the circuit breaker of the shops
     """
     Retry.parse_retry_after = lambda self, retry_after: float(retry_after)
-    return HTTPAdapter(max_retries=Retry(
+    retry = Retry(
         total=5,
         status_forcelist=[429],
         respect_retry_after_header=True
-    ))
+    )
+    if breaker is not None:
+        return CircuitBreakerAdapter(breaker, max_retries=retry)
+    return HTTPAdapter(max_retries=retry)
+
+
+def create_restful_session(token: str, transport: Optional[str] = None,
+                           breaker: CircuitBreaker = None) -> Union[Session, HTTP2Session]:
+    """
+    A session for the Shopify RestfulAPI, with the retry of `initial_restful_adapter`
+
+    :param token: the access token of the shop
+    :param transport: `requests` or `http2`, default is `SHOPIFY_RESTFUL_TRANSPORT`
+    :param breaker: the circuit breaker of the shops, default is the one of `ShopifyUtil`
+    """
+    transport = transport if transport else get_config('SHOPIFY_RESTFUL_TRANSPORT', 'requests')
+    breaker = breaker if breaker else get_circuit_breaker()
+    headers = {'X-Shopify-Access-Token': token}
+    if transport == 'http2':
+        return HTTP2Session(headers, breaker=breaker)
+    if transport != 'requests':
+        raise ValueError('Unknown RestfulAPI transport: {}'.format(transport))
+    session = Session()
+    session.headers.update(headers)
+    session.mount('https://', initial_restful_adapter(breaker))
+    return session
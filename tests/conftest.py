@@ -6,13 +6,39 @@
 # @Author  : Leo Chen<leo.cxy88@gmail.com>
 # @Date    : 27/05/23 5:07 pm
 """
-from pytest import fixture
+from base64 import b64encode
+from fnmatch import fnmatchcase
+from hashlib import sha256
+from hmac import new as hmac_new
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from json import loads, dumps
+from shutil import which
+from ssl import SSLContext, PROTOCOL_TLS_SERVER, create_default_context
+from subprocess import check_call, DEVNULL
+from threading import Thread, Lock
+from time import monotonic, sleep, time
+from pytest import fixture, skip, importorskip, mark
 from unittest import TestCase
-from flask import Flask
+from flask import Flask, request
+from jwt import encode as jwt_encode
 from flask_shopify_utils import ShopifyUtil
 from flask_sqlalchemy import SQLAlchemy
 
 
+def pytest_addoption(parser):
+    parser.addoption('--benchmark', action='store_true', default=False, help='run the tests marked as benchmark')
+
+
+def pytest_collection_modifyitems(config, items):
+    """ The benchmarks are slow, they only run with `--benchmark` """
+    if config.getoption('--benchmark'):
+        return
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(mark.skip(reason='benchmark, run it with --benchmark'))
+
+
 @fixture(scope='session')
 def initial():
     """ Initial the flask app and utils """
@@ -32,6 +58,8 @@ def initial():
     utils.enroll_default_route()
     utils.enroll_gdpr_route()
     utils.enroll_graphql_schema_cli()
+    utils.enroll_webhook_route()
+    utils.enroll_webhook_worker_cli()
 
     return app, db, test, utils
 
@@ -43,3 +71,427 @@ def initial_test_client(initial):
     with app.app_context():
         db.create_all()
         yield app.test_client(), test, utils
+
+
+@fixture(scope='function')
+def store_factory(initial_test_client, monkeypatch):
+    """ Create Store records, they are removed with the cached lookups afterwards """
+    from flask import g
+    from flask_shopify_utils.model import Store
+
+    client, test, utils = initial_test_client
+    monkeypatch.setitem(utils.config, 'BYPASS_VALIDATE', 0)
+    records = []
+
+    def create(key: str = 'test.myshopify.com', token: str = 'token'):
+        record = Store.create_or_update(dict(key=key), key=key, domain=key, scopes='read_products', token=token)
+        utils.db.commit()
+        records.append(record)
+        return record
+
+    # the test client shares the app context (and `g`) of the fixture
+    g.pop('_shopify_stores', None)
+    utils.store_cache.clear()
+    utils.cache.clear()
+    yield create
+    for record in records:
+        utils.db.delete(record)
+    utils.db.commit()
+    g.pop('_shopify_stores', None)
+    utils.store_cache.clear()
+    utils.cache.clear()
+
+
+@fixture(scope='session')
+def session_jwt():
+    """ session_jwt(utils, shop, ttl=60) -> a Shopify session token of the shop """
+
+    def create(utils, shop: str, ttl: int = 60) -> str:
+        now = int(time())
+        return jwt_encode(dict(
+            dest='https://{}'.format(shop), aud=utils.config.get('SHOPIFY_API_KEY'), exp=now + ttl, iat=now - 1,
+        ), utils.config.get('SHOPIFY_API_SECRET'), algorithm='HS256')
+
+    return create
+
+
+@fixture(scope='session')
+def webhook_headers():
+    """ webhook_headers(utils, body, webhook_id=None, event_id=None, shop=...) -> the headers of a signed webhook """
+
+    def create(utils, body: bytes, webhook_id: str = None, event_id: str = None,
+               shop: str = 'test.myshopify.com') -> dict:
+        secret = utils.config.get('SHOPIFY_API_SECRET')
+        headers = {
+            'X-Shopify-Hmac-Sha256': b64encode(hmac_new(secret.encode('utf-8'), body, sha256).digest()).decode(),
+            'X-Shopify-Shop-Domain': shop,
+            'X-Shopify-Topic': 'orders/create',
+            'Content-Type': 'application/json',
+        }
+        if webhook_id:
+            headers['X-Shopify-Webhook-Id'] = webhook_id
+        if event_id:
+            headers['X-Shopify-Event-Id'] = event_id
+        return headers
+
+    return create
+
+
+@fixture(scope='module')
+def webhook_app():
+    """ A standalone app with `check_webhook` endpoints, the handlers append to `calls` """
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    SQLAlchemy().init_app(app)
+    utils = ShopifyUtil(app)
+    calls = []
+
+    @app.route('/webhook/orders', methods=['POST'])
+    @utils.check_webhook
+    def orders_webhook():
+        calls.append(1)
+        return 'success'
+
+    @app.route('/webhook/failed', methods=['POST'])
+    @utils.check_webhook
+    def failed_webhook():
+        calls.append(1)
+        return 'failed', 500
+
+    @app.route('/webhook/products', methods=['POST'])
+    @utils.check_webhook
+    def products_webhook():
+        if utils.config.get('SHOPIFY_WEBHOOK_STREAM_VERIFY'):
+            data = utils.get_webhook_json()
+        else:
+            data = request.get_json()
+        calls.append(len(data['variants']))
+        return 'success'
+
+    @app.route('/webhook/verify', methods=['POST'])
+    @utils.check_webhook
+    def verify_webhook():
+        return 'success'
+
+    return app, utils, calls
+
+
+class GraphQLStubHandler(BaseHTTPRequestHandler):
+    """ Keep-alive handler, the response is generated by `server.responder(payload, headers)` """
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        payload = loads(body) if body else {}
+        self.server.requests.append(payload)
+        status, data, headers = self.server.responder(payload, self.headers)
+        content = dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        """ Stream `server.files[path]()` with the chunked encoding """
+        factory = self.server.files.get(self.path)
+        if factory is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/jsonl')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for chunk in factory():
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+        self.wfile.write(b'0\r\n\r\n')
+
+    def log_message(self, *args):
+        pass
+
+
+class GraphQLStubServer(ThreadingHTTPServer):
+    """ Local HTTPS server to mock the Shopify GraphQL endpoint, counting the TLS handshakes """
+    daemon_threads = True
+
+    def __init__(self, ssl_context):
+        super().__init__(('127.0.0.1', 0), GraphQLStubHandler)
+        self.ssl_context = ssl_context
+        self.handshakes = 0
+        self.requests = []
+        self.files = {}
+        self.responder = lambda payload, headers: (200, dict(data=dict(ok=True)), None)
+
+    @property
+    def host(self) -> str:
+        return '127.0.0.1:{}'.format(self.server_address[1])
+
+    def finish_request(self, request, client_address):
+        # handshake in the worker thread, so the accept loop is never blocked
+        request = self.ssl_context.wrap_socket(request, server_side=True)
+        self.handshakes += 1
+        super().finish_request(request, client_address)
+
+
+@fixture(scope='session')
+def tls_cert(tmp_path_factory):
+    """ Self-signed certificate for 127.0.0.1 """
+    if which('openssl') is None:
+        skip('openssl is required to generate the certificate')
+    folder = tmp_path_factory.mktemp('tls')
+    cert, key = str(folder / 'cert.pem'), str(folder / 'key.pem')
+    check_call([
+        'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+        '-keyout', key, '-out', cert, '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+    ], stdout=DEVNULL, stderr=DEVNULL)
+    return cert, key
+
+
+@fixture(scope='function')
+def graphql_stub(tls_cert, monkeypatch):
+    """ Start the stub server and trust its certificate for both urllib and requests """
+    from flask_shopify_utils.utils import get_shared_session, reset_shared_session
+
+    cert, key = tls_cert
+    context = SSLContext(PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server = GraphQLStubServer(context)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    for name in ['SSL_CERT_FILE', 'REQUESTS_CA_BUNDLE', 'CURL_CA_BUNDLE']:
+        monkeypatch.setenv(name, cert)
+    reset_shared_session()
+    get_shared_session().verify = cert
+    yield server
+    reset_shared_session()
+    server.shutdown()
+    server.server_close()
+
+
+class H2StubServer(ThreadingTCPServer):
+    """ Local HTTP/2 server (TLS + ALPN h2) with the interface of `GraphQLStubServer`, counting the connections """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, ssl_context):
+        super().__init__(('127.0.0.1', 0), StreamRequestHandler)
+        ssl_context.set_alpn_protocols(['h2'])
+        self.ssl_context = ssl_context
+        self.connections = 0
+        self.requests = []
+        self.delay = 0
+        self.responder = lambda payload, headers: (200, dict(data=dict(ok=True)), None)
+
+    @property
+    def host(self) -> str:
+        return '127.0.0.1:{}'.format(self.server_address[1])
+
+    def finish_request(self, request, client_address):
+        from h2.config import H2Configuration
+        from h2.connection import H2Connection
+        from h2.events import RequestReceived, DataReceived, StreamEnded, ConnectionTerminated
+
+        sock = self.ssl_context.wrap_socket(request, server_side=True)
+        self.connections += 1
+        conn = H2Connection(config=H2Configuration(client_side=False, header_encoding='utf-8'))
+        lock = Lock()
+        streams = {}
+        with lock:
+            conn.initiate_connection()
+            sock.sendall(conn.data_to_send())
+        while True:
+            try:
+                data = sock.recv(65535)
+            except OSError:
+                return
+            if not data:
+                return
+            with lock:
+                for event in conn.receive_data(data):
+                    if isinstance(event, RequestReceived):
+                        streams[event.stream_id] = [dict(event.headers), b'']
+                    elif isinstance(event, DataReceived):
+                        streams[event.stream_id][1] += event.data
+                        conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, StreamEnded):
+                        # respond in parallel, the streams are multiplexed
+                        Thread(target=self.respond, args=(sock, conn, lock, event.stream_id,
+                                                          *streams.pop(event.stream_id)), daemon=True).start()
+                    elif isinstance(event, ConnectionTerminated):
+                        return
+                sock.sendall(conn.data_to_send())
+
+    def respond(self, sock, conn, lock, stream_id: int, headers: dict, body: bytes):
+        from h2.connection import ConnectionState
+        from h2.exceptions import ProtocolError, StreamClosedError
+
+        if self.delay:
+            sleep(self.delay)
+        payload = loads(body) if body else {}
+        self.requests.append(payload)
+        status, data, extra = self.responder(payload, headers)
+        content = dumps(data).encode('utf-8')
+        response = [(':status', str(status)), ('content-type', 'application/json'),
+                    ('content-length', str(len(content)))] + list((extra or {}).items())
+        with lock:
+            # the client closed the connection or reset the stream, e.g. it timed out
+            if conn.state_machine.state is ConnectionState.CLOSED:
+                return
+            try:
+                conn.send_headers(stream_id, response)
+                conn.send_data(stream_id, content, end_stream=True)
+                sock.sendall(conn.data_to_send())
+            except (ProtocolError, StreamClosedError, OSError):
+                return
+
+
+@fixture(scope='function')
+def h2_stub(tls_cert):
+    """ Start the HTTP/2 stub server, the shared HTTP/2 client trusts its certificate """
+    importorskip('h2')
+    httpx = importorskip('httpx')
+    from flask_shopify_utils import utils
+
+    server = H2StubServer(SSLContext(PROTOCOL_TLS_SERVER))
+    server.ssl_context.load_cert_chain(*tls_cert)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    utils.reset_http2_client()
+    utils._http2_client = httpx.Client(http2=True, verify=create_default_context(cafile=tls_cert[0]))
+    yield server
+    utils.reset_http2_client()
+    server.shutdown()
+    server.server_close()
+
+
+class FakeRedisHandler(StreamRequestHandler):
+    """ Speak enough RESP2 for the cache backends """
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            size = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def reply(self, value):
+        if value is None:
+            self.wfile.write(b'$-1\r\n')
+        elif isinstance(value, Exception):
+            self.wfile.write(b'-ERR %s\r\n' % str(value).encode('utf-8'))
+        elif isinstance(value, bool):
+            self.wfile.write(b'+OK\r\n')
+        elif isinstance(value, int):
+            self.wfile.write(b':%d\r\n' % value)
+        elif isinstance(value, list):
+            self.wfile.write(b'*%d\r\n' % len(value))
+            for val in value:
+                self.reply(val)
+        else:
+            self.wfile.write(b'$%d\r\n%s\r\n' % (len(value), value))
+
+    def handle(self):
+        while (args := self.read_command()) is not None:
+            self.server.commands.append(args)
+            name = args[0].upper().decode('utf-8')
+            with self.server.lock:
+                try:
+                    res = getattr(self.server, 'cmd_{}'.format(name.lower()))(*args[1:])
+                except AttributeError:
+                    res = Exception('unknown command {}'.format(name))
+            self.reply(res)
+
+
+class FakeRedisServer(ThreadingTCPServer):
+    """ In-memory Redis protocol server, `data` maps a key to (value, expires_at) """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeRedisHandler)
+        self.lock = Lock()
+        self.data = {}
+        self.commands = []
+
+    @property
+    def url(self) -> str:
+        return 'redis://127.0.0.1:{}/0'.format(self.server_address[1])
+
+    def _get(self, key):
+        item = self.data.get(key)
+        if item and item[1] and item[1] <= monotonic():
+            del self.data[key]
+            return None
+        return item
+
+    def cmd_ping(self, *args):
+        return True
+
+    def cmd_select(self, db):
+        return True
+
+    def cmd_get(self, key):
+        item = self._get(key)
+        return item[0] if item else None
+
+    def cmd_set(self, key, value, *options):
+        options = [val.upper() for val in options]
+        expires_at = 0
+        if b'PX' in options:
+            expires_at = monotonic() + int(options[options.index(b'PX') + 1]) / 1000
+        if b'NX' in options and self._get(key):
+            return None
+        self.data[key] = (value, expires_at)
+        return True
+
+    def cmd_del(self, *keys):
+        return sum(1 for key in keys if self._get(key) and self.data.pop(key))
+
+    def cmd_incrby(self, key, delta):
+        item = self._get(key)
+        value = (int(item[0]) if item else 0) + int(delta)
+        self.data[key] = (str(value).encode('utf-8'), item[1] if item else 0)
+        return value
+
+    def cmd_incr(self, key):
+        return self.cmd_incrby(key, 1)
+
+    def cmd_eval(self, script, numkeys, key, token, *args):
+        """ The compare-and-delete / compare-and-pexpire scripts of the Redis lock, the `RedisCache.incr` script """
+        if b'INCRBY' in script:
+            self.cmd_set(key, b'0', b'PX', args[0], b'NX')
+            return self.cmd_incrby(key, token)
+        item = self._get(key)
+        if not item or item[0] != token:
+            return 0
+        if b'PEXPIRE' in script:
+            return self.cmd_pexpire(key, *args)
+        return self.cmd_del(key)
+
+    def cmd_pexpire(self, key, ms):
+        item = self._get(key)
+        if not item:
+            return 0
+        self.data[key] = (item[0], monotonic() + int(ms) / 1000)
+        return 1
+
+    def cmd_scan(self, cursor, *options):
+        pattern = options[options.index(b'MATCH') + 1].decode('utf-8') if b'MATCH' in options else '*'
+        keys = [key for key in list(self.data) if self._get(key) and fnmatchcase(key.decode('utf-8'), pattern)]
+        return [b'0', keys]
+
+
+@fixture(scope='function')
+def fake_redis():
+    server = FakeRedisServer()
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
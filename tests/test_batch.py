@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : test_batch.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 23:40:00
+"""
+import asyncio
+from re import findall
+from time import perf_counter
+from pytest import mark, raises
+from sgqlc.operation import Operation
+from flask_shopify_utils.batch import BatchError
+from flask_shopify_utils.operation import prepared_operation
+from flask_shopify_utils.utils import GraphQLClient, AsyncGraphQLClient, ThrottleController
+from test_operation import Mutation, MetafieldsSetInput, set_metafields
+
+
+@prepared_operation('data')
+def set_metafield(data: list) -> Operation:
+    op = Operation(Mutation, 'SetMetafields')
+    op.metafields_set(metafields=data).metafields.__fields__('id')
+    return op
+
+
+def metafields_responder(payload, headers):
+    """ `metafieldsSet` of each alias, a value `bad` is a user error and `error` a GraphQL error """
+    data, errors = {}, []
+    for alias in findall(r'(m\d+): metafieldsSet', payload['query']):
+        metafields = (payload.get('variables') or {}).get(alias + '_data') or \
+            [dict(value=value) for value in findall(r'value: "(\w+)"', payload['query'].split(alias + ':')[1])[:1]]
+        value = metafields[0]['value']
+        if value == 'error':
+            data[alias] = None
+            errors.append(dict(message='Access denied', path=[alias]))
+            continue
+        user_errors = [dict(field=['value'], message='invalid')] if value == 'bad' else []
+        data[alias] = dict(metafields=[dict(id=value)], userErrors=user_errors)
+    return 200, dict(data=data, errors=errors) if errors else dict(data=data), None
+
+
+def test_mutation_batcher(graphql_stub):
+    graphql_stub.responder = metafields_responder
+    client = GraphQLClient(graphql_stub.host, 'token', throttle=ThrottleController())
+    with client.batch(max_size=4) as batcher:
+        futures = [batcher.submit(set_metafield([MetafieldsSetInput(owner_id=str(i), key='k', value='v{}'.format(i))]))
+                   for i in range(10)]
+        # the full batches are sent right away
+        assert batcher.requests == 2
+    assert batcher.requests == 3
+    assert [future.result()['metafieldsSet']['metafields'][0]['id'] for future in futures] == \
+        ['v{}'.format(i) for i in range(10)]
+    request = graphql_stub.requests[0]
+    assert request['query'].startswith('mutation BatchMutations($m0_data: [MetafieldsSetInput!]!, $m1_data: ')
+    assert request['variables']['m3_data'] == [dict(ownerId='3', key='k', value='v3')]
+    # the document is compiled once per sequence of shapes
+    assert len(batcher._documents) == 2
+
+
+def test_mutation_batcher_errors(graphql_stub):
+    graphql_stub.responder = metafields_responder
+    client = GraphQLClient(graphql_stub.host, 'token', throttle=ThrottleController())
+    batcher = client.batch(max_cost=30)
+    values = ['a', 'bad', 'error', 'b']
+    futures = [batcher.submit(set_metafield([MetafieldsSetInput(owner_id='1', key='k', value=value)]))
+               for value in values[:2]]
+    # an Operation with the inlined arguments is batched as well
+    futures += [batcher.submit(set_metafields('1', value)) for value in values[2:]]
+    batcher.flush()
+    # sized against the cost, 10 points per mutation
+    assert batcher.requests == 2
+    assert futures[0].result().user_errors == []
+    assert futures[1].result().user_errors == [dict(field=['value'], message='invalid')]
+    with raises(BatchError) as e:
+        futures[2].result()
+    assert e.value.errors == [dict(message='Access denied', path=['m2'])]
+    assert futures[3].result()['metafieldsSet']['metafields'] == [dict(id='b')]
+    with raises(TypeError):
+        batcher.submit('mutation { a }')
+
+
+def test_mutation_batcher_learns_cost(graphql_stub):
+    """ The cost of a mutation comes from `extensions.cost` of the previous batch """
+    def responder(payload, headers):
+        status, result, _ = metafields_responder(payload, headers)
+        cost = 4 * len(result['data'])
+        result['extensions'] = dict(cost=dict(requestedQueryCost=cost, throttleStatus=dict(
+            maximumAvailable=2000, currentlyAvailable=2000 - cost, restoreRate=100)))
+        return status, result, None
+
+    graphql_stub.responder = responder
+    client = GraphQLClient(graphql_stub.host, 'token', throttle=ThrottleController())
+    with client.batch(max_cost=40) as batcher:
+        for i in range(14):
+            batcher.submit(set_metafield([MetafieldsSetInput(owner_id=str(i), key='k', value='v')]))
+    # 5 mutations queued at 10 points, then the others at 4 points
+    assert batcher.mutation_cost == 4
+    assert [len(request['variables']) for request in graphql_stub.requests] == [4, 8, 2]
+
+
+def test_async_mutation_batcher(graphql_stub):
+    graphql_stub.responder = metafields_responder
+    client = AsyncGraphQLClient(graphql_stub.host, 'token', throttle=ThrottleController())
+
+    async def run():
+        async with client.batch(max_size=4) as batcher:
+            futures = [await batcher.submit(set_metafield([MetafieldsSetInput(owner_id='1', key='k', value=value)]))
+                       for value in ('a', 'b', 'error', 'c', 'd')]
+            assert batcher.requests == 1
+        return batcher, await asyncio.gather(*futures, return_exceptions=True)
+
+    batcher, results = asyncio.run(run())
+    assert batcher.requests == 2
+    assert [result['metafieldsSet']['metafields'][0]['id'] for result in results if isinstance(result, dict)] == \
+        ['a', 'b', 'c', 'd']
+    assert isinstance(results[2], BatchError) and results[2].errors == [dict(message='Access denied', path=['m2'])]
+
+
+@mark.benchmark
+def test_benchmark_mutation_batcher(graphql_stub):
+    """ Round trips of 100 metafield updates, one request per mutation against the batches """
+    graphql_stub.responder = metafields_responder
+    client = GraphQLClient(graphql_stub.host, 'token', throttle=ThrottleController())
+    ops = [set_metafield([MetafieldsSetInput(owner_id=str(i), key='k', value='v{}'.format(i))]) for i in range(100)]
+    start = perf_counter()
+    for op in ops:
+        client.fetch_data(op)
+    single = perf_counter() - start
+    graphql_stub.requests.clear()
+    start = perf_counter()
+    with client.batch() as batcher:
+        futures = [batcher.submit(op) for op in ops]
+    assert all(future.result() for future in futures)
+    assert perf_counter() - start < single
+    assert len(graphql_stub.requests) == 4
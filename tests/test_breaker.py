@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : test_breaker.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 19/10/2026 00:50:00
+"""
+import asyncio
+from pytest import raises
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from flask_shopify_utils import ShopifyUtil, breaker as breaker_module, utils
+from flask_shopify_utils.breaker import CircuitBreaker, CircuitOpenError
+from flask_shopify_utils.cache import MemoryCache, RedisCache
+from flask_shopify_utils.retry import RetryPolicy
+from flask_shopify_utils.utils import GraphQLClient, AsyncGraphQLClient, ThrottleController, create_restful_session
+
+
+def test_circuit_breaker_states(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(breaker_module, 'time', lambda: now[0])
+    breaker = CircuitBreaker(MemoryCache(), threshold=3, cooldown=30)
+    shop = 'test.myshopify.com'
+    for status in (401, 200, 503):
+        breaker.record(shop, status, breaker.before_request(shop))
+    # 429 and the other client errors are not failures
+    breaker.record(shop, 429)
+    breaker.record(shop, 403)
+    breaker.record(shop, 404)
+    assert breaker.get_state(shop) == 'closed'
+    breaker.failure(shop)
+    assert breaker.get_state(shop) == 'open'
+    with raises(CircuitOpenError) as e:
+        breaker.before_request(shop)
+    assert e.value.shop == shop and e.value.retry_in == 30
+    # a single probe after the cooldown, a failure opens the circuit again
+    now[0] += 30
+    assert breaker.get_state(shop) == 'half_open'
+    assert breaker.before_request(shop) is True
+    with raises(CircuitOpenError):
+        breaker.before_request(shop)
+    breaker.record(shop, 503, probe=True)
+    assert breaker.get_state(shop) == 'open'
+    # a successful probe closes it
+    now[0] += 30
+    breaker.record(shop, 200, breaker.before_request(shop))
+    assert breaker.get_state(shop) == 'closed'
+    assert breaker.before_request(shop) is False
+
+
+def test_circuit_breaker_shared(fake_redis, monkeypatch):
+    """ Two workers with the same cache """
+    now = [1000.0]
+    monkeypatch.setattr(breaker_module, 'time', lambda: now[0])
+    worker1 = CircuitBreaker(RedisCache(fake_redis.url), threshold=2, cooldown=60)
+    worker2 = CircuitBreaker(RedisCache(fake_redis.url), threshold=2, cooldown=60)
+    shop = 'test.myshopify.com'
+    worker1.failure(shop)
+    worker2.failure(shop)
+    with raises(CircuitOpenError):
+        worker1.before_request(shop)
+    # one probe for all the workers
+    now[0] += 60
+    assert worker2.before_request(shop) is True
+    with raises(CircuitOpenError):
+        worker1.before_request(shop)
+    worker2.record(shop, 200, probe=True)
+    assert worker1.before_request(shop) is False
+
+
+def test_graphql_client_circuit_breaker(graphql_stub, monkeypatch):
+    monkeypatch.setattr(utils, 'sleep', lambda delay: None)
+    breaker = CircuitBreaker(MemoryCache(), threshold=3, cooldown=60)
+    graphql_stub.responder = lambda payload, headers: (401, dict(errors='[API] Invalid API key or access token'), None)
+    client = GraphQLClient(graphql_stub.host, 'token', throttle=ThrottleController(), breaker=breaker,
+                           retry_policy=RetryPolicy(jitter=False))
+    for _ in range(3):
+        with raises(Exception, match='Invalid API key'):
+            client.fetch_data('{ a }')
+    # fail fast, nothing is sent
+    with raises(CircuitOpenError):
+        client.fetch_data('{ a }')
+    assert len(graphql_stub.requests) == 3
+    # a call is counted once, after its retries
+    breaker.reset(graphql_stub.host)
+    graphql_stub.responder = lambda payload, headers: (503, dict(errors=[dict(message='Unavailable')]), None)
+    for _ in range(3):
+        assert breaker.get_state(graphql_stub.host) == 'closed'
+        with raises(Exception, match='Unavailable'):
+            client.fetch_data('{ a }', attempts=2)
+    with raises(CircuitOpenError):
+        client.fetch_data('{ a }')
+    assert len(graphql_stub.requests) == 3 + 3 * 3
+    # a missing scope is not a failure of the shop
+    breaker.reset(graphql_stub.host)
+    graphql_stub.responder = lambda payload, headers: (403, dict(errors='Forbidden'), None)
+    for _ in range(5):
+        with raises(Exception, match='Forbidden'):
+            client.fetch_data('{ a }')
+    assert breaker.get_state(graphql_stub.host) == 'closed'
+
+
+def test_async_graphql_client_circuit_breaker(graphql_stub, monkeypatch):
+    async def no_sleep(delay):
+        pass
+
+    monkeypatch.setattr(utils.asyncio, 'sleep', no_sleep)
+    breaker = CircuitBreaker(MemoryCache(), threshold=2, cooldown=60)
+    graphql_stub.responder = lambda payload, headers: (503, dict(errors=[dict(message='Unavailable')]), None)
+    client = AsyncGraphQLClient(graphql_stub.host, 'token', throttle=ThrottleController(), breaker=breaker,
+                                retry_policy=RetryPolicy(jitter=False))
+    for _ in range(2):
+        with raises(Exception, match='Unavailable'):
+            asyncio.run(client.fetch_data('{ a }', attempts=1))
+    with raises(CircuitOpenError):
+        asyncio.run(client.fetch_data('{ a }'))
+    assert len(graphql_stub.requests) == 4
+
+
+def test_restful_circuit_breaker(graphql_stub):
+    breaker = CircuitBreaker(MemoryCache(), threshold=2, cooldown=60)
+    graphql_stub.responder = lambda payload, headers: (403, dict(errors='Forbidden'), None)
+    session = create_restful_session('token', transport='requests', breaker=breaker)
+    url = 'https://{}/admin/api/2026-10/customers.json'.format(graphql_stub.host)
+    for _ in range(3):
+        assert session.request('POST', url, json=dict(customer=dict())).status_code == 403
+    graphql_stub.responder = lambda payload, headers: (401, dict(errors='Unauthorized'), None)
+    for _ in range(2):
+        assert session.request('POST', url, json=dict(customer=dict())).status_code == 401
+    with raises(CircuitOpenError):
+        session.request('POST', url, json=dict(customer=dict()))
+    assert len(graphql_stub.requests) == 5
+
+
+def test_shopify_util_circuit_breaker(initial_test_client, graphql_stub):
+    client, test, utils = initial_test_client
+    # opt-in
+    assert utils.circuit_breaker is None
+    assert GraphQLClient(graphql_stub.host, 'token').breaker is None
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SHOPIFY_CIRCUIT_BREAKER_THRESHOLD'] = 5
+    SQLAlchemy().init_app(app)
+    utils = ShopifyUtil(app)
+    breaker = utils.circuit_breaker
+    assert breaker is not None and breaker.cache is utils.cache
+    shop = graphql_stub.host
+    with app.app_context():
+        assert GraphQLClient(shop, 'token').breaker is breaker
+        for _ in range(breaker.threshold):
+            breaker.failure(shop)
+        with raises(CircuitOpenError):
+            GraphQLClient(shop, 'token').fetch_data('{ a }')
+        # the app is installed again
+        utils.forget_store(shop)
+        assert GraphQLClient(shop, 'token').fetch_data('{ a }') == dict(ok=True)
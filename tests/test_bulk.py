@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : test_bulk.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 14:40:00
+"""
+import tracemalloc
+from json import dumps
+from threading import Timer
+from pytest import mark, param, raises
+from flask_shopify_utils.utils import GraphQLClient, ThrottleController
+from flask_shopify_utils.bulk import BulkOperationRunner, BulkOperationError, iter_objects, notify_finished, \
+    _finished_events
+
+OPERATION_ID = 'gid://shopify/BulkOperation/1'
+
+
+def product_rows(products: int, variants: int = 3):
+    """ Canned JSONL of a products + variants bulk query, generated on the fly """
+    for i in range(products):
+        yield dict(id='gid://shopify/Product/{}'.format(i), title='Product {}'.format(i))
+        for j in range(variants):
+            yield dict(id='gid://shopify/ProductVariant/{}{:03d}'.format(i, j), sku='SKU-{}-{}'.format(i, j),
+                       __parentId='gid://shopify/Product/{}'.format(i))
+
+
+def jsonl_file(products: int, variants: int = 3, batch: int = 500):
+    def factory():
+        buffer = []
+        for row in product_rows(products, variants):
+            buffer.append(dumps(row).encode('utf-8'))
+            if len(buffer) >= batch:
+                yield b'\n'.join(buffer) + b'\n'
+                buffer = []
+        if buffer:
+            yield b'\n'.join(buffer) + b'\n'
+
+    return factory
+
+
+def bulk_responder(host: str, statuses: list):
+    def responder(payload, headers):
+        query = payload['query']
+        if 'bulkOperationRunQuery' in query:
+            data = dict(bulkOperationRunQuery=dict(bulkOperation=dict(id=OPERATION_ID, status='CREATED'),
+                                                   userErrors=[]))
+        else:
+            status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+            data = dict(node=dict(id=OPERATION_ID, status=status, errorCode=None, objectCount='0',
+                                  url='https://{}/result.jsonl'.format(host) if status == 'COMPLETED' else None))
+        return 200, dict(data=data), None
+
+    return responder
+
+
+def test_iter_objects():
+    rows = [
+        dict(id='gid://shopify/Product/1'),
+        dict(id='gid://shopify/ProductVariant/11', __parentId='gid://shopify/Product/1'),
+        dict(id='gid://shopify/InventoryLevel/111', __parentId='gid://shopify/ProductVariant/11'),
+        dict(id='gid://shopify/ProductImage/12', __parentId='gid://shopify/Product/1'),
+        dict(id='gid://shopify/Product/2'),
+    ]
+    products = list(iter_objects(iter(rows)))
+    assert [product['id'] for product in products] == ['gid://shopify/Product/1', 'gid://shopify/Product/2']
+    children = products[0]['__children']
+    assert [val['id'] for val in children['ProductVariant']] == ['gid://shopify/ProductVariant/11']
+    assert children['ProductVariant'][0]['__children']['InventoryLevel'][0]['id'] == 'gid://shopify/InventoryLevel/111'
+    assert len(children['ProductImage']) == 1
+    with raises(BulkOperationError):
+        list(iter_objects(iter([dict(id='gid://shopify/ProductVariant/1', __parentId='gid://shopify/Product/9')])))
+
+
+def test_run_query(graphql_stub):
+    graphql_stub.files['/result.jsonl'] = jsonl_file(products=10)
+    graphql_stub.responder = bulk_responder(graphql_stub.host, ['RUNNING', 'RUNNING', 'COMPLETED'])
+    client = GraphQLClient(graphql_stub.host, 'token', throttle=ThrottleController())
+    runner = BulkOperationRunner(client, poll_interval=0.01)
+    products = list(runner.run_query('{ products { edges { node { id } } } }'))
+    assert len(products) == 10
+    assert all(len(product['__children']['ProductVariant']) == 3 for product in products)
+    assert graphql_stub.requests[0]['variables'] == dict(query='{ products { edges { node { id } } } }')
+
+
+def test_wait_woken_by_webhook(graphql_stub):
+    graphql_stub.responder = bulk_responder(graphql_stub.host, ['RUNNING', 'COMPLETED'])
+    client = GraphQLClient(graphql_stub.host, 'token', throttle=ThrottleController())
+    runner = BulkOperationRunner(client, poll_interval=60)
+    Timer(0.1, notify_finished, [dict(admin_graphql_api_id=OPERATION_ID, status='completed')]).start()
+    assert runner.wait(OPERATION_ID)['status'] == 'COMPLETED'
+    assert OPERATION_ID not in _finished_events
+
+
+def test_notify_finished_without_runner():
+    notify_finished(dict(admin_graphql_api_id='gid://shopify/BulkOperation/2', status='completed'))
+    assert 'gid://shopify/BulkOperation/2' not in _finished_events
+
+
+def test_wait_failed(graphql_stub):
+    graphql_stub.responder = bulk_responder(graphql_stub.host, ['FAILED'])
+    client = GraphQLClient(graphql_stub.host, 'token', throttle=ThrottleController())
+    with raises(BulkOperationError):
+        BulkOperationRunner(client, poll_interval=0.01).wait(OPERATION_ID)
+
+
+@mark.parametrize('products', [4000, param(40000, marks=mark.benchmark)])
+def test_stream_memory_is_flat(graphql_stub, products):
+    """ ~1.4 MB of JSONL (~14 MB for the benchmark), the peak memory must not follow the file size """
+    graphql_stub.files['/result.jsonl'] = jsonl_file(products=products)
+    graphql_stub.responder = bulk_responder(graphql_stub.host, ['COMPLETED'])
+    client = GraphQLClient(graphql_stub.host, 'token', throttle=ThrottleController())
+    runner = BulkOperationRunner(client, poll_interval=0.01)
+    tracemalloc.start()
+    try:
+        count = sum(1 for _ in runner.run_query('{ products { edges { node { id } } } }'))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert count == products
+    assert peak < 1024 * 1024
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : test_cache.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 16:05:00
+"""
+import os
+from threading import Thread, Barrier, Lock
+from time import sleep
+from pytest import fixture, raises
+from flask_shopify_utils.cache import MemoryCache, FileSystemCache, RedisCache, create_cache, register_cache, \
+    CACHE_TYPES
+
+
+@fixture(params=['memory', 'filesystem', 'redis'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        yield MemoryCache(threshold=100)
+    elif request.param == 'filesystem':
+        yield FileSystemCache(str(tmp_path / 'cache'), threshold=100)
+    else:
+        yield RedisCache(request.getfixturevalue('fake_redis').url)
+
+
+def test_cache_backend(backend):
+    assert backend.get('a') is None and backend.get('a', 1) == 1
+    assert backend.set('a', dict(id=1, scopes=['read_products']))
+    assert backend.get('a') == dict(id=1, scopes=['read_products'])
+    assert not backend.add('a', 2)
+    assert backend.add('b', 2) and backend.get('b') == 2
+    assert backend.incr('counter') == 1 and backend.incr('counter', 5) == 6 and backend.get('counter') == 6
+    assert backend.delete('a') and not backend.delete('a')
+    backend.set('short', 1, timeout=0.2)
+    backend.set('forever', 1, timeout=0)
+    assert backend.incr('expiring', timeout=0.2) == 1 and backend.incr('expiring', timeout=0.2) == 2
+    sleep(0.3)
+    assert backend.get('short') is None and backend.get('forever') == 1 and backend.get('expiring') is None
+    assert backend.add('short', 3)
+    assert backend.clear() and backend.get('b') is None
+
+
+def test_cache_stampede_protection(backend):
+    calls, lock = [], Lock()
+    barrier = Barrier(8)
+    results = []
+
+    def compute():
+        with lock:
+            calls.append(1)
+        sleep(0.2)
+        return 'value'
+
+    def worker():
+        barrier.wait()
+        results.append(backend.get_or_set('expensive', compute, lock_timeout=5, wait=0.01))
+
+    threads = [Thread(target=worker) for _ in range(8)]
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+    assert results == ['value'] * 8
+    assert len(calls) == 1
+    assert backend.get('expensive:lock') is None
+
+
+def test_cache_get_or_set_checks_after_lock():
+    """ The holder sets the value and releases the lock between the miss and the lock of a waiter """
+
+    class LateCache(MemoryCache):
+        misses = 1
+
+        def get(self, key, default=None):
+            if self.misses:
+                self.misses -= 1
+                return default
+            return super().get(key, default)
+
+    cache = LateCache()
+    cache.set('expensive', 'value')
+    assert cache.get_or_set('expensive', lambda: 'computed again') == 'value'
+
+
+def test_filesystem_cache_is_shared_across_processes(tmp_path):
+    cache = FileSystemCache(str(tmp_path / 'cache'))
+    pid = os.fork()
+    if pid == 0:
+        # the child is another worker with its own instance
+        child = FileSystemCache(str(tmp_path / 'cache'))
+        child.set('from_child', os.getpid())
+        child.incr('workers')
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert cache.get('from_child') == pid
+    assert cache.incr('workers') == 2
+
+
+def test_filesystem_cache_corrupted_file(tmp_path):
+    cache = FileSystemCache(str(tmp_path / 'cache'))
+    cache.set('a', 'value')
+    filename = cache._get_filename('a')
+    with open(filename, 'rb') as f:
+        data = f.read()
+    for corrupted in (data[:len(data) // 2], b'garbage', b''):
+        with open(filename, 'wb') as f:
+            f.write(corrupted)
+        assert cache.get('a') is None
+        assert not os.path.exists(filename)
+    assert cache.get_or_set('a', lambda: 'computed') == 'computed'
+
+
+def test_filesystem_cache_threshold(tmp_path):
+    cache = FileSystemCache(str(tmp_path / 'cache'), threshold=10)
+    for i in range(100):
+        cache.set('key{}'.format(i), i)
+    assert len([val for val in os.listdir(str(tmp_path / 'cache')) if val.endswith('.cache')]) <= 10
+    assert cache.get('key99') == 99
+
+
+def test_redis_cache_prefix(fake_redis):
+    cache = RedisCache(fake_redis.url, key_prefix='app1:')
+    other = RedisCache(fake_redis.url, key_prefix='app2:')
+    cache.set('a', 1)
+    other.set('a', 2)
+    assert cache.get('a') == 1
+    cache.clear()
+    assert cache.get('a') is None and other.get('a') == 2
+    assert [b'SET', b'app1:a'] == fake_redis.commands[0][:2]
+    # the counter and its expiry in one atomic command
+    fake_redis.commands.clear()
+    cache.incr('counter', timeout=10)
+    assert [b'EVAL'] == [command[0] for command in fake_redis.commands]
+
+
+def test_create_cache(tmp_path):
+    assert isinstance(create_cache(dict()), MemoryCache)
+    cache = create_cache(dict(SHOPIFY_CACHE_TYPE='filesystem', SHOPIFY_CACHE_DIR=str(tmp_path)))
+    assert isinstance(cache, FileSystemCache) and cache.shared
+    with raises(ValueError):
+        create_cache(dict(SHOPIFY_CACHE_TYPE='memcached'))
+    register_cache('custom', lambda config: MemoryCache(threshold=1))
+    try:
+        assert create_cache(dict(SHOPIFY_CACHE_TYPE='custom')).threshold == 1
+    finally:
+        CACHE_TYPES.pop('custom')
+
+
+def test_shopify_util_cache(initial_test_client):
+    client, test, utils = initial_test_client
+    test.assertIsInstance(utils.cache, MemoryCache)
+    test.assertEqual(300, utils.cache.default_timeout)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : test_codegen.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 22:20:00
+"""
+import json
+import sys
+from os import path
+from shutil import copyfile
+from subprocess import run
+from types import ModuleType
+from graphql import build_schema, introspection_from_schema
+from pytest import fixture, mark
+from sgqlc.codegen import get_arg_parse
+from flask_shopify_utils.codegen import split_schema, scan_operations, prune_introspection
+
+SCHEMA_DIR = path.join(path.dirname(__file__), '..', 'example', 'example1', 'backend', 'app', 'schemas')
+SCHEMA_FILE = path.join(SCHEMA_DIR, 'shopify.py')
+OPERATION_FILES = [path.join(SCHEMA_DIR, 'default_query.py'), path.join(SCHEMA_DIR, 'default_mutation.py')]
+
+# import the schema, then build a query and use an input, as a route of the example app does
+BENCHMARK_SCRIPT = '''
+import json
+import sys
+from time import perf_counter
+from psutil import Process
+import flask_shopify_utils.codegen
+from sgqlc.operation import Operation
+
+rss = Process().memory_info().rss
+start = perf_counter()
+module = __import__(sys.argv[1])
+op = Operation(module.shopify.query_type)
+op.webhook_subscriptions(first=10).nodes.__fields__('id', 'callback_url')
+str(op)
+module.DiscountCodeAppInput(title='test')
+with open(sys.argv[2], 'w') as f:
+    json.dump(dict(duration=perf_counter() - start, rss=Process().memory_info().rss - rss), f)
+'''
+
+
+@fixture(scope='module')
+def schema_dir(tmp_path_factory):
+    target = tmp_path_factory.mktemp('schemas')
+    copyfile(SCHEMA_FILE, str(target / 'shopify_single.py'))
+    with open(SCHEMA_FILE) as f:
+        modules = split_schema(f.read(), str(target / 'shopify_lazy'))
+    sys.path.insert(0, str(target))
+    yield target, modules
+    sys.path.remove(str(target))
+    for name in list(sys.modules):
+        if name.startswith('shopify_'):
+            del sys.modules[name]
+
+
+def test_split_schema(schema_dir):
+    target, modules = schema_dir
+    assert '_interfaces_01' in modules
+    assert 'QueryRoot' in [name for names in modules.values() for name in names]
+    with open(str(target / 'shopify_lazy' / '__init__.py')) as f:
+        init = f.read()
+    assert init.startswith('# API Version: ')
+    assert "shopify.query_type = 'QueryRoot'" in init
+
+    from shopify_lazy import shopify
+    loaded = lambda: [name for name in sys.modules if name.startswith('shopify_lazy.')]  # noqa: E731
+    assert loaded() == []
+    from shopify_lazy import MetafieldsSetInput
+    assert loaded() == ['shopify_lazy.{}'.format(shopify.index['MetafieldsSetInput'])]
+    assert 'MetafieldsSetInput' in shopify and 'Unknown' not in shopify
+    assert shopify.query_type.__name__ == 'QueryRoot'
+    assert MetafieldsSetInput(key='k', namespace='n', owner_id='1', value='v', type='string')
+
+
+def test_split_schema_parity(schema_dir):
+    """ The split package declares the same types as the single module """
+    from shopify_single import shopify as single
+    from shopify_lazy import shopify as lazy
+
+    types = {t.__name__: repr(t) for t in single}
+    assert types == {t.__name__: repr(t) for t in lazy}
+    assert repr(single['DiscountCodeBasic'].codes) == repr(lazy['DiscountCodeBasic'].codes)
+    assert [t.__name__ for t in lazy['AppPricingDetails']] == ['AppRecurringPricing', 'AppUsagePricing']
+    assert lazy.mutation_type.__name__ == 'Mutation'
+
+
+def load_operations(schema_module: str) -> tuple:
+    """ The example query and mutation builders on another schema module """
+    operations = []
+    for file_path in OPERATION_FILES:
+        with open(file_path) as f:
+            source = f.read()
+        for line in ['from .shopify import shopify as', 'from app.schemas.shopify import shopify as']:
+            source = source.replace(line, 'from {0} import shopify as'.format(schema_module))
+        module = ModuleType(path.basename(file_path)[:-3])
+        exec(compile(source, file_path, 'exec'), module.__dict__)
+        operations.append(module)
+    return tuple(operations)
+
+
+def render_operations(query, mutation) -> list:
+    code = mutation.DiscountCodeAppInput(title='Sale', function_handle='discount', starts_at='2026-10-18T00:00:00')
+    webhook = mutation.WebhookSubscriptionInput(uri='https://example.com/webhook', format='JSON')
+    ops = [
+        query.query_webhooks('cursor'),
+        query.query_delivery_customization('gid://shopify/DeliveryCustomization/1', 'ns', 'key'),
+        query.query_payment_customization('gid://shopify/PaymentCustomization/1', 'ns', 'key'),
+        mutation.update_meta('gid://shopify/Product/1', '{}', 'ns', 'key'),
+        mutation.create_discount_code(code),
+        mutation.update_discount_code('gid://shopify/DiscountCodeNode/1', code),
+        mutation.create_webhooks({'ORDERS_CREATE': webhook}),
+        mutation.revoke_webhooks({'ORDERS_CREATE': dict(id='gid://shopify/WebhookSubscription/1')}),
+        mutation.delete_payment_customization('gid://shopify/PaymentCustomization/1'),
+    ]
+    return [str(op) for op in ops]
+
+
+@fixture(scope='module')
+def introspection(schema_dir):
+    """ The introspection result of the example schema, as `generate_schema` fetches it """
+    from shopify_single import shopify
+
+    types = []
+    for t in shopify:
+        if t.__name__ not in ['Int', 'Float', 'String', 'Boolean', 'ID']:
+            declaration, sep, fields = repr(t).partition('\n')
+            # sgqlc renders the interfaces of a type separated by commas
+            if ' implements ' in declaration:
+                declaration = declaration.replace(', ', ' & ')
+            types.append(declaration + sep + fields)
+    types.append('schema { query: QueryRoot mutation: Mutation }')
+    return dict(data=introspection_from_schema(build_schema('\n'.join(types)), descriptions=False))
+
+
+def generate(data: dict, target) -> None:
+    json_file = str(target) + '.json'
+    with open(json_file, 'w') as f:
+        json.dump(data, f)
+    args = get_arg_parse().parse_args(['schema', '--schema-name', 'shopify', json_file, str(target)])
+    args.func(args)
+
+
+@fixture(scope='module')
+def pruned_schema(schema_dir, introspection) -> dict:
+    """ Generate `shopify_pruned` for the operations of the example app """
+    target, modules = schema_dir
+    data = prune_introspection(introspection, scan_operations(OPERATION_FILES))
+    generate(data, target / 'shopify_pruned.py')
+    return data
+
+
+def test_prune_schema(schema_dir, introspection, pruned_schema):
+    names = scan_operations(OPERATION_FILES)
+    assert {'webhook_subscriptions', 'MetafieldsSetInput', 'user_errors'} <= names
+    types = {t['name']: t for t in pruned_schema['data']['__schema']['types']}
+    assert len(types) < len(introspection['data']['__schema']['types']) / 10
+    assert {'QueryRoot', 'Mutation', 'WebhookSubscription', 'MetafieldsSetInput', 'DiscountCodeAppInput'} <= set(types)
+    assert 'Product' not in types
+    # the input objects are kept whole
+    assert len(types['DiscountCodeAppInput']['inputFields']) == len(
+        [t for t in introspection['data']['__schema']['types'] if t['name'] == 'DiscountCodeAppInput'][0]['inputFields'])
+    assert render_operations(*load_operations('shopify_pruned')) == render_operations(*load_operations('shopify_single'))
+
+
+def test_prune_schema_documents(tmp_path, introspection):
+    document = tmp_path / 'shop.graphql'
+    document.write_text('query Shop { shop { name currencyCode plan: plan { publicDisplayName } } }')
+    data = prune_introspection(introspection, scan_operations([str(tmp_path)]))
+    types = {t['name']: t for t in data['data']['__schema']['types']}
+    fields = [f['name'] for f in types['QueryRoot']['fields'] if f['type']['kind'] != 'SCALAR']
+    assert 'shop' in fields
+    assert {'Shop', 'CurrencyCode', 'ShopPlan'} <= set(types)
+    assert 'Mutation' not in types or not types['Mutation']['fields']
+
+
+@mark.benchmark
+def test_benchmark_schema_import(schema_dir, pruned_schema):
+    """ Import time and RSS of the schema: the single module, the lazy package and the pruned module """
+    target, modules = schema_dir
+    results = {}
+    for name in ['shopify_single', 'shopify_lazy', 'shopify_pruned']:
+        # the first run writes the bytecode cache
+        for _ in range(2):
+            run([sys.executable, '-c', BENCHMARK_SCRIPT, name, str(target / 'result.json')], cwd=str(target),
+                capture_output=True, check=True)
+        with open(target / 'result.json') as f:
+            results[name] = json.load(f)
+    single, lazy, pruned = results['shopify_single'], results['shopify_lazy'], results['shopify_pruned']
+    # the lazy package loads a fraction of the types, the pruned module only the used ones
+    assert lazy['duration'] < single['duration'] / 2 and lazy['rss'] < single['rss'] / 2
+    assert pruned['duration'] < lazy['duration'] and pruned['rss'] < lazy['rss']
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : test_form_validate.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 21:05:00
+"""
+from time import perf_counter
+from cerberus.schema import SchemaError
+from pytest import mark, raises
+import flask_shopify_utils
+
+
+def get_schema() -> dict:
+    """ A new dict per call, like the customization helpers """
+    date_regex = r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}$'
+    return dict(
+        id=dict(type='integer', required=False, nullable=True),
+        title=dict(type='string', required=True, maxlength=64),
+        enabled=dict(type='boolean', required=True),
+        start_date=dict(type='string', required=True, regex=date_regex),
+        rules=dict(type='list', required=True, schema=dict(type='dict', schema=dict(
+            key=dict(type='string', required=True, allowed=['country', 'zip']),
+            value=dict(type='string', required=True),
+        ))),
+    )
+
+
+DATA = dict(id=None, title='Hide express', enabled=True, start_date='2026-10-18T00:00:00',
+            rules=[dict(key='country', value='NZ')])
+
+
+def count_compile(monkeypatch) -> list:
+    calls = []
+    validator_cls = flask_shopify_utils.Validator
+
+    def wrapper(schema=None, *args, **kwargs):
+        if not isinstance(schema, flask_shopify_utils.DefinitionSchema):
+            calls.append(1)
+        return validator_cls(schema, *args, **kwargs)
+
+    monkeypatch.setattr(flask_shopify_utils, 'Validator', wrapper)
+    return calls
+
+
+def test_form_validate_cache(initial_test_client, monkeypatch):
+    client, test, utils = initial_test_client
+    utils._schema_cache.clear()
+    calls = count_compile(monkeypatch)
+    for _ in range(3):
+        rs, resp = utils.form_validate(DATA, get_schema())
+        test.assertTrue(rs)
+    test.assertEqual(1, len(calls))
+    rs, resp = utils.form_validate(dict(DATA, rules=[dict(key='city', value='x')]), get_schema())
+    test.assertFalse(rs)
+    test.assertEqual('rules.0.key: unallowed value city', resp.get_json()['message'])
+    # another definition is compiled
+    utils.form_validate(DATA, dict(get_schema(), title=dict(type='string')))
+    test.assertEqual(2, len(calls))
+
+
+def test_form_validate_normalization(initial_test_client):
+    client, test, utils = initial_test_client
+    schema = dict(get_schema(), id=dict(type='integer', required=True, coerce=int))
+    test.assertTrue(utils.form_validate(dict(DATA, id='5'), schema)[0])
+    test.assertFalse(utils.form_validate(dict(DATA, id='5'), get_schema())[0])
+    test.assertTrue(flask_shopify_utils.needs_normalization(dict(
+        rules=dict(type='list', schema=dict(type='dict', schema=dict(key=dict(default='country')))))))
+    test.assertFalse(flask_shopify_utils.needs_normalization(get_schema()))
+
+
+def test_register_schema(initial_test_client, monkeypatch):
+    client, test, utils = initial_test_client
+    utils.register_schema('test_customization', get_schema())
+    calls = count_compile(monkeypatch)
+    test.assertTrue(utils.form_validate(DATA, 'test_customization')[0])
+    rs, resp = utils.form_validate(dict(DATA, enabled='yes'), 'test_customization', True)
+    test.assertFalse(rs)
+    test.assertEqual('enabled: must be of boolean type', resp.get_json()['message'])
+    test.assertEqual(0, len(calls))
+    with raises(ValueError):
+        utils.form_validate(DATA, 'unknown')
+    with raises(SchemaError):
+        utils.register_schema('invalid', dict(title=dict(type='text')))
+
+
+@mark.benchmark
+def test_benchmark_form_validate(initial_test_client, monkeypatch):
+    """ Validations of a schema built per call, with and without the cache, and of a registered schema """
+    client, test, utils = initial_test_client
+    rounds = 2000
+    durations = {}
+    for threshold in [0, 256]:
+        monkeypatch.setitem(utils.config, 'SHOPIFY_SCHEMA_CACHE_THRESHOLD', threshold)
+        start = perf_counter()
+        for _ in range(rounds):
+            utils.form_validate(DATA, get_schema())
+        durations[threshold] = perf_counter() - start
+    utils.register_schema('benchmark', get_schema())
+    start = perf_counter()
+    for _ in range(rounds):
+        utils.form_validate(DATA, 'benchmark')
+    registered = perf_counter() - start
+    test.assertLess(durations[256], durations[0])
+    test.assertLess(registered, durations[0])
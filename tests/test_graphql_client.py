@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : test_graphql_client.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 10:12:00
+"""
+import asyncio
+import json
+from hashlib import sha256
+from re import search
+from threading import Lock
+from time import perf_counter, sleep
+from pytest import raises, approx, mark
+from flask_shopify_utils import utils
+from flask_shopify_utils.operation import query_registry
+from flask_shopify_utils.utils import GraphQLClient, register_transport, TRANSPORTS, _urllib_transport, \
+    ThrottleController, AsyncGraphQLClient
+
+
+def percentile(values: list, pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def cost_extensions(available: float, requested: float = 100, maximum: float = 2000, rate: float = 100) -> dict:
+    return dict(cost=dict(
+        requestedQueryCost=requested,
+        actualQueryCost=requested,
+        throttleStatus=dict(maximumAvailable=maximum, currentlyAvailable=available, restoreRate=rate),
+    ))
+
+
+def test_unknown_transport():
+    with raises(ValueError):
+        GraphQLClient('test.myshopify.com', 'token', transport='carrier-pigeon')
+
+
+def test_register_transport():
+    register_transport('custom', _urllib_transport)
+    try:
+        client = GraphQLClient('test.myshopify.com', 'token', transport='custom')
+        assert client.transport == 'custom'
+    finally:
+        TRANSPORTS.pop('custom')
+
+
+def test_pooled_transport_reuses_connection(graphql_stub):
+    for _ in range(5):
+        # a new client per call, the same as the webhook/admin handlers
+        client = GraphQLClient(graphql_stub.host, 'token', transport='requests')
+        assert client.fetch_data('{ shop { name } }') == dict(ok=True)
+    assert graphql_stub.handshakes == 1
+    assert graphql_stub.requests[0]['query'] == '{ shop { name } }'
+
+
+def test_transport_handshakes(graphql_stub):
+    """ One new client per request, the pooled transport keeps a single connection """
+    for transport in ['urllib', 'requests']:
+        graphql_stub.handshakes = 0
+        for _ in range(5):
+            GraphQLClient(graphql_stub.host, 'token', transport=transport).fetch_data('{ shop { name } }')
+        assert graphql_stub.handshakes == (5 if transport == 'urllib' else 1)
+
+
+@mark.benchmark
+def test_benchmark_transport(graphql_stub, record_property):
+    """ Handshake counts and p50/p99 latency, one new client per request """
+    rounds = 200
+    latency = {}
+    for transport in ['urllib', 'requests']:
+        graphql_stub.handshakes = 0
+        durations = []
+        for _ in range(rounds):
+            start = perf_counter()
+            GraphQLClient(graphql_stub.host, 'token', transport=transport).fetch_data('{ shop { name } }')
+            durations.append((perf_counter() - start) * 1000)
+        latency[transport] = percentile(durations, 50), percentile(durations, 99)
+        record_property('{}_p50_ms'.format(transport), round(latency[transport][0], 3))
+        record_property('{}_p99_ms'.format(transport), round(latency[transport][1], 3))
+        assert graphql_stub.handshakes == (rounds if transport == 'urllib' else 1)
+    # no TLS handshake per request, at the median and in the tail
+    assert latency['requests'][0] < latency['urllib'][0]
+    assert latency['requests'][1] < latency['urllib'][1]
+
+
+def test_throttle_controller_delay():
+    throttle = ThrottleController()
+    assert throttle.get_delay('a.myshopify.com') == 0
+    throttle.update('a.myshopify.com', dict(extensions=cost_extensions(available=50, requested=150)))
+    # 100 points missing at 100 points/s
+    assert throttle.get_delay('a.myshopify.com') == approx(1, abs=0.05)
+    assert throttle.get_delay('a.myshopify.com', cost=10) == 0
+    # a query can never cost more than the bucket size
+    assert throttle.get_delay('a.myshopify.com', cost=5000) == approx(19.5, abs=0.05)
+    assert throttle.get_delay('b.myshopify.com') == 0
+
+
+def test_fetch_data_waits_for_bucket(graphql_stub, monkeypatch):
+    delays = []
+    monkeypatch.setattr(utils, 'sleep', delays.append)
+    responses = [
+        (200, dict(data=dict(n=1), extensions=cost_extensions(available=20, requested=120)), None),
+        (200, dict(data=dict(n=2), extensions=cost_extensions(available=1000, requested=120)), None),
+    ]
+    graphql_stub.responder = lambda payload, headers: responses.pop(0)
+    client = GraphQLClient(graphql_stub.host, 'token', throttle=ThrottleController())
+    assert client.fetch_data('{ a }') == dict(n=1)
+    assert delays == []
+    assert client.fetch_data('{ a }') == dict(n=2)
+    assert len(delays) == 1 and delays[0] == approx(1, abs=0.05)
+
+
+def test_fetch_data_throttled(graphql_stub, monkeypatch):
+    delays = []
+    monkeypatch.setattr(utils, 'sleep', delays.append)
+    throttled = dict(errors=[dict(message='Throttled')], extensions=cost_extensions(available=10, requested=210))
+    responses = [(200, throttled, None), (200, dict(data=dict(ok=True)), None)]
+    graphql_stub.responder = lambda payload, headers: responses.pop(0)
+    client = GraphQLClient(graphql_stub.host, 'token', throttle=ThrottleController())
+    assert client.fetch_data('{ a }') == dict(ok=True)
+    # 200 points missing at 100 points/s, instead of the fixed 2 seconds
+    assert len(delays) == 1 and delays[0] == approx(2, abs=0.05)
+    # give up after the attempts
+    graphql_stub.responder = lambda payload, headers: (200, throttled, None)
+    with raises(Exception):
+        client.fetch_data('{ a }', attempts=1)
+
+
+def test_async_gather_is_bounded(graphql_stub):
+    running, peak = [0], [0]
+    lock = Lock()
+
+    def responder(payload, headers):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return 200, dict(data=dict(query=payload['query'])), None
+
+    graphql_stub.responder = responder
+    client = AsyncGraphQLClient(graphql_stub.host, 'token', throttle=ThrottleController())
+    jobs = [client.fetch_data('{{ n{} }}'.format(i)) for i in range(12)]
+    results = asyncio.run(AsyncGraphQLClient.gather(jobs, concurrency=4))
+    assert results == [dict(query='{{ n{} }}'.format(i)) for i in range(12)]
+    assert 1 < peak[0] <= 4
+
+
+def test_async_fetch_data_throttled(graphql_stub, monkeypatch):
+    delays = []
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(utils.asyncio, 'sleep', fake_sleep)
+    throttled = dict(errors=[dict(message='Throttled')], extensions=cost_extensions(available=0, requested=50))
+    responses = [(200, throttled, None), (200, dict(data=dict(ok=True)), None)]
+    graphql_stub.responder = lambda payload, headers: responses.pop(0)
+    client = AsyncGraphQLClient(graphql_stub.host, 'token', throttle=ThrottleController())
+    assert asyncio.run(client.fetch_data('{ a }')) == dict(ok=True)
+    assert len(delays) == 1 and delays[0] == approx(0.5, abs=0.05)
+    # errors are returned by gather
+    graphql_stub.responder = lambda payload, headers: (200, dict(errors=[dict(message='Access denied')]), None)
+    results = asyncio.run(AsyncGraphQLClient.gather([client.fetch_data('{ a }')]))
+    assert isinstance(results[0], Exception)
+
+
+def connection_responder(total: int, node_cost: float = 2, available: float = 1000):
+    """ Paginate `items` of `total` nodes, the cursor is the offset """
+
+    def responder(payload, headers):
+        first = int(search(r'first: (\d+)', payload['query']).group(1))
+        after = search(r'after: "(\d+)"', payload['query'])
+        offset = int(after.group(1)) if after else 0
+        end = min(total, offset + first)
+        data = dict(shop=dict(items=dict(
+            nodes=[dict(id=i) for i in range(offset, end)],
+            pageInfo=dict(hasNextPage=end < total, endCursor=str(end)),
+        )))
+        extensions = cost_extensions(available=available, requested=first * node_cost + 2)
+        return 200, dict(data=data, extensions=extensions), None
+
+    return responder
+
+
+def query_items(cursor: str = None, first: int = 50) -> str:
+    after = ', after: "{}"'.format(cursor) if cursor else ''
+    return '{{ shop {{ items(first: {}{}) {{ nodes {{ id }} pageInfo {{ hasNextPage endCursor }} }} }} }}'.format(
+        first, after)
+
+
+def test_iter_connection(graphql_stub):
+    graphql_stub.responder = connection_responder(total=120)
+    client = GraphQLClient(graphql_stub.host, 'token', throttle=ThrottleController())
+    nodes = client.iter_connection(query_items, 'shop.items', page_size=50)
+    assert next(nodes) == dict(id=0)
+    # lazy, only the first page has been fetched
+    assert len(graphql_stub.requests) == 1
+    assert [node['id'] for node in nodes] == list(range(1, 120))
+    assert len(graphql_stub.requests) == 3
+
+
+def test_iter_connection_page_size_from_budget(graphql_stub):
+    # 4 points per node, 1000 points available -> ~250 nodes per page after the first page
+    graphql_stub.responder = connection_responder(total=600, node_cost=4, available=1000)
+    client = GraphQLClient(graphql_stub.host, 'token', throttle=ThrottleController())
+    assert len(list(client.iter_connection(query_items, 'shop.items', prefetch=True))) == 600
+    sizes = [int(search(r'first: (\d+)', payload['query']).group(1)) for payload in graphql_stub.requests]
+    assert len(sizes) == 4 and sizes[0] == 50
+    assert all(240 <= size <= 250 for size in sizes[1:])
+    # the budget is low, use smaller pages instead of waiting for the bucket
+    graphql_stub.requests.clear()
+    graphql_stub.responder = connection_responder(total=100, node_cost=4, available=80)
+    client = GraphQLClient(graphql_stub.host, 'token', throttle=ThrottleController())
+    assert len(list(client.iter_connection(query_items, 'shop.items', max_page_size=100))) == 100
+    assert int(search(r'first: (\d+)', graphql_stub.requests[1]['query']).group(1)) < 25
+
+
+def test_async_iter_connection(graphql_stub):
+    graphql_stub.responder = connection_responder(total=75)
+    client = AsyncGraphQLClient(graphql_stub.host, 'token', throttle=ThrottleController())
+
+    async def collect():
+        nodes = client.iter_connection(query_items, 'shop.items', page_size=20, prefetch=True)
+        return [node['id'] async for node in nodes]
+
+    assert asyncio.run(collect()) == list(range(75))
+
+
+def apq_responder(store: dict):
+    """ A server with the automatic persisted queries """
+
+    def responder(payload, headers):
+        sha = ((payload.get('extensions') or {}).get('persistedQuery') or {}).get('sha256Hash')
+        if 'query' in payload:
+            if sha:
+                assert sha256(payload['query'].encode('utf-8')).hexdigest() == sha
+                store[sha] = payload['query']
+            return 200, dict(data=dict(query=payload['query'], variables=payload['variables'])), None
+        if sha not in store:
+            return 200, dict(errors=[dict(message='PersistedQueryNotFound',
+                                          extensions=dict(code='PERSISTED_QUERY_NOT_FOUND'))]), None
+        return 200, dict(data=dict(query=store[sha], variables=payload['variables'])), None
+
+    return responder
+
+
+def test_persisted_queries(graphql_stub):
+    query_registry.clear()
+    with raises(ValueError):
+        GraphQLClient(graphql_stub.host, 'token', persisted_queries='sometimes')
+    store = {}
+    graphql_stub.responder = apq_responder(store)
+    for transport in ['requests', 'urllib']:
+        store.clear()
+        graphql_stub.requests.clear()
+        client = GraphQLClient(graphql_stub.host, 'token', transport=transport, persisted_queries='apq',
+                               throttle=ThrottleController())
+        for n in range(3):
+            assert client.fetch_data('query Q($n: Int) { a(n: $n) }', variables=dict(n=n)) == dict(
+                query='query Q($n: Int) { a(n: $n) }', variables=dict(n=n))
+        # the hash, the hash and the text, then the hash only
+        assert [sorted(payload) for payload in graphql_stub.requests] == [
+            ['extensions', 'variables'], ['extensions', 'query', 'variables'], ['extensions', 'variables'],
+            ['extensions', 'variables'],
+        ]
+    assert len(query_registry) == 1
+    persisted = query_registry.get(sha256(b'query Q($n: Int) { a(n: $n) }').hexdigest())
+    # a body without variables is encoded once
+    assert persisted.encode().data is persisted.encode().data
+    assert json.loads(persisted.encode(dict(n=1), 'both').data) == dict(
+        query=persisted.query, variables=dict(n=1),
+        extensions=dict(persistedQuery=dict(version=1, sha256Hash=persisted.sha256)))
+
+
+def test_persisted_queries_unsupported(graphql_stub):
+    query_registry.clear()
+    # the server ignores the extensions
+    graphql_stub.responder = lambda payload, headers: (200, dict(data=dict(ok=True)), None) if 'query' in payload \
+        else (400, dict(errors=[dict(message='No query string was present')]), None)
+    client = GraphQLClient(graphql_stub.host, 'token', persisted_queries='apq', throttle=ThrottleController())
+    assert client.fetch_data('{ a }') == dict(ok=True)
+    assert graphql_stub.host in query_registry.unsupported
+    assert client.fetch_data('{ a }') == dict(ok=True)
+    assert [sorted(payload) for payload in graphql_stub.requests] == [
+        ['extensions', 'variables'], ['query', 'variables'], ['query', 'variables']]
+    # the registry mode sends the text with the cached body
+    graphql_stub.requests.clear()
+    client = GraphQLClient(graphql_stub.host, 'token', persisted_queries='registry', throttle=ThrottleController())
+    assert client.fetch_data('{ a }') == dict(ok=True)
+    assert graphql_stub.requests == [dict(query='{ a }', variables=None)]
+    query_registry.clear()
+
+
+@mark.benchmark
+def test_benchmark_persisted_queries():
+    """ Encode the request body of a large query, the sgqlc endpoint against the registry """
+    query = 'query Q($id: ID!) { node(id: $id) { ' + ' '.join('field{}'.format(i) for i in range(1000)) + ' } }'
+    variables = dict(id='gid://shopify/Product/1')
+    endpoint = utils._urllib_transport('https://example.myshopify.com/graphql.json', {}, 10)
+    persisted = query_registry.register(query)
+    durations = {}
+    for name, encode in [
+        ('sgqlc', lambda: endpoint._prepare(query, variables, None, None)),
+        ('registry', lambda: endpoint._prepare(persisted.encode(variables), variables, None, None)),
+    ]:
+        start = perf_counter()
+        for _ in range(2000):
+            encode()
+        durations[name] = perf_counter() - start
+    query_registry.clear()
+    assert durations['registry'] < durations['sgqlc']
+
+
+def test_http2_transport(h2_stub):
+    client = GraphQLClient(h2_stub.host, 'token', transport='http2', throttle=ThrottleController())
+    assert client.fetch_data('{ shop { name } }') == dict(ok=True)
+    assert h2_stub.requests[-1] == dict(query='{ shop { name } }', variables=None, operationName=None)
+    # the persisted queries send the encoded body
+    client = GraphQLClient(h2_stub.host, 'token', transport='http2', persisted_queries='registry',
+                           throttle=ThrottleController())
+    assert client.fetch_data('query Q($n: Int) { a(n: $n) }', variables=dict(n=1)) == dict(ok=True)
+    assert h2_stub.requests[-1] == dict(query='query Q($n: Int) { a(n: $n) }', variables=dict(n=1))
+    # errors
+    h2_stub.responder = lambda payload, headers: (500, dict(message='boom'), None)
+    with raises(Exception):
+        client.fetch_data('{ a }', attempts=0)
+    assert h2_stub.connections == 1
+
+
+def test_http2_restful_session(h2_stub):
+    responses = [(429, dict(errors='Throttled'), {'retry-after': '0.01'}), (200, dict(customers=[]), None)]
+    h2_stub.responder = lambda payload, headers: responses.pop(0)
+    session = utils.create_restful_session('token', transport='http2')
+    res = session.request('GET', 'https://{}/admin/api/2026-10/customers.json'.format(h2_stub.host))
+    assert res.status_code == 200 and res.json() == dict(customers=[])
+    assert len(h2_stub.requests) == 2
+    with raises(ValueError):
+        utils.create_restful_session('token', transport='carrier-pigeon')
+
+
+@mark.benchmark
+def test_benchmark_http2_transport(graphql_stub, h2_stub):
+    """ 200 concurrent queries to one shop from 20 threads, 20ms server latency """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def responder(payload, headers):
+        sleep(0.02)
+        return 200, dict(data=dict(ok=True)), None
+
+    graphql_stub.responder = responder
+    h2_stub.delay = 0.02
+    connections = {}
+    for transport, server in [('requests', graphql_stub), ('http2', h2_stub)]:
+        client = GraphQLClient(server.host, 'token', transport=transport, throttle=ThrottleController())
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            start = perf_counter()
+            results = list(executor.map(lambda _: client.fetch_data('{ shop { name } }'), range(200)))
+            duration = perf_counter() - start
+        assert all(results) and duration < 200 * 0.02
+        connections[transport] = server.handshakes if transport == 'requests' else server.connections
+    # the streams of one connection against a pool of connections
+    assert connections['http2'] == 1 and connections['requests'] > 1
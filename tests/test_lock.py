@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : test_lock.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 21:55:00
+"""
+from os import path
+from threading import Timer
+from time import monotonic, sleep
+from types import SimpleNamespace
+from pytest import raises
+from flask_shopify_utils.cache import RedisCache
+from flask_shopify_utils.lock import LockError, FileLock, DatabaseLock, RedisLock, create_lock
+
+
+class FakeConnection:
+    """ Record the statements of the database lock """
+
+    def __init__(self, statements: list, result: int):
+        self.statements = statements
+        self.result = result
+        self.closed = False
+
+    def execution_options(self, **options):
+        self.statements.append(('options', options))
+        return self
+
+    def execute(self, statement, params):
+        self.statements.append((str(statement), params))
+        return SimpleNamespace(scalar=lambda: self.result)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeEngine:
+
+    def __init__(self, name: str, result: int = 1):
+        self.dialect = SimpleNamespace(name=name)
+        self.result = result
+        self.statements = []
+
+    def connect(self):
+        return FakeConnection(self.statements, self.result)
+
+
+def test_file_lock(tmp_path):
+    lock = FileLock(str(tmp_path))
+    lease = lock.acquire('sync')
+    with raises(LockError, match='sync is already running'):
+        lock.acquire('sync')
+    # another key
+    lock.release(lock.acquire('other'))
+    lock.release(lease)
+    # the lock file isn't leaked
+    assert not path.exists(lock.get_path('sync'))
+    with lock.hold('sync') as lease:
+        assert lease.token is None
+
+
+def test_file_lock_blocking(tmp_path):
+    lock = FileLock(str(tmp_path))
+    lease = lock.acquire('sync')
+    start = monotonic()
+    with raises(LockError):
+        lock.acquire('sync', blocking=True, timeout=0.2)
+    assert 0.2 <= monotonic() - start < 1
+    Timer(0.1, lock.release, args=(lease,)).start()
+    lock.release(lock.acquire('sync', blocking=True, timeout=2))
+
+
+def test_prevent_concurrency(initial_test_client):
+    client, test, utils = initial_test_client
+    test.assertIsInstance(utils.lock, FileLock)
+    with utils.prevent_concurrency('sync'):
+        with raises(RuntimeError, match='sync is already running'):
+            with utils.prevent_concurrency('sync'):
+                pass
+    with utils.prevent_concurrency('sync'):
+        pass
+
+
+def test_database_lock(initial_test_client, tmp_path):
+    client, test, utils = initial_test_client
+    # SQLite falls back to the file lock
+    lock = create_lock(SimpleNamespace(config=dict(SHOPIFY_LOCK_TYPE='database', SHOPIFY_LOCK_DIR=str(tmp_path)),
+                                       db=utils.db))
+    test.assertIsInstance(lock, DatabaseLock)
+    with lock.hold('sync'):
+        with raises(LockError):
+            lock.acquire('sync')
+
+    engine = FakeEngine('postgresql')
+    lock = DatabaseLock(engine)
+    lease = lock.acquire('sync')
+    lock.release(lease)
+    test.assertTrue(lease.handle.closed)
+    test.assertEqual(('options', dict(isolation_level='AUTOCOMMIT')), engine.statements[0])
+    test.assertEqual(('SELECT pg_try_advisory_lock(:id)', dict(id=lock._lock_id('sync'))), engine.statements[1])
+    test.assertEqual(('SELECT pg_advisory_unlock(:id)', dict(id=lock._lock_id('sync'))), engine.statements[2])
+
+    engine = FakeEngine('mysql', result=0)
+    lock = DatabaseLock(engine)
+    with raises(LockError):
+        lock.acquire('sync')
+    name = engine.statements[1][1]['name']
+    test.assertEqual('SELECT GET_LOCK(:name, 0)', engine.statements[1][0])
+    test.assertLessEqual(len(name), 64)
+
+
+def test_redis_lock(fake_redis):
+    cache = RedisCache(url=fake_redis.url)
+    lock = RedisLock(cache, ttl=0.3, renew=False)
+    first = lock.acquire('sync')
+    with raises(LockError):
+        lock.acquire('sync')
+    # the lease expires, the next holder gets a higher fencing token
+    sleep(0.4)
+    second = lock.acquire('sync')
+    assert second.token > first.token
+    # the expired holder can't release the lease of the next one
+    lock.release(first)
+    with raises(LockError):
+        lock.acquire('sync')
+    lock.release(second)
+    lock.release(lock.acquire('sync'))
+
+
+def test_redis_lock_renew(fake_redis):
+    cache = RedisCache(url=fake_redis.url)
+    lock = RedisLock(cache, ttl=0.3)
+    with lock.hold('sync') as lease:
+        sleep(0.6)
+        assert lease.valid
+        with raises(LockError):
+            lock.acquire('sync')
+        # taken over, e.g. the process was paused for too long
+        fake_redis.data[b'shopify_utils:lock:sync'] = (b'0', 0)
+        sleep(0.3)
+        assert not lease.valid
+    assert b'shopify_utils:lock:sync' in fake_redis.data
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : test_operation.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 23:00:00
+"""
+from timeit import timeit
+from pytest import mark, raises
+from sgqlc.operation import Operation
+from sgqlc.types import Arg, Field, ID, Input, Int, list_of, non_null, Schema, String, Type, ArgDict
+from flask_shopify_utils.operation import PreparedOperation, prepared_operation, get_document
+from flask_shopify_utils.utils import GraphQLClient
+
+schema = Schema()
+
+
+class MetafieldsSetInput(Input):
+    __schema__ = schema
+    owner_id = Field(non_null(ID), graphql_name='ownerId')
+    key = Field(non_null(String), graphql_name='key')
+    value = Field(non_null(String), graphql_name='value')
+
+
+class Webhook(Type):
+    __schema__ = schema
+    id = Field(non_null(ID), graphql_name='id')
+    callback_url = Field(String, graphql_name='callbackUrl')
+
+
+class WebhookConnection(Type):
+    __schema__ = schema
+    nodes = Field(non_null(list_of(non_null(Webhook))), graphql_name='nodes')
+
+
+class Metafield(Type):
+    __schema__ = schema
+    id = Field(non_null(ID), graphql_name='id')
+
+
+class MetafieldsSetPayload(Type):
+    __schema__ = schema
+    metafields = Field(list_of(non_null(Metafield)), graphql_name='metafields')
+
+
+class QueryRoot(Type):
+    __schema__ = schema
+    webhooks = Field(non_null(WebhookConnection), graphql_name='webhooks', args=ArgDict((
+        ('first', Arg(Int, graphql_name='first', default=None)),
+        ('after', Arg(String, graphql_name='after', default=None)),
+    )))
+
+
+class Mutation(Type):
+    __schema__ = schema
+    metafields_set = Field(MetafieldsSetPayload, graphql_name='metafieldsSet', args=ArgDict((
+        ('metafields', Arg(non_null(list_of(non_null(MetafieldsSetInput))), graphql_name='metafields', default=None)),
+    )))
+
+
+schema.query_type = QueryRoot
+schema.mutation_type = Mutation
+
+
+def query_webhooks(cursor: str = None, first: int = 20) -> Operation:
+    op = Operation(QueryRoot, 'QueryWebhooks')
+    op.webhooks(first=first, after=cursor).nodes.__fields__('id', 'callback_url')
+    return op
+
+
+def set_metafields(owner_id: str, value: str) -> Operation:
+    op = Operation(Mutation, 'SetMetafields')
+    data = [MetafieldsSetInput(owner_id=owner_id, key='key', value=value)]
+    op.metafields_set(metafields=data).metafields.__fields__('id')
+    return op
+
+
+def test_prepared_operation():
+    calls = []
+    prepared = prepared_operation('cursor')(lambda cursor=None, first=20: calls.append(first) or query_webhooks(
+        cursor, first))
+    op = prepared('abc')
+    assert isinstance(op, PreparedOperation)
+    assert op.variables == dict(cursor='abc')
+    assert op.document == 'query QueryWebhooks($cursor: String) {\nwebhooks(first: 20, after: $cursor) {\n' \
+                          'nodes {\nid\ncallbackUrl\n}\n}\n}'
+    assert str(op).startswith('query QueryWebhooks($cursor: String) {\n  webhooks(first: 20, after: $cursor) {')
+    assert bytes(op) == op.document.encode('utf-8')
+    # compiled once per shape
+    assert prepared(None).document == op.document
+    assert prepared('def', first=50).document != op.document
+    assert calls == [20, 50]
+    # interpret the response like an Operation
+    result = op + dict(data=dict(webhooks=dict(nodes=[dict(id='1', callbackUrl='https://example.com')])))
+    assert result.webhooks.nodes[0].callback_url == 'https://example.com'
+
+
+def test_prepared_operation_types():
+    # the variables nested in an input object need an explicit type
+    with raises(ValueError, match=r'The type of \$owner_id is unknown'):
+        prepared_operation('owner_id', 'value')(set_metafields)('gid://shopify/Product/1', 'v')
+    with raises(ValueError, match='has no parameter: unknown'):
+        prepared_operation('unknown')(set_metafields)
+
+    def set_metafield(data: list) -> Operation:
+        op = Operation(Mutation, 'SetMetafields')
+        op.metafields_set(metafields=data).metafields.__fields__('id')
+        return op
+
+    op = prepared_operation('data')(set_metafield)([MetafieldsSetInput(owner_id='1', key='key', value='v')])
+    assert op.document.startswith('mutation SetMetafields($data: [MetafieldsSetInput!]!) {\n'
+                                  'metafieldsSet(metafields: $data) {')
+    # the inputs are sent with the GraphQL names
+    assert op.variables == dict(data=[dict(ownerId='1', key='key', value='v')])
+    # the dicts may use the Python names, like the inlined arguments
+    op = prepared_operation('data')(set_metafield)([dict(owner_id='1', key='key', value='v')])
+    assert op.variables == dict(data=[dict(ownerId='1', key='key', value='v')])
+    op = prepared_operation(owner_id='ID!', value='String!')(set_metafields)('1', 'v')
+    assert op.document.startswith('mutation SetMetafields($owner_id: ID!, $value: String!) {')
+    assert op.variables == dict(owner_id='1', value='v')
+
+
+def test_get_document(graphql_stub):
+    op = prepared_operation('cursor')(query_webhooks)('abc')
+    assert get_document(op) == (op.document, dict(cursor='abc'))
+    assert get_document(op, dict(extra=1)) == (op.document, dict(cursor='abc', extra=1))
+    assert get_document('{ shop { id } }', dict(a=1)) == ('{ shop { id } }', dict(a=1))
+
+    client = GraphQLClient(graphql_stub.host, 'token')
+    client.fetch_data(op)
+    request = graphql_stub.requests[-1]
+    assert (request['query'], request['variables']) == (op.document, dict(cursor='abc'))
+
+
+@mark.benchmark
+def test_benchmark_prepared_operation():
+    """ Build and serialize a query per call, the builder against the compiled document """
+    prepared = prepared_operation('cursor')(query_webhooks)
+    builder = timeit(lambda: bytes(query_webhooks('abc')), number=2000)
+    assert timeit(lambda: bytes(prepared('abc')), number=2000) < builder / 2
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : test_pagination.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 20:40:00
+"""
+from datetime import datetime, timedelta
+from time import perf_counter
+from pytest import fixture, mark, raises
+from sqlalchemy import event
+from flask_shopify_utils.pagination import encode_cursor, decode_cursor
+
+
+@fixture
+def webhooks(initial_test_client, store_factory, monkeypatch):
+    """ 105 webhooks, every 10 records share the same `created_at` """
+    from flask_shopify_utils.model import Webhook
+
+    client, test, utils = initial_test_client
+    store = store_factory()
+    start = datetime(2026, 10, 18)
+    utils.db.execute(utils._db.insert(Webhook), [
+        dict(store_id=store.id, webhook_id=i, target='orders', action='create', status=0,
+             created_at=start + timedelta(minutes=i // 10)) for i in range(105)
+    ])
+    utils.db.commit()
+    monkeypatch.setattr(Webhook, 'to_dict', lambda self: dict(id=self.webhook_id), raising=False)
+    yield Webhook
+    Webhook.query.delete()
+    utils.db.commit()
+
+
+def test_cursor(initial_test_client):
+    client, test, utils = initial_test_client
+    values = [datetime(2026, 10, 18, 1, 2, 3), 7]
+    test.assertEqual((values, 'prev'), decode_cursor(encode_cursor(values, 'prev')))
+    for cursor in ['', 'abc', encode_cursor([1], 'up')]:
+        with raises(ValueError):
+            decode_cursor(cursor)
+
+
+def test_cursor_paginate(initial_test_client, webhooks):
+    client, test, utils = initial_test_client
+    select = utils._db.select(webhooks).filter_by(target='orders')
+    seen, cursor, pages = [], None, []
+    while True:
+        page = utils.cursor_paginate(select, webhooks.created_at, per_page=20, cursor=cursor)
+        pages.append(page)
+        seen.extend(record.webhook_id for record in page.items)
+        if not page.has_next:
+            break
+        cursor = page.next_cursor
+    # newest first, the ties of `created_at` are ordered by id
+    test.assertEqual(list(range(104, -1, -1)), seen)
+    test.assertEqual(6, len(pages))
+    test.assertFalse(pages[0].has_prev)
+    test.assertIsNone(pages[0].total)
+    # walk back from the last page
+    page = utils.cursor_paginate(select, webhooks.created_at, per_page=20, cursor=pages[-1].prev_cursor)
+    test.assertEqual([record.webhook_id for record in pages[-2].items], [record.webhook_id for record in page.items])
+    page = utils.cursor_paginate(select, webhooks.created_at, per_page=20, cursor=pages[1].prev_cursor)
+    test.assertEqual(list(range(104, 84, -1)), [record.webhook_id for record in page.items])
+    test.assertFalse(page.has_prev)
+    # ascending on the primary key
+    page = utils.cursor_paginate(select, webhooks.id, per_page=50, desc=False, with_total=True)
+    test.assertEqual(105, page.total)
+    test.assertEqual(list(range(50)), [record.webhook_id for record in page.items])
+    with raises(ValueError):
+        utils.cursor_paginate(select, webhooks.id, cursor=pages[1].next_cursor)
+
+
+def test_cursor_paginate_sql(initial_test_client, webhooks):
+    client, test, utils = initial_test_client
+    select = utils._db.select(webhooks)
+    page = utils.cursor_paginate(select, webhooks.id, per_page=10)
+    statements = []
+
+    def listener(conn, cursor, statement, parameters, *args):
+        statements.append((statement, parameters))
+
+    event.listen(utils.db.get_bind(), 'before_cursor_execute', listener)
+    try:
+        utils.cursor_paginate(select, webhooks.id, per_page=10, cursor=page.next_cursor)
+    finally:
+        event.remove(utils.db.get_bind(), 'before_cursor_execute', listener)
+    test.assertEqual(1, len(statements))
+    statement, parameters = statements[0]
+    test.assertIn('webhooks.id < ?', statement)
+    test.assertNotIn('count', statement.lower())
+    # SQLite always renders `OFFSET`, it is 0
+    test.assertEqual((page.items[-1].id, 11, 0), tuple(parameters))
+
+
+def test_cursor_paginate_response(initial_test_client, webhooks):
+    client, test, utils = initial_test_client
+    select = utils._db.select(webhooks)
+    with utils.app.test_request_context('/admin/webhooks?per_page=30&status=0'):
+        page = utils.cursor_paginate(select, webhooks.id)
+        data = utils.paginate_response(page).get_json()['data']
+    test.assertEqual(30, data['per_page'])
+    test.assertEqual(list(range(104, 74, -1)), [item['id'] for item in data['data']])
+    test.assertEqual(page.next_cursor, data['next_cursor'])
+    test.assertIn('per_page=30', data['next_page_url'])
+    test.assertIn('cursor={}'.format(page.next_cursor), data['next_page_url'])
+    test.assertEqual('', data['prev_page_url'])
+    test.assertIsNone(data['total'])
+    with utils.app.test_request_context('/admin/webhooks?cursor={}'.format(page.next_cursor)):
+        data = utils.paginate_response(utils.cursor_paginate(select, webhooks.id)).get_json()['data']
+    test.assertEqual(list(range(74, 54, -1)), [item['id'] for item in data['data']])
+    test.assertNotEqual('', data['prev_page_url'])
+
+
+@mark.benchmark
+def test_benchmark_cursor_paginate(initial_test_client, store_factory):
+    """ A deep page of 100k webhooks, `OFFSET/LIMIT` with `COUNT(*)` against keyset """
+    from flask_shopify_utils.model import Webhook
+
+    client, test, utils = initial_test_client
+    store = store_factory()
+    rows = 100000
+    utils.db.execute(utils._db.insert(Webhook), [
+        dict(store_id=store.id, webhook_id=i, target='orders', action='create', status=0) for i in range(rows)
+    ])
+    utils.db.commit()
+    try:
+        select = utils._db.select(Webhook).filter_by(store_id=store.id)
+        per_page, page_num = 50, rows // 50 - 1
+        start = perf_counter()
+        offset_page = utils._db.paginate(select.order_by(Webhook.id.desc()), page=page_num, per_page=per_page,
+                                         error_out=False)
+        offset_time = perf_counter() - start
+        # the cursor of the previous row, as the client would send it
+        cursor = encode_cursor([offset_page.items[0].id + 1], 'next')
+        start = perf_counter()
+        page = utils.cursor_paginate(select, Webhook.id, per_page=per_page, cursor=cursor)
+        keyset_time = perf_counter() - start
+        test.assertEqual([record.id for record in offset_page.items], [record.id for record in page.items])
+        test.assertLess(keyset_time, offset_time)
+    finally:
+        Webhook.query.delete()
+        utils.db.commit()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : test_retry.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 19/10/2026 00:20:00
+"""
+from collections import Counter
+from email.utils import formatdate
+from time import time
+from urllib.error import URLError
+from pytest import raises, approx
+from flask_shopify_utils import utils
+from flask_shopify_utils.retry import RetryPolicy, RetryMetrics, parse_retry_after
+from flask_shopify_utils.utils import GraphQLClient, ThrottleController, register_transport, TRANSPORTS
+
+
+def test_retry_policy_backoff():
+    policy = RetryPolicy(base=0.5, cap=3, jitter=False)
+    assert [policy.backoff(n) for n in range(5)] == [0.5, 1, 2, 3, 3]
+    policy = RetryPolicy(base=0.5, cap=3)
+    delays = [policy.backoff(2) for _ in range(200)]
+    assert all(0 <= delay <= 2 for delay in delays) and len(set(delays)) > 100
+
+
+def test_retry_state_budgets():
+    metrics = RetryMetrics()
+    policy = RetryPolicy(attempts=4, budgets=dict(transport=1), jitter=False, on_retry=metrics)
+    retry = policy.start()
+    assert retry.next_delay('transport') == 0.5
+    # the transport budget is spent, the other classes still retry
+    assert retry.next_delay('transport') is None
+    assert retry.next_delay('http', 3) == 4
+    assert retry.next_delay('throttled') == 2
+    assert retry.next_delay('throttled') == 4
+    # the attempts are spent
+    assert retry.next_delay('throttled') is None
+    assert metrics.retries == dict(transport=1, http=1, throttled=2)
+    assert metrics.give_ups == dict(transport=1, throttled=1)
+    assert metrics.delay == 10.5
+    # `attempts` of a call overrides the policy
+    assert policy.start(0).next_delay('http') is None
+
+
+def test_retry_state_deadline():
+    retry = RetryPolicy(deadline=5, jitter=False).start()
+    assert retry.next_delay('http', 2) == 2.5
+    # the next attempt would start after the deadline
+    assert retry.next_delay('http', 10) is None
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('2.0') == 2
+    assert parse_retry_after('-1') == 0
+    assert parse_retry_after(formatdate(time() + 30, usegmt=True)) == approx(30, abs=1.5)
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after(None) is None
+
+
+def test_fetch_data_http_retry(graphql_stub, monkeypatch):
+    delays = []
+    monkeypatch.setattr(utils, 'sleep', delays.append)
+    responses = [
+        # GraphQL errors, the status is in the result
+        (503, dict(errors=[dict(message='Service unavailable')]), {'Retry-After': '3'}),
+        # no GraphQL errors, the status is in the error
+        (502, dict(message='Bad gateway'), None),
+        (200, dict(data=dict(ok=True)), None),
+    ]
+    graphql_stub.responder = lambda payload, headers: responses.pop(0)
+    metrics = RetryMetrics()
+    client = GraphQLClient(graphql_stub.host, 'token', throttle=ThrottleController(),
+                           retry_policy=RetryPolicy(jitter=False, on_retry=metrics))
+    assert client.fetch_data('{ a }', headers={'X-Test': '1'}, timeout=5) == dict(ok=True)
+    # Retry-After is the minimum, plus the backoff
+    assert delays == [3.5, 1]
+    assert metrics.retries == dict(http=2)
+    # the other errors are not retried
+    graphql_stub.responder = lambda payload, headers: (400, dict(errors=[dict(message='Bad request')]), None)
+    with raises(Exception):
+        client.fetch_data('{ a }')
+    assert delays == [3.5, 1]
+
+
+def test_fetch_data_transport_retry(monkeypatch):
+    delays, calls = [], []
+    monkeypatch.setattr(utils, 'sleep', delays.append)
+
+    def endpoint(query, variables=None, extra_headers=None, timeout=None):
+        calls.append((extra_headers, timeout))
+        if len(calls) < 3:
+            raise URLError('connection reset')
+        return dict(data=dict(ok=True))
+
+    register_transport('flaky', lambda url, headers, timeout: endpoint)
+    try:
+        client = GraphQLClient('test.myshopify.com', 'token', transport='flaky', throttle=ThrottleController(),
+                               retry_policy=RetryPolicy(jitter=False))
+        assert client.fetch_data('{ a }', headers={'X-Test': '1'}, timeout=5) == dict(ok=True)
+        # the retries keep the headers and the timeout
+        assert calls == [({'X-Test': '1'}, 5)] * 3
+        assert delays == [0.5, 1]
+        calls.clear()
+        with raises(URLError):
+            client.fetch_data('{ a }', attempts=1)
+        assert len(calls) == 2
+    finally:
+        TRANSPORTS.pop('flaky')
+
+
+def test_retry_spread():
+    """ 1000 workers throttled together retry after `Retry-After: 2`, the busiest 100 ms of the retries """
+    busiest = {}
+    for name, policy in [('fixed', RetryPolicy(base=0, jitter=False)), ('jitter', RetryPolicy())]:
+        slots = Counter(int(policy.start().next_delay('http', 2) * 10) for _ in range(1000))
+        busiest[name] = max(slots.values())
+    assert busiest['fixed'] == 1000
+    assert busiest['jitter'] < 400
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : test_serializer.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 19:55:00
+"""
+from datetime import datetime
+from decimal import Decimal
+from time import perf_counter
+from types import SimpleNamespace
+from uuid import UUID
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from flask_sqlalchemy import SQLAlchemy
+from pytest import mark, raises
+from flask_shopify_utils import ShopifyUtil, serializer
+from flask_shopify_utils.serializer import ShopifyJSONProvider, JSON_BACKENDS, get_json_backend
+
+BACKENDS = [name for name, backend in JSON_BACKENDS.items() if backend is not None]
+
+
+@mark.parametrize('name', BACKENDS)
+def test_json_backend(name):
+    backend = get_json_backend(name)
+    data = dict(id=820982911946154508, title='Café', price=Decimal('19.99'), tags={'a'}, nested=[dict(b=None)])
+    assert backend.loads(backend.dumps(data)) == dict(
+        id=820982911946154508, title='Café', price=19.99, tags=['a'], nested=[dict(b=None)])
+    # an exact number, as simplejson always wrote it
+    assert backend.dumps(dict(price=Decimal('0.100000000000000000001'))) == b'{"price":0.100000000000000000001}'
+    assert backend.loads(bytearray(b'{"a": 1}')) == dict(a=1)
+    with raises(ValueError):
+        backend.loads(b'{"a":')
+
+
+@mark.parametrize('name', BACKENDS)
+def test_json_provider(name):
+    app = Flask(__name__)
+    expected = DefaultJSONProvider(app)
+    provider = ShopifyJSONProvider(app, name)
+    data = dict(b=datetime(2026, 10, 18, 12), a=UUID(int=1), c=Decimal('1.10'))
+    with app.app_context():
+        if name != 'msgspec':
+            # msgspec always writes RFC 3339 datetime
+            assert provider.loads(provider.response(data).get_data()) == expected.loads(expected.response(data).get_data())
+        assert provider.response(data).mimetype == 'application/json'
+        assert provider.loads(provider.dumps(dict(a=1))) == dict(a=1)
+
+
+def test_json_columns(initial_test_client, store_factory, monkeypatch):
+    client, test, utils = initial_test_client
+    assert serializer.current_backend() is utils.json_backend
+    store = store_factory()
+    store.set_extra(dict(price=Decimal('2.50'), name='Tāmaki'))
+    test.assertIn('"price":2.50', store.extra)
+    test.assertDictEqual(dict(price=2.5, name='Tāmaki'), store.get_extra())
+    # the values written by simplejson are still readable
+    monkeypatch.setattr(utils, '_json_backend', get_json_backend('simplejson'))
+    test.assertDictEqual(dict(price=2.5, name='Tāmaki'), store.get_extra())
+
+
+def test_json_backend_per_app(monkeypatch):
+    """ Each app keeps its own `SHOPIFY_JSON_BACKEND`, `auto` never picks msgspec for the responses """
+    monkeypatch.setattr(serializer, '_instances', {})
+    monkeypatch.setitem(JSON_BACKENDS, 'orjson', None)
+    monkeypatch.setitem(JSON_BACKENDS, 'msgspec', lambda: SimpleNamespace(name='msgspec'))
+    apps = []
+    for name in ('simplejson', 'auto'):
+        app = Flask(__name__)
+        app.config['SHOPIFY_JSON_BACKEND'] = name
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        SQLAlchemy().init_app(app)
+        apps.append((app, ShopifyUtil(app)))
+    (app1, utils1), (app2, utils2) = apps
+    assert utils1.json_backend.name == 'simplejson' and utils2.json_backend.name == 'msgspec'
+    assert type(app2.json) is DefaultJSONProvider
+    with app1.app_context():
+        assert serializer.current_backend() is utils1.json_backend
+    with app2.app_context():
+        assert serializer.current_backend() is utils2.json_backend
+
+
+@mark.benchmark
+def test_benchmark_paginate_response(initial_test_client, monkeypatch):
+    """ Serialize a 1,000 items paginated response with each JSON provider """
+    client, test, utils = initial_test_client
+    app = utils.app
+    items = [SimpleNamespace(to_dict=lambda i=i: dict(
+        id=i, title='Discount {}'.format(i), code='CODE{:04d}'.format(i), discount_value=1000, combine_with_order=True,
+        start_date='2026-10-18T00:00:00', end_date=None, tags=['summer', 'sale'],
+    )) for i in range(1000)]
+    paginate = SimpleNamespace(page=1, per_page=1000, total=1000, pages=1, items=items)
+    rounds = 100
+    results = {}
+    providers = [('flask', DefaultJSONProvider(app))] + [(name, ShopifyJSONProvider(app, name)) for name in BACKENDS]
+    for name, provider in providers:
+        monkeypatch.setattr(app, 'json', provider)
+        with app.test_request_context():
+            data = utils.paginate_response(paginate).get_json()
+            test.assertEqual(1000, len(data['data']['data']))
+            start = perf_counter()
+            for _ in range(rounds):
+                utils.paginate_response(paginate)
+            results[name] = perf_counter() - start
+    for name in ('orjson', 'msgspec'):
+        if name in results:
+            test.assertLess(results[name], results['flask'])
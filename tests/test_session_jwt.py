@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : test_session_jwt.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 17:05:00
+"""
+from time import time, perf_counter
+from pytest import mark
+import flask_shopify_utils
+
+
+def count_decode(monkeypatch) -> list:
+    calls = []
+    decode = flask_shopify_utils.jwt_decode
+
+    def wrapper(*args, **kwargs):
+        calls.append(1)
+        return decode(*args, **kwargs)
+
+    monkeypatch.setattr(flask_shopify_utils, 'jwt_decode', wrapper)
+    return calls
+
+
+def test_session_jwt_cache(initial_test_client, store_factory, monkeypatch, session_jwt):
+    client, test, utils = initial_test_client
+    store = store_factory()
+    calls = count_decode(monkeypatch)
+    headers = {'Authorization': 'Bearer {}'.format(session_jwt(utils, store.key))}
+    for _ in range(5):
+        test.assertEqual(0, client.get('/admin/test_jwt', headers=headers).get_json()['status'])
+    test.assertEqual(1, len(calls))
+    # the cached claims are not used after `exp`, the token is verified by PyJWT again
+    now = time()
+    monkeypatch.setattr(flask_shopify_utils, 'time', lambda: now + 120)
+    client.get('/admin/test_jwt', headers=headers)
+    test.assertEqual(2, len(calls))
+
+
+def test_session_jwt_cache_skips_invalid_token(initial_test_client, store_factory, monkeypatch, session_jwt):
+    client, test, utils = initial_test_client
+    store = store_factory()
+    calls = count_decode(monkeypatch)
+    token = session_jwt(utils, store.key)
+    headers = {'Authorization': 'Bearer {}x'.format(token)}
+    for _ in range(2):
+        res = client.get('/admin/test_jwt', headers=headers).get_json()
+        test.assertDictEqual(dict(status=500, message='Session JWT Signature invalid!'), res)
+    test.assertEqual(2, len(calls))
+
+
+@mark.benchmark
+def test_benchmark_session_jwt(initial_test_client, store_factory, monkeypatch, session_jwt):
+    """ Session tokens verified per second with and without the session JWT cache """
+    client, test, utils = initial_test_client
+    store = store_factory()
+    token = session_jwt(utils, store.key)
+    rounds = 5000
+    durations = {}
+    for threshold in [0, 1000]:
+        monkeypatch.setitem(utils.config, 'SHOPIFY_JWT_CACHE_THRESHOLD', threshold)
+        utils.decode_session_jwt(token)
+        start = perf_counter()
+        for _ in range(rounds):
+            utils.decode_session_jwt(token)
+        durations[threshold] = perf_counter() - start
+    test.assertLess(durations[1000], durations[0] / 2)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : test_store_cache.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 15:30:00
+"""
+from contextlib import contextmanager
+from flask import Flask, g
+from flask_sqlalchemy import SQLAlchemy
+from pytest import fixture
+from sqlalchemy import event
+from flask_shopify_utils import ShopifyUtil, cache
+from flask_shopify_utils.cache import MemoryCache
+
+
+@contextmanager
+def count_queries(utils):
+    queries = []
+
+    def listener(conn, cursor, statement, *args):
+        if 'FROM stores' in statement:
+            queries.append(statement)
+
+    engine = utils.db.get_bind()
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        yield queries
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+
+
+@fixture
+def store_record(store_factory):
+    return store_factory('cache.myshopify.com')
+
+
+def get(client, url: str, **kwargs):
+    # the test client shares the app context (and `g`) of the fixture, drop the request memo
+    g.pop('_shopify_stores', None)
+    return client.get(url, **kwargs)
+
+
+def test_memory_cache(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache, 'monotonic', lambda: now[0])
+    store = MemoryCache(threshold=2, default_timeout=10)
+    store.set('a', 1)
+    store.set('b', 2)
+    assert store.get('a') == 1
+    # `b` is the least recently used one
+    store.set('c', 3)
+    assert store.get('b') is None and store.get('a') == 1 and len(store) == 2
+    store.set('d', 4, timeout=0)
+    now[0] += 11
+    assert store.get('a') is None and store.get('d') == 4
+    assert store.delete('d') and not store.delete('d')
+
+
+def test_store_lookup_is_cached(initial_test_client, store_record, session_jwt):
+    client, test, utils = initial_test_client
+    headers = {'Authorization': 'Bearer {}'.format(session_jwt(utils, store_record.key))}
+    with count_queries(utils) as queries:
+        for _ in range(3):
+            res = get(client, '/admin/test_jwt', headers=headers)
+            test.assertEqual(0, res.get_json()['status'])
+    test.assertEqual(1, len(queries))
+    test.assertEqual(store_record.id, utils.store_cache.get('store:{}'.format(store_record.key))['id'])
+
+
+def test_store_lookup_is_memoized_per_request(initial_test_client, store_record, monkeypatch):
+    client, test, utils = initial_test_client
+    monkeypatch.setitem(utils.config, 'SHOPIFY_STORE_CACHE_TIMEOUT', 0)
+    g.pop('_shopify_stores', None)
+    store_id = store_record.id
+    with utils.app.test_request_context(), count_queries(utils) as queries:
+        for _ in range(3):
+            test.assertEqual(store_id, utils.check_store_record('cache.myshopify.com')[1])
+        test.assertIsNone(utils.get_store('missing.myshopify.com'))
+        test.assertIsNone(utils.get_store('missing.myshopify.com'))
+    test.assertEqual(2, len(queries))
+    test.assertEqual(0, len(utils.store_cache))
+
+
+def test_store_cache_invalidated_on_uninstall(initial_test_client, store_record, session_jwt, webhook_headers):
+    client, test, utils = initial_test_client
+    key = 'store:{}'.format(store_record.key)
+    data = b'{}'
+    headers = {'Authorization': 'Bearer {}'.format(session_jwt(utils, store_record.key))}
+    for url in ('/webhook/app/uninstalled', '/webhook/shop/redact'):
+        get(client, '/admin/test_jwt', headers=headers)
+        utils.cache.set('token_check:{}'.format(store_record.key), ('digest', 0))
+        test.assertIsNotNone(utils.store_cache.get(key))
+        res = client.post(url, data=data, headers=webhook_headers(utils, data, shop=store_record.key))
+        test.assertEqual(200, res.status_code)
+        test.assertIsNone(utils.store_cache.get(key))
+        test.assertIsNone(utils.cache.get('token_check:{}'.format(store_record.key)))
+
+
+def test_store_cache_shared_by_workers(initial_test_client, fake_redis):
+    client, test, utils = initial_test_client
+    test.assertIsInstance(utils.store_cache, MemoryCache)
+    workers = []
+    for _ in range(2):
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SHOPIFY_CACHE_TYPE'] = 'redis'
+        app.config['SHOPIFY_CACHE_REDIS_URL'] = fake_redis.url
+        SQLAlchemy().init_app(app)
+        workers.append((app, ShopifyUtil(app)))
+    (app1, worker1), (app2, worker2) = workers
+    test.assertIs(worker1.cache, worker1.store_cache)
+    key = 'store:cache.myshopify.com'
+    worker1.store_cache.set(key, dict(id=1, token='revoked'), 60)
+    test.assertEqual('revoked', worker2.store_cache.get(key)['token'])
+    # APP_UNINSTALLED handled by the other worker
+    with app2.app_context():
+        worker2.forget_store('cache.myshopify.com')
+    test.assertIsNone(worker1.store_cache.get(key))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : test_token_check.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 16:40:00
+"""
+from time import time, sleep
+from urllib.parse import urlencode
+from flask import g, has_app_context
+
+
+def open_app(client, shop: str):
+    g.pop('_shopify_stores', None)
+    params = dict(shop=shop, hmac='hmac', host='host', timestamp=int(time()))
+    return client.get('/?{}'.format(urlencode(params)))
+
+
+def test_index_caches_token_check(initial_test_client, store_factory, graphql_stub):
+    client, test, utils = initial_test_client
+    store = store_factory(graphql_stub.host)
+    for _ in range(3):
+        res = open_app(client, store.key)
+        test.assertEqual(302, res.status_code)
+        test.assertIn('/admin?', res.headers['Location'])
+    test.assertEqual(1, len(graphql_stub.requests))
+    # a new token after the app is installed again
+    store.token = 'new-token'
+    utils.db.commit()
+    utils.forget_store(store.key)
+    open_app(client, store.key)
+    test.assertEqual(2, len(graphql_stub.requests))
+
+
+def test_index_token_check_invalidated(initial_test_client, store_factory, graphql_stub):
+    client, test, utils = initial_test_client
+    store = store_factory(graphql_stub.host)
+    key = 'token_check:{}'.format(store.key)
+    open_app(client, store.key)
+    test.assertIsNotNone(utils.cache.get(key))
+    # uninstalled
+    utils.forget_store(store.key)
+    test.assertIsNone(utils.cache.get(key))
+    # 401, the result is not cached
+    graphql_stub.responder = lambda payload, headers: (401, dict(errors='Invalid API key or access token'), None)
+    for _ in range(2):
+        res = open_app(client, store.key)
+        test.assertIn('/install?', res.headers['Location'])
+    test.assertIsNone(utils.cache.get(key))
+    test.assertEqual(3, len(graphql_stub.requests))
+
+
+def test_index_token_check_background_refresh(initial_test_client, store_factory, graphql_stub, monkeypatch):
+    client, test, utils = initial_test_client
+    monkeypatch.setitem(utils.config, 'SHOPIFY_TOKEN_CHECK_REFRESH', 60)
+    store = store_factory(graphql_stub.host)
+    open_app(client, store.key)
+    key = 'token_check:{}'.format(store.key)
+    digest, checked_at = utils.cache.get(key)
+    utils.cache.set(key, (digest, checked_at - 120))
+    # the stale result is used, Shopify is called in the background
+    graphql_stub.responder = lambda payload, headers: (401, dict(errors='Invalid API key or access token'), None)
+    res = open_app(client, store.key)
+    test.assertIn('/admin?', res.headers['Location'])
+    for _ in range(100):
+        if utils.cache.get(key) is None:
+            break
+        sleep(0.02)
+    test.assertIsNone(utils.cache.get(key))
+    test.assertEqual(2, len(graphql_stub.requests))
+    res = open_app(client, store.key)
+    test.assertIn('/install?', res.headers['Location'])
+
+
+def test_token_check_background_refresh_failure(initial_test_client, store_factory, graphql_stub, monkeypatch, caplog):
+    client, test, utils = initial_test_client
+    monkeypatch.setitem(utils.config, 'SHOPIFY_TOKEN_CHECK_REFRESH', 60)
+    store = store_factory(graphql_stub.host)
+    open_app(client, store.key)
+    key = 'token_check:{}'.format(store.key)
+    digest, checked_at = utils.cache.get(key)
+    utils.cache.set(key, (digest, checked_at - 120))
+    contexts = []
+
+    def probe(*args):
+        contexts.append(has_app_context())
+        raise ConnectionError('Connection refused')
+
+    monkeypatch.setattr(utils, '_probe_store_token', probe)
+    open_app(client, store.key)
+    for _ in range(100):
+        if utils.cache.get(key + ':refresh') is None:
+            break
+        sleep(0.02)
+    test.assertEqual([True], contexts)
+    test.assertIn('Failed to refresh the token check of {}: Connection refused'.format(store.key), caplog.text)
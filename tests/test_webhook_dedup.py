@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : test_webhook_dedup.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 18:30:00
+"""
+from json import dumps
+from uuid import uuid4
+from pytest import mark, raises
+from flask_shopify_utils import dedup
+from flask_shopify_utils.cache import MemoryCache
+from flask_shopify_utils.dedup import BloomFilter, WindowedBloomFilter, WebhookDeduplicator
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add('key{}'.format(i))
+    assert all('key{}'.format(i) in bloom for i in range(1000))
+    false_positives = sum(1 for i in range(10000) if 'other{}'.format(i) in bloom)
+    assert false_positives < 300
+
+
+def test_windowed_bloom_filter(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(dedup, 'monotonic', lambda: now[0])
+    bloom = WindowedBloomFilter(capacity=100, window=10)
+    bloom.add('a')
+    now[0] = 15
+    assert 'a' in bloom
+    bloom.add('b')
+    now[0] = 25
+    assert 'a' not in bloom and 'b' in bloom
+
+
+def test_deduplicator_confirms_bloom_hits():
+    dedup_ = WebhookDeduplicator(MemoryCache(), window=60, capacity=100)
+    keys = dedup_.get_keys({'X-Shopify-Webhook-Id': 'abc', 'X-Shopify-Event-Id': '1', 'X-Shopify-Topic': 'orders/paid'})
+    assert keys == ['webhook:abc', 'webhook_event:orders/paid:1']
+    assert not dedup_.is_duplicate(keys)
+    dedup_.remember(keys)
+    assert dedup_.is_duplicate(keys) and dedup_.is_duplicate(keys[1:])
+    # a Bloom filter hit is not enough
+    dedup_.cache.clear()
+    assert not dedup_.is_duplicate(keys)
+
+
+def test_check_webhook_dedup(webhook_app, webhook_headers):
+    app, utils, calls = webhook_app
+    client = app.test_client()
+    calls.clear()
+    body = dumps(dict(id=1)).encode('utf-8')
+    webhook_id = str(uuid4())
+    # the failed delivery is retried
+    for _ in range(2):
+        res = client.post('/webhook/failed', data=body, headers=webhook_headers(utils, body, webhook_id))
+        assert res.status_code == 500
+    assert len(calls) == 2
+    for _ in range(3):
+        res = client.post('/webhook/orders', data=body, headers=webhook_headers(utils, body, webhook_id))
+        assert res.status_code == 200
+    assert len(calls) == 3
+    assert res.get_json() == dict(status=0, message='Duplicate webhook', data=[])
+    # no id, no deduplication
+    for _ in range(2):
+        client.post('/webhook/orders', data=body, headers=webhook_headers(utils, body))
+    assert len(calls) == 5
+
+
+def test_webhook_dedup_cache(webhook_app, webhook_headers):
+    """ The other keys of `utils.cache` never evict the handled webhook ids """
+    app, utils, calls = webhook_app
+    with raises(ValueError):
+        WebhookDeduplicator(MemoryCache(threshold=500), capacity=1000)
+    assert utils._webhook_dedup.cache is not utils.cache
+    client = app.test_client()
+    calls.clear()
+    body = b'{}'
+    headers = webhook_headers(utils, body, webhook_id=str(uuid4()))
+    client.post('/webhook/orders', data=body, headers=headers)
+    for i in range(600):
+        utils.cache.set('other:{}'.format(i), i)
+        client.post('/webhook/orders', data=body, headers=webhook_headers(utils, body, webhook_id=str(uuid4())))
+    assert len(calls) == 601
+    assert client.post('/webhook/orders', data=body, headers=headers).get_json()['message'] == 'Duplicate webhook'
+    assert len(calls) == 601
+
+
+def test_gdpr_webhook_dedup(initial_test_client, webhook_headers):
+    client, test, utils = initial_test_client
+    body = b'{}'
+    headers = webhook_headers(utils, body, event_id=str(uuid4()))
+    res = client.post('/webhook/customers/redact', data=body, headers=headers)
+    test.assertEqual(b'success', res.get_data())
+    res = client.post('/webhook/customers/redact', data=body, headers=headers)
+    test.assertEqual('Duplicate webhook', res.get_json()['message'])
+    # a forged delivery is never remembered
+    headers = dict(webhook_headers(utils, body, webhook_id=str(uuid4())), **{'X-Shopify-Hmac-Sha256': 'forged'})
+    test.assertEqual(401, client.post('/webhook/customers/redact', data=body, headers=headers).status_code)
+    test.assertEqual(401, client.post('/webhook/customers/redact', data=body, headers=headers).status_code)
+
+
+@mark.benchmark
+def test_load_replay_webhook(webhook_app, webhook_headers):
+    """ Replay one payload 10k times, the handler runs once """
+    app, utils, calls = webhook_app
+    client = app.test_client()
+    calls.clear()
+    body = dumps(dict(id=820982911946154508, line_items=[dict(id=i, quantity=1) for i in range(50)])).encode('utf-8')
+    headers = webhook_headers(utils, body, webhook_id=str(uuid4()), event_id=str(uuid4()))
+    for _ in range(10000):
+        assert client.post('/webhook/orders', data=body, headers=headers).status_code == 200
+    assert len(calls) == 1
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : test_webhook_queue.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 17:40:00
+"""
+from base64 import b64encode
+from datetime import timedelta
+from hashlib import sha256
+from hmac import new as hmac_new
+from json import dumps
+from pytest import fixture
+from sqlalchemy.dialects import postgresql
+
+
+@fixture
+def webhook_queue(initial_test_client, store_factory):
+    from flask_shopify_utils.model import Webhook
+
+    client, test, utils = initial_test_client
+    handlers = dict(utils._webhook_handlers)
+    yield utils
+    utils._webhook_handlers = handlers
+    Webhook.query.delete()
+    utils.db.commit()
+
+
+def post_webhook(client, utils, topic: str, data: dict, shop: str = 'test.myshopify.com'):
+    body = dumps(data).encode('utf-8')
+    secret = utils.config.get('SHOPIFY_API_SECRET')
+    signature = b64encode(hmac_new(secret.encode('utf-8'), body, sha256).digest()).decode('utf-8')
+    return client.post('/webhook/queue', data=body, headers={
+        'X-Shopify-Hmac-Sha256': signature,
+        'X-Shopify-Shop-Domain': shop,
+        'X-Shopify-Topic': topic,
+    })
+
+
+def test_ingest_webhook(initial_test_client, store_factory, webhook_queue):
+    from flask_shopify_utils.model import Webhook
+
+    client, test, utils = initial_test_client
+    store = store_factory()
+    res = post_webhook(client, utils, 'orders/create', dict(id=820982911946154508, name='#1001'))
+    test.assertEqual(200, res.status_code)
+    record = Webhook.query.one()
+    test.assertEqual((store.id, 820982911946154508, 'orders', 'create', 0),
+                     (record.store_id, record.webhook_id, record.target, record.action, record.status))
+    test.assertEqual('#1001', record.get_data()['name'])
+    # invalid HMAC
+    res = client.post('/webhook/queue', data=b'{}', headers={'X-Shopify-Topic': 'orders/create'})
+    test.assertEqual(401, res.status_code)
+    test.assertEqual(1, Webhook.query.count())
+
+
+def test_ingest_webhook_bypass(initial_test_client, webhook_queue, monkeypatch):
+    from flask_shopify_utils.model import Webhook
+
+    client, test, utils = initial_test_client
+    monkeypatch.setitem(utils.config, 'BYPASS_VALIDATE', 1)
+    res = client.post('/webhook/queue', data=b'{}', headers={'X-Shopify-Topic': 'orders/create'})
+    test.assertEqual(200, res.status_code)
+    test.assertEqual(0, Webhook.query.count())
+
+
+def test_process_webhooks(initial_test_client, store_factory, webhook_queue):
+    from flask_shopify_utils.model import Webhook
+
+    client, test, utils = initial_test_client
+    store_factory()
+    handled = []
+
+    @utils.webhook_handler('orders/create')
+    def order_created(webhook, data):
+        handled.append(data['id'])
+
+    @utils.webhook_handler('orders/updated')
+    def order_updated(webhook, data):
+        raise ValueError('Bad order')
+
+    for i in range(5):
+        post_webhook(client, utils, 'orders/create', dict(id=i))
+    post_webhook(client, utils, 'orders/updated', dict(id=10))
+    post_webhook(client, utils, 'products/update', dict(id=20))
+
+    test.assertEqual(3, utils.process_webhooks(batch_size=3))
+    test.assertEqual([0, 1, 2], handled)
+    result = utils.app.test_cli_runner().invoke(args=['webhook_worker', '--once', '--batch', '2'])
+    test.assertEqual(0, result.exit_code)
+    test.assertIn('4 webhook(s) processed.', result.output)
+    test.assertEqual([0, 1, 2, 3, 4], handled)
+    statuses = dict((record.webhook_id, (record.status, record.remark)) for record in Webhook.query.all())
+    test.assertEqual((Webhook.get_status('error'), 'ValueError: Bad order'), statuses[10])
+    test.assertEqual(Webhook.get_status('ignore'), statuses[20][0])
+    test.assertEqual(0, utils.process_webhooks())
+
+
+def test_claim_webhooks(initial_test_client, store_factory, webhook_queue):
+    from flask_shopify_utils.model import Webhook
+
+    client, test, utils = initial_test_client
+    for i in range(4):
+        post_webhook(client, utils, 'orders/create', dict(id=i))
+    first = [record.webhook_id for record in utils.claim_webhooks(2)]
+    second = [record.webhook_id for record in utils.claim_webhooks(5)]
+    test.assertEqual([0, 1], first)
+    test.assertEqual([2, 3], second)
+    test.assertEqual([], utils.claim_webhooks(5))
+    # a worker died, the stale records are claimed again
+    test.assertEqual(0, utils.requeue_webhooks(stale=600))
+    Webhook.query.update(dict(updated_at=utils.current_time() - timedelta(seconds=601)))
+    utils.db.commit()
+    test.assertEqual(4, utils.requeue_webhooks(stale=600))
+    test.assertEqual(4, len(utils.claim_webhooks(5)))
+
+
+def test_claim_webhooks_skip_locked(initial_test_client, store_factory, webhook_queue, monkeypatch):
+    client, test, utils = initial_test_client
+    statements = []
+    execute = utils.db.execute
+    monkeypatch.setattr(utils.db.get_bind().dialect, 'name', 'postgresql')
+    monkeypatch.setattr(utils.db, 'execute', lambda statement, *args, **kwargs: (
+        statements.append(statement), execute(statement, *args, **kwargs))[1])
+    for i in range(3):
+        post_webhook(client, utils, 'orders/create', dict(id=i))
+    test.assertEqual([0, 1], [record.webhook_id for record in utils.claim_webhooks(2)])
+    test.assertEqual([2], [record.webhook_id for record in utils.claim_webhooks(2)])
+    sql = str(statements[-1].compile(dialect=postgresql.dialect()))
+    test.assertIn('FOR UPDATE SKIP LOCKED', sql)
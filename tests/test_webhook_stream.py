@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Project : flask-shopify-utils
+# @File    : test_webhook_stream.py
+# @Author  : Leo Chen<leo.cxy88@gmail.com>
+# @Date    : 18/10/2026 19:05:00
+"""
+import tracemalloc
+from io import BytesIO
+from json import dumps
+from pytest import mark
+
+
+def large_payload(size: int) -> bytes:
+    variant = dict(id=0, title='Default Title', sku='SKU-0000000', price='19.99', inventory_quantity=10,
+                   option1='Medium', barcode='9421900000000', weight=0.5, weight_unit='kg')
+    count = size // len(dumps(variant)) + 1
+    return dumps(dict(id=1, title='Product', variants=[dict(variant, id=i) for i in range(count)])).encode('utf-8')
+
+
+def test_stream_verify(webhook_app, webhook_headers, monkeypatch):
+    app, utils, calls = webhook_app
+    monkeypatch.setitem(utils.config, 'SHOPIFY_WEBHOOK_STREAM_VERIFY', True)
+    monkeypatch.setitem(utils.config, 'SHOPIFY_WEBHOOK_CHUNK_SIZE', 1000)
+    client = app.test_client()
+    calls.clear()
+    body = large_payload(100000)
+    test_body = body[:-1] + b' }'
+    assert client.post('/webhook/products', data=body, headers=webhook_headers(utils, body)).status_code == 200
+    assert client.post('/webhook/products', data=test_body, headers=webhook_headers(utils, body)).status_code == 401
+    # chunked request, no Content-Length
+    res = client.post('/webhook/products', input_stream=BytesIO(body), headers=webhook_headers(utils, body),
+                      environ_overrides={'wsgi.input_terminated': True})
+    assert res.status_code == 200
+    assert len(calls) == 2 and calls[0] == calls[1] > 100
+
+
+def test_stream_verify_max_length(webhook_app, webhook_headers, monkeypatch):
+    app, utils, calls = webhook_app
+    monkeypatch.setitem(utils.config, 'SHOPIFY_WEBHOOK_STREAM_VERIFY', True)
+    monkeypatch.setitem(utils.config, 'SHOPIFY_WEBHOOK_MAX_LENGTH', 1000)
+    client = app.test_client()
+    body = large_payload(2000)
+    # the declared length is rejected before the body is read
+    tracemalloc.start()
+    try:
+        res = client.post('/webhook/verify', input_stream=BytesIO(b'{"id":1}'), headers=webhook_headers(utils, b'{"id":1}'),
+                          environ_overrides={'CONTENT_LENGTH': str(500 * 1024 * 1024)})
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert res.status_code == 413 and peak < 1024 * 1024
+    assert client.post('/webhook/verify', data=body, headers=webhook_headers(utils, body)).status_code == 413
+    # chunked request, no Content-Length
+    res = client.post('/webhook/verify', input_stream=BytesIO(body), headers=webhook_headers(utils, body),
+                      environ_overrides={'wsgi.input_terminated': True})
+    assert res.status_code == 413
+    small = b'{"id": 1, "variants": []}'
+    assert client.post('/webhook/products', data=small, headers=webhook_headers(utils, small)).status_code == 200
+
+
+@mark.benchmark
+def test_benchmark_stream_verify(webhook_app, webhook_headers, monkeypatch):
+    """ Peak memory per request with 5 MB payloads """
+    app, utils, calls = webhook_app
+    client = app.test_client()
+    body = large_payload(5 * 1024 * 1024)
+    headers = webhook_headers(utils, body)
+    peaks = {}
+    for url in ['/webhook/verify', '/webhook/products']:
+        for stream in [False, True]:
+            monkeypatch.setitem(utils.config, 'SHOPIFY_WEBHOOK_STREAM_VERIFY', stream)
+            client.post(url, data=body, headers=headers)
+            tracemalloc.start()
+            try:
+                assert client.post(url, data=body, headers=headers).status_code == 200
+                peaks[(url, stream)] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            finally:
+                tracemalloc.stop()
+        assert peaks[(url, True)] < peaks[(url, False)]